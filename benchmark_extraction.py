@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for document extraction (no Telegram or Gemini access needed)
+
+Generates deterministic synthetic bank statements (PDF) and ledgers (Excel), runs each
+extraction engine on them in a fresh process and records time, throughput, peak memory
+and output size as JSON lines. Pass --compare with an earlier results file to fail on
+regressions.
+
+    python benchmark_extraction.py --suite quick
+    python benchmark_extraction.py --suite full --compare benchmark_results.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import resource
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'src'))
+
+# Generated documents are kept here and reused by later runs
+DATA_DIR = os.path.join(ROOT, '.cache', 'benchmark')
+
+# Document sets: PDFs by page count, workbooks by (sheets, rows per sheet)
+SUITES = {
+    "quick": {
+        "pdf": [1, 10, 100],
+        "excel": [(1, 1000), (5, 10000)],
+    },
+    "full": {
+        "pdf": [1, 10, 100, 1000],
+        "excel": [(1, 1000), (10, 100000), (50, 2000), (1, 1000000)],
+    },
+}
+
+# Extraction functions under test and the document type each one reads
+ENGINES = {
+    "pdf_text": ("pdf", "extract_pdf"),
+    "pdf_parallel": ("pdf", "run_pdf"),
+    "excel_summary": ("excel", "extract_excel"),
+    "excel_frames": ("excel", "load_excel_frames"),
+}
+
+DESCRIPTIONS = ["Salary", "Rent", "Groceries", "Utilities", "Transfer", "Card payment",
+                "Interest", "Insurance", "Fuel", "Consulting fee", "Office supplies", "Tax"]
+CATEGORIES = ["Income", "Housing", "Food", "Bills", "Transfers", "Business"]
+
+def _transactions(rng, count, start=datetime.date(2024, 1, 1)):
+    """Yield deterministic (date, description, category, amount, balance) rows."""
+    balance = 10000.0
+    for i in range(count):
+        amount = round(rng.uniform(-2500, 3000), 2)
+        balance = round(balance + amount, 2)
+        yield (start + datetime.timedelta(days=i // 8), rng.choice(DESCRIPTIONS),
+               rng.choice(CATEGORIES), amount, balance)
+
+def make_statement_pdf(path, pages, seed=1):
+    """Write a bank statement PDF with ``pages`` pages of transactions using only the standard library."""
+    rng = random.Random(seed)
+    rows = _transactions(rng, pages * 40)
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    page_ids = [4 + 2 * i for i in range(pages)]
+    objects[2] = ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{p} 0 R" for p in page_ids), pages)).encode()
+    for number, page_id in enumerate(page_ids, 1):
+        lines = [f"Statement of Account - Page {number} of {pages}", "Date  Description  Category  Amount  Balance"]
+        for _ in range(40):
+            date, description, category, amount, balance = next(rows)
+            lines.append(f"{date.isoformat()}  {description}  {category}  {amount:,.2f}  {balance:,.2f}")
+        text = " ".join("(%s) '" % line.replace("(", "[").replace(")", "]") for line in lines)
+        stream = f"BT /F1 9 Tf 40 770 Td 14 TL {text} ET"
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        ).encode()
+        objects[page_id + 1] = f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode()
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for key in sorted(objects):
+            offsets.append(f.tell())
+            f.write(f"{key} 0 obj\n".encode() + objects[key] + b"\nendobj\n")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+        f.write(b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets))
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+def make_ledger_xlsx(path, sheets, rows, seed=1):
+    """Write a workbook of ``sheets`` ledgers with ``rows`` transactions each."""
+    import openpyxl
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    for number in range(1, sheets + 1):
+        worksheet = workbook.create_sheet(f"Account {number}")
+        worksheet.append(["Date", "Description", "Category", "Amount", "Balance"])
+        for row in _transactions(rng, rows):
+            worksheet.append(row)
+    workbook.save(path)
+
+def prepare_documents(suite):
+    """Generate (or reuse) the suite's documents and return (kind, name, path, params) tuples."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    documents = []
+    for pages in SUITES[suite]["pdf"]:
+        path = os.path.join(DATA_DIR, f"statement_{pages}p.pdf")
+        if not os.path.exists(path):
+            print(f"Generating {os.path.basename(path)}...")
+            make_statement_pdf(path, pages)
+        documents.append(("pdf", f"pdf_{pages}p", path, {"pages": pages}))
+    for sheets, rows in SUITES[suite]["excel"]:
+        path = os.path.join(DATA_DIR, f"ledger_{sheets}s_{rows}r.xlsx")
+        if not os.path.exists(path):
+            print(f"Generating {os.path.basename(path)}...")
+            make_ledger_xlsx(path, sheets, rows)
+        documents.append(("excel", f"xlsx_{sheets}s_{rows}r", path, {"sheets": sheets, "rows": rows}))
+    return documents
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Return the peak resident set size of this process (or its largest reaped child) in megabytes."""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def workers_peak_rss_mb(service):
+    """Return the summed peak RSS of an ExtractionService's worker processes in megabytes.
+
+    Workers run at the same time, so their peaks add up. Each live worker's high-water
+    mark is read from /proc; elsewhere the pool is shut down and the largest reaped
+    child, times the number of workers, is used instead.
+    """
+    processes = list((service._pool._processes or {}).values()) if service._pool else []
+    total = 0.0
+    try:
+        for process in processes:
+            with open(f"/proc/{process.pid}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+        return total
+    except (OSError, StopIteration):
+        if service._pool:
+            service._pool.shutdown(wait=True)
+        return peak_rss_mb(resource.RUSAGE_CHILDREN) * len(processes)
+
+def run_case(engine, path, source_kind):
+    """Run one engine on one document in this process and print a JSON result line."""
+    import extraction
+    service = None
+    if ENGINES[engine][1] == "run_pdf":
+        # Page ranges spread over a worker pool, as the bot runs it; pool startup is included
+        import asyncio
+        service = extraction.ExtractionService(max_workers=os.cpu_count() or 1, memory_limit_mb=0)
+        func = lambda source: asyncio.run(service.run_pdf(source))
+    else:
+        func = getattr(extraction, ENGINES[engine][1])
+    source = open(path, 'rb').read() if source_kind == "bytes" else path
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    result = func(source)
+    seconds = time.perf_counter() - start
+    # The parsing memory of pooled engines lives in the workers
+    workers_rss = workers_peak_rss_mb(service) if service else 0.0
+    if service:
+        service.shutdown()
+    if isinstance(result, str):
+        output_size = len(result)
+    elif isinstance(result, dict):
+        output_size = int(sum(df.memory_usage(index=True).sum() for df in result.values()))
+    else:
+        output_size = 0
+    print(json.dumps({
+        "seconds": seconds,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb() + workers_rss, 1),
+        "workers_rss_mb": round(workers_rss, 1),
+        "output_size": output_size,
+        "ok": result is not None,
+    }))
+
+def measure(engine, path, source_kind, repeat):
+    """Run a case ``repeat`` times, each in a fresh interpreter, and combine the results."""
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-case", engine, path, source_kind],
+            capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "failed")
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {
+        "seconds": round(statistics.median(run["seconds"] for run in runs), 4),
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "rss_growth_mb": round(max(run["peak_rss_mb"] - run["baseline_rss_mb"] for run in runs), 1),
+        "output_size": runs[-1]["output_size"],
+        "ok": all(run["ok"] for run in runs),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline_path, threshold):
+    """Print slowdowns against an earlier results file and return True if any exceed ``threshold``."""
+    previous = {}
+    with open(baseline_path) as f:
+        for line in f:
+            record = json.loads(line)
+            # The most recent run of each case wins
+            previous[(record["case"], record["engine"], record["source"])] = record
+    regressed = False
+    for record in results:
+        old = previous.get((record["case"], record["engine"], record["source"]))
+        if not old or not old["seconds"]:
+            continue
+        ratio = record["seconds"] / old["seconds"]
+        memory_ratio = record["peak_rss_mb"] / old["peak_rss_mb"] if old["peak_rss_mb"] else 1
+        if ratio > 1 + threshold or memory_ratio > 1 + threshold:
+            regressed = True
+            print(f"REGRESSION {record['case']} {record['engine']} ({record['source']}): "
+                  f"{old['seconds']:.3f}s -> {record['seconds']:.3f}s, "
+                  f"{old['peak_rss_mb']:.0f} MB -> {record['peak_rss_mb']:.0f} MB")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF and Excel extraction offline.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=sorted(ENGINES))
+    parser.add_argument("--sources", nargs="+", choices=["path", "bytes"], default=["path", "bytes"],
+                        help="hand the engine a file path (spilled upload) or the file's bytes (in-memory upload)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median time is reported")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmark_results.jsonl"),
+                        help="JSON lines file results are appended to")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown or memory growth counted as a regression")
+    parser.add_argument("--run-case", nargs=3, metavar=("ENGINE", "PATH", "SOURCE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(*args.run_case)
+        return 0
+
+    commit = git_commit()
+    started = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+    results = []
+    print(f"{'case':<22} {'engine':<14} {'source':<6} {'seconds':>9} {'MB/s':>8} {'peak MB':>8} {'output':>11}")
+    for kind, case, path, params in prepare_documents(args.suite):
+        input_bytes = os.path.getsize(path)
+        for engine in args.engines:
+            if ENGINES[engine][0] != kind:
+                continue
+            for source_kind in args.sources:
+                try:
+                    measured = measure(engine, path, source_kind, args.repeat)
+                except RuntimeError as e:
+                    print(f"{case:<22} {engine:<14} {source_kind:<6} failed: {e}")
+                    continue
+                record = {
+                    "timestamp": started,
+                    "commit": commit,
+                    "suite": args.suite,
+                    "case": case,
+                    "engine": engine,
+                    "source": source_kind,
+                    "input_bytes": input_bytes,
+                    **params,
+                    **measured,
+                    "mb_per_s": round(input_bytes / 1e6 / measured["seconds"], 2) if measured["seconds"] else None,
+                }
+                results.append(record)
+                print(f"{case:<22} {engine:<14} {source_kind:<6} {record['seconds']:>9.3f} "
+                      f"{record['mb_per_s'] or 0:>8.2f} {record['peak_rss_mb']:>8.1f} {record['output_size']:>11}")
+
+    regressed = compare(results, args.compare, args.threshold) if args.compare else False
+
+    with open(args.output, "a") as f:
+        for record in results:
+            f.write(json.dumps(record) + "\n")
+    print(f"\nWrote {len(results)} results to {args.output}")
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bot's modules are imported by name, as bot.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
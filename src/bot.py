@@ -2,22 +2,43 @@ import os
 import sys
 import logging
 import time
+import asyncio
+import hashlib
+
+# Startup phases are measured from here (see record_startup)
+STARTED_AT = time.perf_counter()
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-import google.genai as genai
-from google.genai import types
 from dotenv import load_dotenv
-import pandas as pd
-import pdfplumber
-import tempfile
+from functools import partial
 
 # Add src directory to Python path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from languages import MESSAGES
 
-# Load environment variables
+# Load environment variables before the local modules below read their settings
 load_dotenv()
 
+from languages import MESSAGES
+from llm_gateway import LLMGateway
+from extraction import ExtractionService, extract_excel, load_excel_frames
+from extraction_cache import ExtractionCache, hash_source, PDF_PAGE_CACHE
+from downloads import download_document
+from retrieval import DocumentIndex
+from excel_query import compute_facts, asks_for_facts
+from response_cache import ResponseCache
+from document_session import open_document_session
+from session_store import create_session_store, SESSION_FLUSH_INTERVAL
+from session_manager import SessionManager, estimate_size
+from webhook import run_webhook, owned_by_this_worker
+from scheduler import PerUserUpdateProcessor
+from streaming import StreamingReply, collect
+from outbound import OutboundSender
+from ingestion import BatchIngestion
+from metrics import metrics, traced, stage, record_startup, METRICS_PORT
+from router import Router
+from conversation import ConversationMemory, CONVERSATION_SUMMARY_TOKENS
+from prompt_builder import PromptBuilder, truncate_to_tokens, PROMPT_QUESTION_TOKENS
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -25,105 +46,281 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Configure the client
-client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
+def create_gemini_client():
+    """Build the Gemini client and the generation configs calls can name."""
+    # Imported here: google.genai takes most of a second to load, and the bot can
+    # already answer commands that don't need it
+    import google.genai as genai
+    from google.genai import types
 
-# Define the grounding tool
-grounding_tool = types.Tool(
-    google_search=types.GoogleSearch()
-)
+    # Configure the client
+    client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
 
-# Configure generation settings with grounding and temperature
-config = types.GenerateContentConfig(
-    tools=[grounding_tool],
-    temperature=0.3
-)
+    # Define the grounding tool
+    grounding_tool = types.Tool(
+        google_search=types.GoogleSearch()
+    )
+
+    # Configure generation settings with grounding and temperature
+    config = types.GenerateContentConfig(
+        tools=[grounding_tool],
+        temperature=0.3
+    )
+
+    # The same settings without search, for requests that don't need current information
+    plain_config = types.GenerateContentConfig(
+        temperature=0.3
+    )
+    return client, {"default": config, "grounded": config, "plain": plain_config}
+
+# Async gateway used for all Gemini calls so a slow request never blocks the event loop.
+# The client itself is built in the background after startup.
+llm = LLMGateway(create_gemini_client)
+
+# Decides per request whether search grounding is worth its latency, and which model to use
+router = Router("grounded", "plain")
+
+# Worker pool that keeps PDF/Excel parsing off the event loop
+extraction_service = ExtractionService()
+
+# On-disk cache of extracted text so repeat uploads skip download and parsing
+extraction_cache = ExtractionCache()
+
+# Recent model answers, so repeated questions are served without an API call
+response_cache = ResponseCache()
+
+# All outgoing messages, split to Telegram's size limit and paced under its flood limits
+outbound = OutboundSender()
 
 # Default language
 DEFAULT_LANGUAGE = 'en'
 
-# Store user languages and conversation history (in production, use a database)
-user_languages = {}
-user_conversations = {}
-user_document_context = {}
-user_batch_context = {}  # For handling multiple files
+# How updates are received: "polling" (single process) or "webhook" (several worker processes)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Update types Telegram should send; the bot only handles messages and commands
+ALLOWED_UPDATES = [name.strip() for name in os.getenv('ALLOWED_UPDATES', 'message').split(',') if name.strip()]
+
+# Per-user state lives in a pluggable store (in memory or SQLite, see session_store.py)
+session_store = create_session_store()
+
+# Objects derived from a user's document that only live in this process: the search
+# index, the Excel DataFrames and the model session. Rebuilt from the store when missing.
+document_runtime = {}
+
+# Expires stale documents and batches and keeps their total memory within budget
+session_manager = SessionManager(session_store)
+
+# Recent chat messages per user, with older ones summarised instead of dropped
+conversation_memory = ConversationMemory(session_store, llm)
 
 def get_user_language(user_id):
     """Get user language preference"""
-    return user_languages.get(user_id, DEFAULT_LANGUAGE)
+    return session_store.get("language", user_id, DEFAULT_LANGUAGE)
 
 def set_user_language(user_id, language):
     """Set user language preference"""
-    user_languages[user_id] = language
+    session_store.set("language", user_id, language)
 
 def get_user_conversation(user_id):
-    """Get user conversation history"""
-    if user_id not in user_conversations:
-        user_conversations[user_id] = []
-    return user_conversations[user_id]
+    """Get user conversation history (recent messages and a summary of older ones)"""
+    return conversation_memory.get(user_id)
 
 def add_to_conversation(user_id, role, message):
     """Add message to user conversation history"""
-    conversation = get_user_conversation(user_id)
-    conversation.append({"role": role, "parts": [message]})
-    # Keep only the last 10 messages to avoid context overflow
-    if len(conversation) > 10:
-        conversation.pop(0)
-
-def set_user_document_context(user_id, content, file_type):
+    # Older messages are folded into the running summary in the background
+    conversation_memory.add(user_id, role, message)
+
+# Sessions of replaced documents being closed; referenced so they are not garbage collected
+closing_sessions = set()
+
+def release_document_session(runtime):
+    """Free the model-side cache of a document that is being replaced or cleared."""
+    task = runtime.get("session")
+    if task is not None:
+        # A registration still in flight is waited for, so its cache is deleted too
+        closing = asyncio.ensure_future(close_document_session(task))
+        closing_sessions.add(closing)
+        closing.add_done_callback(closing_sessions.discard)
+
+async def close_document_session(task):
+    try:
+        session = await task
+    except (Exception, asyncio.CancelledError):
+        return
+    await session.close()
+
+def share_runtime_task(runtime, key, coroutine):
+    """Run ``coroutine`` as ``runtime[key]`` so concurrent questions share it.
+
+    A task that fails or is cancelled is forgotten, so the next question starts again.
+    """
+    task = asyncio.ensure_future(coroutine)
+    runtime[key] = task
+    task.add_done_callback(lambda _: forget_failed_task(runtime, key, task))
+    return task
+
+def forget_failed_task(runtime, key, task):
+    if runtime.get(key) is task and failed(task):
+        runtime[key] = None
+
+def failed(task) -> bool:
+    return task.done() and (task.cancelled() or task.exception() is not None)
+
+def document_size(doc_context, frames=None):
+    """Approximate bytes held for a document: its text, the index chunks and any DataFrames"""
+    size = estimate_size(doc_context) + len(doc_context["content"])
+    for df in (frames or {}).values():
+        size += int(df.memory_usage(index=True).sum())
+    return size
+
+def get_document_runtime(user_id, doc_context):
+    """Get the search index, Excel data and model session for a user's document"""
+    runtime = document_runtime.get(user_id)
+    if runtime is None or runtime["doc_hash"] != doc_context["doc_hash"]:
+        if runtime is not None:
+            release_document_session(runtime)
+        runtime = {
+            "doc_hash": doc_context["doc_hash"],
+            # Built once per document so each question only sends the relevant passages
+            "index": DocumentIndex(doc_context["content"]),
+            # Full Excel data for exact numeric answers, loaded by the first question that needs it
+            "frames": None,
+            "session": None
+        }
+        document_runtime[user_id] = runtime
+        session_manager.track("document", user_id, document_size(doc_context), doc_context["timestamp"])
+    return runtime
+
+async def get_document_frames(user_id, doc_context, runtime, question):
+    """Return the Excel DataFrames for a document if the question asks for computed facts."""
+    if not doc_context.get("frame_sources") or not asks_for_facts(question):
+        return None
+    task = runtime["frames"]
+    if task is None or failed(task):
+        # Concurrent questions share one load
+        task = share_runtime_task(runtime, "frames", load_runtime_frames(user_id, doc_context, runtime))
+    # Shielded: a question that gives up must not cancel the load for the others
+    return await asyncio.shield(task)
+
+async def load_excel_data(file_hash):
+    """Return the DataFrames of a workbook from the cache, parsing the stored upload in the pool on first use."""
+    frames = await asyncio.to_thread(extraction_cache.get_frames, file_hash)
+    if frames is None:
+        source = extraction_cache.source_path(file_hash)
+        if source is None:
+            return None
+        with stage("load_excel"):
+            frames = await extraction_service.run(load_excel_frames, source)
+        if frames:
+            await asyncio.to_thread(extraction_cache.put_frames, file_hash, frames)
+    return frames
+
+async def load_runtime_frames(user_id, doc_context, runtime):
+    frames = {}
+    for label, file_hash in doc_context["frame_sources"].items():
+        for sheet_name, df in (await load_excel_data(file_hash) or {}).items():
+            frames[f"{label} / {sheet_name}" if label else sheet_name] = df
+    frames = frames or None
+    # Account for the DataFrames unless the document was replaced while they loaded
+    if document_runtime.get(user_id) is runtime:
+        session_manager.track("document", user_id, document_size(doc_context, frames), doc_context["timestamp"])
+    return frames
+
+def clear_document_runtime(user_id):
+    """Drop the in-process objects built for a user's document"""
+    if user_id in document_runtime:
+        release_document_session(document_runtime.pop(user_id))
+
+def on_session_released(namespace, user_id):
+    """Free in-process objects when the session manager expires or evicts a document"""
+    if namespace == "document":
+        clear_document_runtime(user_id)
+
+session_manager.on_release(on_session_released)
+
+def set_user_document_context(user_id, content, file_type, frame_sources=None):
     """Set user document context"""
-    user_document_context[user_id] = {
+    clear_document_runtime(user_id)
+    doc_context = {
         "content": content,
         "file_type": file_type,
+        "doc_hash": hashlib.sha256(content.encode('utf-8')).hexdigest(),
+        # Content hashes of Excel files whose DataFrames are in the extraction cache
+        "frame_sources": frame_sources,
         "timestamp": time.time()
     }
+    session_store.set("document", user_id, doc_context)
+    with stage("index"):
+        get_document_runtime(user_id, doc_context)
 
 def get_user_document_context(user_id):
     """Get user document context"""
     # Check if context exists and is not too old (5 minutes)
-    if user_id in user_document_context:
-        context = user_document_context[user_id]
-        if time.time() - context["timestamp"] < 300:  # 5 minutes
-            return context
-    return None
+    context = session_store.get("document", user_id)
+    if context is None:
+        return None
+    if not session_manager.is_fresh("document", context):
+        session_manager.release("document", user_id)
+        return None
+    session_manager.touch(user_id)
+    return context
 
 def clear_user_document_context(user_id):
     """Clear user document context"""
-    if user_id in user_document_context:
-        del user_document_context[user_id]
+    session_manager.release("document", user_id)
 
 def initialize_batch_context(user_id):
     """Initialize batch context for multiple files"""
-    user_batch_context[user_id] = {
+    batch_context = {
         "files": [],
         "processing": False,
         "timestamp": time.time()
     }
+    session_store.set("batch", user_id, batch_context)
+    session_manager.track("batch", user_id, estimate_size(batch_context), batch_context["timestamp"])
 
-def add_to_batch_context(user_id, file_name, content, file_type):
-    """Add a processed file to batch context"""
-    if user_id not in user_batch_context:
+def add_to_batch_context(user_id, file_name, content, file_type, file_hash=None):
+    """Add a processed file to batch context and return the number of files in the batch"""
+    batch_context = session_store.get("batch", user_id)
+    if batch_context is None:
         initialize_batch_context(user_id)
+        batch_context = session_store.get("batch", user_id)
     
-    user_batch_context[user_id]["files"].append({
+    batch_context["files"].append({
         "file_name": file_name,
         "content": content,
-        "file_type": file_type
+        "file_type": file_type,
+        "file_hash": file_hash
     })
+    session_store.set("batch", user_id, batch_context)
+    session_manager.track("batch", user_id, estimate_size(batch_context), batch_context["timestamp"])
+    return len(batch_context["files"])
 
 def get_batch_context(user_id):
     """Get batch context for user"""
-    if user_id in user_batch_context:
-        context = user_batch_context[user_id]
-        # Check if batch is not too old (10 minutes for batch processing)
-        if time.time() - context["timestamp"] < 600:
-            return context
-    return None
+    context = session_store.get("batch", user_id)
+    if context is None:
+        return None
+    # Check if batch is not too old (10 minutes for batch processing)
+    if not session_manager.is_fresh("batch", context):
+        session_manager.release("batch", user_id)
+        return None
+    session_manager.touch(user_id)
+    return context
 
 def clear_batch_context(user_id):
     """Clear batch context"""
-    if user_id in user_batch_context:
-        del user_batch_context[user_id]
+    session_manager.release("batch", user_id)
+
+def commit_batch_files(user_id, files):
+    """Append ingested files to the user's batch in upload order; return the batch size, or None if the batch is gone"""
+    if get_batch_context(user_id) is None:
+        return None
+    file_count = None
+    for file_name, file_type, content, file_hash in files:
+        file_count = add_to_batch_context(user_id, file_name, content, file_type, file_hash)
+    return file_count
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /start is issued."""
@@ -141,7 +338,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
     
-    await update.message.reply_text(welcome_message, reply_markup=reply_markup)
+    await outbound.reply_text(update.message, welcome_message, reply_markup=reply_markup)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /help is issued."""
@@ -159,7 +356,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
     
-    await update.message.reply_text(help_text, reply_markup=reply_markup)
+    await outbound.reply_text(update.message, help_text, reply_markup=reply_markup)
 
 async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show the bot menu."""
@@ -176,8 +373,9 @@ async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
     
-    await update.message.reply_text("Choose a command from the menu below:", reply_markup=reply_markup)
+    await outbound.reply_text(update.message, "Choose a command from the menu below:", reply_markup=reply_markup)
 
+@traced("search_command")
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Search the web for current information."""
     try:
@@ -189,22 +387,27 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         if not query.strip():
             help_text = "Please provide a search query. Example: /search current exchange rates"
-            await update.message.reply_text(help_text)
+            await outbound.reply_text(update.message, help_text)
             return
         
         # Use grounding model to search the web
         prompt = f"{query}"
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=config,
-        )
-        
-        await update.message.reply_text(response.text)
+        reply = StreamingReply(update.message, outbound)
+        cache_key = response_cache.make_key("search", query, language)
+        response = response_cache.get(cache_key)
+        if response is None:
+            # Show the answer while it is being generated
+            with stage("llm"):
+                route = router.route("search", query)
+                response = await collect(llm.stream(prompt, model=route.model, config=route.config), reply)
+            response_cache.put(cache_key, response, route.kind)
+        
+        with stage("reply"):
+            await reply.finish(response)
     except Exception as e:
         logger.error(f"Error in search_command: {e}")
         language = get_user_language(user_id)
-        await update.message.reply_text(MESSAGES[language]['general_error'])
+        await outbound.reply_text(update.message, MESSAGES[language]['general_error'])
 
 async def english_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Switch to English language"""
@@ -213,7 +416,7 @@ async def english_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     language = get_user_language(user_id)
     message = MESSAGES[language]['language_changed']
     
-    await update.message.reply_text(message)
+    await outbound.reply_text(update.message, message)
 
 async def burmese_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Switch to Burmese language"""
@@ -222,126 +425,35 @@ async def burmese_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     language = get_user_language(user_id)
     message = MESSAGES[language]['language_changed']
     
-    await update.message.reply_text(message)
+    await outbound.reply_text(update.message, message)
 
-async def process_pdf(file_path: str) -> str:
+async def process_pdf(source, file_hash=None) -> str:
     """Process PDF file and extract text content with better structure."""
-    text_content = []
-    try:
-        with pdfplumber.open(file_path) as pdf:
-            text_content.append(f"PDF Document ({len(pdf.pages)} pages)")
-            text_content.append("=" * 30)
-            text_content.append("")
-            
-            for i, page in enumerate(pdf.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    text_content.append(f"--- Page {i+1} ---")
-                    text_content.append(page_text)
-                    text_content.append("")
-                    
-        return "\n".join(text_content)
-    except Exception as e:
-        logger.error(f"Error processing PDF: {e}")
-        return None
+    with stage("extract_pdf"):
+        # Large PDFs are split into page ranges extracted by all workers in parallel
+        page_cache = extraction_cache.pages(file_hash) if PDF_PAGE_CACHE and file_hash else None
+        return await extraction_service.run_pdf(source, page_cache=page_cache)
 
-async def process_excel(file_path: str) -> str:
+async def process_excel(source) -> str:
     """Process Excel file and extract relevant information with proper structure including multiple sheets."""
-    try:
-        # Read all sheets
-        excel_file = pd.ExcelFile(file_path)
-        sheet_names = excel_file.sheet_names
-        
-        excel_data = []
-        excel_data.append(f"Excel File Summary:")
-        excel_data.append(f"Total Sheets: {len(sheet_names)}")
-        excel_data.append("")
-        
-        # Process each sheet
-        for sheet_name in sheet_names:
-            excel_data.append(f"Sheet: {sheet_name}")
-            excel_data.append("-" * (len(sheet_name) + 7))
-            
-            # Read specific sheet
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-            
-            # Add sheet information
-            excel_data.append(f"  Rows: {len(df)}")
-            excel_data.append(f"  Columns: {len(df.columns)}")
-            excel_data.append("")
-            
-            # Add column information
-            excel_data.append("  Columns:")
-            for i, col in enumerate(df.columns):
-                excel_data.append(f"    {i+1}. {col}")
-            excel_data.append("")
-            
-            # For small datasets, include all data
-            # For larger datasets, show first 20 rows and last 5 rows to give better context
-            if len(df) > 0:
-                if len(df) <= 30:
-                    # For smaller datasets, show all data
-                    excel_data.append("  All Data:")
-                    excel_data.append("  ```")
-                    
-                    # Create a formatted table representation
-                    # Header
-                    header = " | ".join([str(col) for col in df.columns])
-                    excel_data.append(f"  {header}")
-                    excel_data.append("  " + "-" * len(header))
-                    
-                    # All data rows
-                    for index, row in df.iterrows():
-                        row_data = " | ".join([str(val) if pd.notna(val) else "" for val in row])
-                        excel_data.append(f"  {row_data}")
-                    
-                    excel_data.append("  ```")
-                else:
-                    # For larger datasets, show first 20 rows and last 5 rows
-                    excel_data.append(f"  Data (First 20 rows and last 5 rows of {len(df)} total rows):")
-                    excel_data.append("  ```")
-                    
-                    # Create a formatted table representation
-                    # Header
-                    header = " | ".join([str(col) for col in df.columns])
-                    excel_data.append(f"  {header}")
-                    excel_data.append("  " + "-" * len(header))
-                    
-                    # First 20 data rows
-                    for index, row in df.head(20).iterrows():
-                        row_data = " | ".join([str(val) if pd.notna(val) else "" for val in row])
-                        excel_data.append(f"  {row_data}")
-                    
-                    # Separator
-                    excel_data.append("  ...")
-                    excel_data.append("  (middle rows omitted for brevity)")
-                    excel_data.append("  ...")
-                    
-                    # Last 5 data rows
-                    for index, row in df.tail(5).iterrows():
-                        row_data = " | ".join([str(val) if pd.notna(val) else "" for val in row])
-                        excel_data.append(f"  {row_data}")
-                    
-                    excel_data.append("  ```")
-            else:
-                excel_data.append("  No data in this sheet")
-            
-            excel_data.append("")
-            excel_data.append("  Column Data Types:")
-            for col in df.columns:
-                excel_data.append(f"    {col}: {df[col].dtype}")
-            
-            excel_data.append("")
-            excel_data.append("=" * 50)
-            excel_data.append("")
-        
-        return "\n".join(excel_data)
-    except Exception as e:
-        logger.error(f"Error processing Excel: {e}")
-        return None
+    with stage("extract_excel"):
+        return await extraction_service.run(extract_excel, source)
+
+# Fixed instructions for general conversation
+CHAT_INSTRUCTIONS = """You are a helpful financial assistant. Please respond to the user's message appropriately.
+Keep your responses concise and helpful.
+
+IMPORTANT:
+1. Respond in {lang_name} language.
+2. Focus on financial topics when relevant
+3. Be helpful with general questions about finance, accounting, or document processing
+4. For current information, use web search to get up-to-date data"""
+
+async def chat_with_gemini(message: str, user_id: int, reply: StreamingReply = None) -> str:
+    """Chat with Gemini AI for general conversations with context tracking and web grounding.
 
-async def chat_with_gemini(message: str, user_id: int) -> str:
-    """Chat with Gemini AI for general conversations with context tracking and web grounding"""
+    When ``reply`` is given the response is streamed into it as it is generated.
+    """
     try:
         language = get_user_language(user_id)
         lang_name = "English" if language == "en" else "Burmese"
@@ -349,38 +461,38 @@ async def chat_with_gemini(message: str, user_id: int) -> str:
         # Add user message to conversation history
         add_to_conversation(user_id, "user", message)
         
-        # Get conversation history
+        # Get conversation history (the latest message is sent in its own section)
         conversation = get_user_conversation(user_id)
-        
-        # Create prompt with context
-        prompt = f"""You are a helpful financial assistant. Please respond to the user's message appropriately.
-        Keep your responses concise and helpful.
-        
-        IMPORTANT: 
-        1. Respond in {lang_name} language.
-        2. Focus on financial topics when relevant
-        3. Be helpful with general questions about finance, accounting, or document processing
-        4. For current information, use web search to get up-to-date data
-        
-Conversation history:
-{'\n'.join([f"{msg['role']}: {msg['parts'][0]}" for msg in conversation])}
-        
-User's latest message: {message}
-        
-Please provide a helpful and concise response with proper markdown formatting where appropriate."""
-        
-        # Use grounding model for general conversations to access current information
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=config,
-        )
+        recent = conversation.history()[:-1]
+        
+        # Create prompt with context, each section within its token budget
+        builder = PromptBuilder()
+        builder.add("instructions", CHAT_INSTRUCTIONS.format(lang_name=lang_name))
+        if conversation.summary:
+            builder.add("summary", f"Summary of the earlier conversation:\n{conversation.summary}", CONVERSATION_SUMMARY_TOKENS)
+        builder.add_history("history", "Conversation history:", recent)
+        builder.add("question", f"User's latest message: {message}", PROMPT_QUESTION_TOKENS)
+        builder.add("closing", "Please provide a helpful and concise response with proper markdown formatting where appropriate.")
+        prompt = builder.build()
+        history = conversation.summary + '\n' + '\n'.join(f"{role}: {text}" for role, text in recent)
+        
+        # Search grounding is only attached when the message asks for current information
+        cache_key = response_cache.make_key("chat", message, language, history)
+        response = response_cache.get(cache_key)
+        if response is None:
+            route = router.route("chat", message)
+            with stage("llm"):
+                if reply is not None:
+                    response = await collect(llm.stream(prompt, model=route.model, config=route.config), reply)
+                else:
+                    response = await llm.generate(prompt, model=route.model, config=route.config)
+            response_cache.put(cache_key, response, route.kind)
         
         # Add AI response to conversation history
-        if response.text:
-            add_to_conversation(user_id, "model", response.text)
+        if response:
+            add_to_conversation(user_id, "model", response)
         
-        return response.text
+        return response
     except Exception as e:
         logger.error(f"Error chatting with Gemini AI: {e}")
         return "Sorry, I encountered an error while processing your message."
@@ -401,26 +513,32 @@ async def batch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                      "- /batch_clear - Clear the current batch\n"
                      "- /batch_status - Check the status of your batch")
         
-        await update.message.reply_text(batch_msg)
+        await outbound.reply_text(update.message, batch_msg)
     except Exception as e:
         logger.error(f"Error in batch_command: {e}")
         language = get_user_language(user_id)
         # Use plain text for error messages
-        await update.message.reply_text(MESSAGES[language]['general_error'])
+        await outbound.reply_text(update.message, MESSAGES[language]['general_error'])
 
+@traced("batch_analyze_command")
 async def batch_analyze_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Analyze all files in the current batch."""
     try:
         user_id = update.effective_user.id
         language = get_user_language(user_id)
         
+        # Include files that are still being downloaded or extracted
+        with stage("wait_ingestion"):
+            await batch_ingestion.wait(user_id)
+        
         batch_context = get_batch_context(user_id)
         if not batch_context or len(batch_context["files"]) == 0:
-            await update.message.reply_text("❌ No files in batch. Please upload files first or use /batch to start.")
+            await outbound.reply_text(update.message, "❌ No files in batch. Please upload files first or use /batch to start.")
             return
         
         # Mark batch as processing
-        user_batch_context[user_id]["processing"] = True
+        batch_context["processing"] = True
+        session_store.set("batch", user_id, batch_context)
         
         # Create combined context for analysis
         combined_content = []
@@ -438,17 +556,25 @@ async def batch_analyze_command(update: Update, context: ContextTypes.DEFAULT_TY
         
         combined_text = "\n".join(combined_content)
         
+        # Keep the full Excel data of every file for exact numeric answers
+        frame_sources = {
+            file_info["file_name"]: file_info["file_hash"]
+            for file_info in batch_context["files"]
+            if file_info["file_type"] == "Excel" and file_info.get("file_hash")
+        }
+        
         # Store combined context for questions
-        set_user_document_context(user_id, combined_text, "Batch")
+        set_user_document_context(user_id, combined_text, "Batch", frame_sources or None)
         
         confirmation_msg = (f"✅ Batch of {len(batch_context['files'])} files processed successfully! "
                            "You can now ask me questions about all these documents together.")
-        await update.message.reply_text(confirmation_msg)
+        with stage("reply"):
+            await outbound.reply_text(update.message, confirmation_msg)
     except Exception as e:
         logger.error(f"Error in batch_analyze_command: {e}")
         language = get_user_language(user_id)
         # Use plain text for error messages
-        await update.message.reply_text(MESSAGES[language]['general_error'])
+        await outbound.reply_text(update.message, MESSAGES[language]['general_error'])
 
 async def batch_clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Clear the current batch."""
@@ -457,12 +583,12 @@ async def batch_clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         language = get_user_language(user_id)
         
         clear_batch_context(user_id)
-        await update.message.reply_text("✅ Batch cleared successfully!")
+        await outbound.reply_text(update.message, "✅ Batch cleared successfully!")
     except Exception as e:
         logger.error(f"Error in batch_clear_command: {e}")
         language = get_user_language(user_id)
         # Use plain text for error messages
-        await update.message.reply_text(MESSAGES[language]['general_error'])
+        await outbound.reply_text(update.message, MESSAGES[language]['general_error'])
 
 async def batch_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Check the status of the current batch."""
@@ -472,12 +598,16 @@ async def batch_status_command(update: Update, context: ContextTypes.DEFAULT_TYP
         
         batch_context = get_batch_context(user_id)
         if not batch_context:
-            await update.message.reply_text("❌ No active batch. Use /batch to start.")
+            await outbound.reply_text(update.message, "❌ No active batch. Use /batch to start.")
             return
         
         # Build status message
         status_msg = "📁 Batch Status\n\n"
-        status_msg += f"Files processed: {len(batch_context['files'])}\n\n"
+        status_msg += f"Files processed: {len(batch_context['files'])}\n"
+        pending = batch_ingestion.pending(user_id)
+        if pending:
+            status_msg += f"Files still processing: {pending}\n"
+        status_msg += "\n"
         
         if batch_context['files']:
             status_msg += "Files in batch:\n"
@@ -486,15 +616,42 @@ async def batch_status_command(update: Update, context: ContextTypes.DEFAULT_TYP
         
         status_msg += "\nUse /batch_analyze to analyze all files together."
         
-        await update.message.reply_text(status_msg)
+        await outbound.reply_text(update.message, status_msg)
     except Exception as e:
         logger.error(f"Error in batch_status_command: {e}")
         language = get_user_language(user_id)
         # Use plain text for error messages
-        await update.message.reply_text(MESSAGES[language]['general_error'])
+        await outbound.reply_text(update.message, MESSAGES[language]['general_error'])
 
-async def answer_document_question(question: str, user_id: int) -> str:
-    """Answer user questions about processed documents with grounding for current info."""
+# Fixed instructions for document questions, registered once per document with the model
+DOCUMENT_INSTRUCTIONS = """You are a financial document assistant. Please answer the user's question about the financial document they uploaded.
+        
+IMPORTANT: 
+1. The document content is provided in a structured format to help you understand the data. It may be limited to the passages most relevant to the question
+2. For Excel files, you'll see column names and sample data as tab-separated rows
+3. For PDF files, you'll see text organized by pages
+4. Respond in the language requested with the question
+5. Provide specific, accurate answers based on the document content
+6. If the question cannot be answered with the provided data, say so clearly
+7. If the question asks about current/recent financial data, use web search to get up-to-date information
+8. When computed facts are provided, use them for totals, counts, maxima and filtered lists instead of estimating from the sample rows"""
+
+async def get_document_session(doc_context, runtime):
+    """Return the model session for a document, registering the document on first use."""
+    task = runtime["session"]
+    if task is None or failed(task) or (task.done() and task.result().expired):
+        # Concurrent questions share one registration
+        task = share_runtime_task(runtime, "session", open_document_session(
+            llm, DOCUMENT_INSTRUCTIONS, doc_context["content"], runtime["index"]
+        ))
+    # Shielded: a question that gives up must not cancel the registration for the others
+    return await asyncio.shield(task)
+
+async def answer_document_question(question: str, user_id: int, reply: StreamingReply = None) -> str:
+    """Answer user questions about processed documents with grounding for current info.
+
+    When ``reply`` is given the answer is streamed into it as it is generated.
+    """
     try:
         language = get_user_language(user_id)
         lang_name = "English" if language == "en" else "Burmese"
@@ -504,37 +661,99 @@ async def answer_document_question(question: str, user_id: int) -> str:
         if not doc_context:
             return "Please upload a document first before asking questions about it."
         
-        prompt = f"""You are a financial document assistant. Please answer the user's question about the financial document they uploaded.
+        runtime = get_document_runtime(user_id, doc_context)
         
-User's question: {question}
+        # Totals, maxima, filters and group-bys are computed exactly from the full Excel data
+        with stage("facts"):
+            frames = await get_document_frames(user_id, doc_context, runtime, question)
+            # pandas filtering and grouping over every row takes a while on large sheets
+            facts = await asyncio.to_thread(compute_facts, frames, question) if frames else None
+        facts_section = f"""
+Computed facts (exact, from all rows of the spreadsheet data):
+{facts}
+        """ if facts else ""
         
-Document content: {doc_context['content'][:15000]}  # Increased limit for better context
+        question = truncate_to_tokens(question, PROMPT_QUESTION_TOKENS)
+        question_prompt = f"""User's question: {question}
         
 Document type: {doc_context['file_type']}
+        {facts_section}
         
-IMPORTANT: 
-1. The document content is provided in a structured format to help you understand the data
-2. For Excel files, you'll see column names and sample data in a table format
-3. For PDF files, you'll see text organized by pages
-4. Respond in {lang_name} language.
-5. Provide specific, accurate answers based on the document content
-6. If the question cannot be answered with the provided data, say so clearly
-7. If the question asks about current/recent financial data, use web search to get up-to-date information
+Respond in {lang_name} language.
         
 Please provide a focused and helpful response to the user's question."""
         
-        # Use grounding model for all document questions to access current information
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=config,
-        )
+        # Most document questions are answered from the document alone, without search
+        cache_key = response_cache.make_key("document", question, language, doc_context["doc_hash"])
+        response = response_cache.get(cache_key)
+        if response is None:
+            # Follow-up questions reuse the registered document and send only the question
+            with stage("register_document"):
+                session = await get_document_session(doc_context, runtime)
+            route = router.route("document", question)
+            with stage("llm"):
+                if reply is not None:
+                    response = await collect(session.stream(question_prompt, question, route), reply)
+                else:
+                    response = await session.ask(question_prompt, question, route)
+            response_cache.put(cache_key, response, route.kind)
             
-        return response.text
+        return response
     except Exception as e:
         logger.error(f"Error answering document question: {e}")
         return "Sorry, I encountered an error while processing your question."
 
+def load_cached_document(document):
+    """Return (content, file_hash) for a previously processed upload, or (None, None)."""
+    file_hash = extraction_cache.key_for(document.file_unique_id)
+    if not file_hash:
+        return None, None
+    # A miss is counted once, by the content-hash lookup after the download
+    return extraction_cache.get(file_hash, count_miss=False), file_hash
+
+async def fetch_document(document, file_type):
+    """Return (content, file_hash) for an upload, from the cache or by downloading and extracting it."""
+    content, file_hash = load_cached_document(document)
+    if content is None:
+        content, file_hash = await download_and_extract(document, file_type)
+    return content, file_hash
+
+async def download_and_extract(document, file_type):
+    """Download a Telegram document and extract (content, file_hash), reusing cached results by content hash."""
+    # Typical uploads stay in memory; large ones go to a spill file that is always removed
+    async with download_document(document) as source:
+        # Identical content uploaded under a different file id is still a cache hit
+        # Hashing a large spill file would block the event loop
+        file_hash = await asyncio.to_thread(hash_source, source)
+        content = extraction_cache.get(file_hash)
+        if content is not None:
+            extraction_cache.link(document.file_unique_id, file_hash)
+        else:
+            # Process based on file type
+            if file_type == "PDF":
+                content = await process_pdf(source, file_hash)
+            else:
+                content = await process_excel(source)
+            if content:
+                extraction_cache.put(file_hash, content, document.file_unique_id)
+        if content and file_type == "Excel" and extraction_cache.source_path(file_hash) is None:
+            # Kept so the DataFrames can be loaded once a question asks for exact figures
+            await asyncio.to_thread(extraction_cache.put_source, file_hash, source)
+    
+    return content, file_hash
+
+# Downloads and extracts batch uploads concurrently
+batch_ingestion = BatchIngestion(fetch_document, commit_batch_files, outbound)
+
+async def notify_busy(update: Update):
+    """Tell a user that a message was dropped because they have too many waiting."""
+    language = get_user_language(update.effective_user.id)
+    await outbound.reply_text(update.message, MESSAGES[language]['busy'], parse_mode='Markdown')
+
+# Schedules updates: users in parallel, each user's updates in order
+update_processor = PerUserUpdateProcessor(on_shed=notify_busy)
+
+@traced("handle_document")
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle incoming documents."""
     try:
@@ -545,56 +764,49 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         batch_context = get_batch_context(user_id)
         
         # Get file details
-        file = await update.message.document.get_file()
-        file_name = update.message.document.file_name.lower()
+        document = update.message.document
+        file_name = document.file_name.lower()
+        
+        # Check the file type before downloading anything
+        if file_name.endswith('.pdf'):
+            file_type = "PDF"
+        elif file_name.endswith(('.xls', '.xlsx')):
+            file_type = "Excel"
+        else:
+            await outbound.reply_text(update.message, MESSAGES[language]['unsupported_format'], parse_mode='Markdown')
+            return
         
-        # Send acknowledgment
-        if not batch_context or not batch_context.get("processing", False):
-            await update.message.reply_text(MESSAGES[language]['processing'])
+        # Batch files are processed concurrently in the background with one progress message per album
+        if batch_context:
+            await batch_ingestion.add(user_id, update.message, document, file_name, file_type)
+            return
         
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            await file.download_to_drive(temp_file.name)
+        # Repeat uploads are served from the cache without downloading the file
+        content, file_hash = load_cached_document(document)
+        if content is None:
+            # Send acknowledgment
+            await outbound.reply_text(update.message, MESSAGES[language]['processing'])
             
-            # Process based on file type
-            if file_name.endswith('.pdf'):
-                content = await process_pdf(temp_file.name)
-                file_type = "PDF"
-            elif file_name.endswith(('.xls', '.xlsx')):
-                content = await process_excel(temp_file.name)
-                file_type = "Excel"
-            else:
-                await update.message.reply_text(MESSAGES[language]['unsupported_format'], parse_mode='Markdown')
-                return
+            content, file_hash = await download_and_extract(document, file_type)
+        
+        if content:
+            # Single file processing
+            set_user_document_context(user_id, content, file_type, {"": file_hash} if file_type == "Excel" else None)
             
-            # Remove temporary file
-            os.unlink(temp_file.name)
+            # Send confirmation that document is ready for questions
+            confirmation_msg = f"✅ {file_type} file processed successfully! You can now ask me questions about this document."
+            with stage("reply"):
+                await outbound.reply_text(update.message, confirmation_msg)
+        else:
+            await outbound.reply_text(update.message, MESSAGES[language]['processing_error'])
             
-            if content:
-                # Add to batch context if processing multiple files
-                if batch_context:
-                    add_to_batch_context(user_id, file_name, content, file_type)
-                    # Check if user wants to analyze the batch
-                    if batch_context.get("processing", False):
-                        # User has indicated they want to analyze the batch
-                        batch_info = f"✅ Added {file_type} file: {file_name} to batch. {len(batch_context['files'])} files processed so far."
-                        await update.message.reply_text(batch_info)
-                else:
-                    # Single file processing
-                    set_user_document_context(user_id, content, file_type)
-                    
-                    # Send confirmation that document is ready for questions
-                    confirmation_msg = f"✅ {file_type} file processed successfully! You can now ask me questions about this document."
-                    await update.message.reply_text(confirmation_msg)
-            else:
-                await update.message.reply_text(MESSAGES[language]['processing_error'])
-                
     except Exception as e:
         logger.error(f"Error handling document: {e}")
         user_id = update.effective_user.id
         language = get_user_language(user_id)
-        await update.message.reply_text(MESSAGES[language]['general_error'])
+        await outbound.reply_text(update.message, MESSAGES[language]['general_error'])
 
+@traced("handle_message")
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages."""
     user_id = update.effective_user.id
@@ -602,31 +814,91 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_message = update.message.text
     
     if user_message.lower() in ['hi', 'hello', 'hey']:
-        await update.message.reply_text(MESSAGES[language]['greeting'])
+        await outbound.reply_text(update.message, MESSAGES[language]['greeting'])
     else:
         # Check if user has a document context to ask questions about
         doc_context = get_user_document_context(user_id)
+        # The answer appears as soon as the model starts producing it
+        reply = StreamingReply(update.message, outbound)
         if doc_context:
             # User is asking a question about their document
-            response = await answer_document_question(user_message, user_id)
-            try:
-                await update.message.reply_text(response)
-            except:
-                # If markdown fails, send as plain text
-                await update.message.reply_text(response)
+            response = await answer_document_question(user_message, user_id, reply)
         else:
             # General chat when no document is processed
-            response = await chat_with_gemini(user_message, user_id)
-            try:
-                await update.message.reply_text(response)
-            except:
-                # If markdown fails, send as plain text
-                await update.message.reply_text(response)
-
-def main():
-    """Start the bot."""
+            response = await chat_with_gemini(user_message, user_id, reply)
+        with stage("reply"):
+            await reply.finish(response)
+
+async def flush_sessions_periodically():
+    """Write buffered session changes to the store at a steady interval."""
+    while True:
+        await asyncio.sleep(SESSION_FLUSH_INTERVAL)
+        session_store.flush()
+
+def register_metrics():
+    """Expose cache counters and queue depths on the metrics endpoint."""
+    metrics.register_callback("response_cache_hits_total", lambda: response_cache.hits, "Answers served from the response cache", "counter")
+    metrics.register_callback("response_cache_misses_total", lambda: response_cache.misses, "Answers not found in the response cache", "counter")
+    metrics.register_callback("extraction_cache_hits_total", lambda: extraction_cache.stats()["hits"], "Uploads served from the extraction cache", "counter")
+    metrics.register_callback("extraction_cache_misses_total", lambda: extraction_cache.stats()["misses"], "Uploads that had to be extracted", "counter")
+    metrics.register_callback("llm_requests_in_flight", lambda: llm.in_flight, "Gemini calls currently running")
+    metrics.register_callback("llm_requests_coalesced_total", lambda: llm.coalesced, "Gemini requests that shared an identical call already in flight", "counter")
+    metrics.register_callback("update_queue_depth", lambda: update_processor.stats()["updates_queued"], "Updates waiting or running in per-user queues")
+    metrics.register_callback("updates_shed_total", lambda: update_processor.shed, "Queued text messages dropped under load", "counter")
+    metrics.register_callback("batch_files_pending", lambda: batch_ingestion.pending(), "Batch files still being downloaded or extracted")
+    metrics.register_callback("session_memory_bytes", lambda: session_manager.usage()["bytes"], "Approximate memory held by documents and batches")
+    metrics.register_callback("outbound_queue_depth", outbound.queued, "Outgoing messages waiting for a send slot")
+    metrics.register_callback("outbound_retries_total", lambda: outbound.retried, "Sends re-queued after a Telegram retry-after response", "counter")
+    metrics.register_callback("conversation_summaries_total", lambda: conversation_memory.summaries, "Conversation summaries updated", "counter")
+    metrics.register_callback("session_users", lambda: session_manager.usage()["users"], "Users with a document or batch in memory")
+
+async def warm_up_llm():
+    """Build the Gemini client in the background so the first question does not wait for it."""
+    try:
+        await llm.ready()
+        record_startup("llm_ready", STARTED_AT)
+    except Exception as e:
+        logger.error(f"Could not set up the Gemini client, retrying on first use: {e}")
+
+async def post_init(application: Application):
+    """Start background tasks once the bot is running."""
+    # Webhook workers each serve metrics on their own port
+    register_metrics()
+    port = METRICS_PORT + int(os.getenv('BOT_WORKER_INDEX', '0')) if METRICS_PORT else 0
+    application.bot_data["metrics_server"] = await metrics.serve(port)
+    # Documents and batches persisted by an earlier run count towards the budget too;
+    # a webhook worker only tracks the users routed to it
+    session_manager.load_existing(owns=owned_by_this_worker)
+    application.bot_data["background_tasks"] = [
+        asyncio.create_task(flush_sessions_periodically()),
+        asyncio.create_task(session_manager.run()),
+        asyncio.create_task(warm_up_llm()),
+    ]
+    record_startup("ready", STARTED_AT)
+
+async def post_shutdown(application: Application):
+    """Release background resources when the bot stops."""
+    for task in application.bot_data.get("background_tasks", []):
+        task.cancel()
+    if application.bot_data.get("metrics_server"):
+        await application.bot_data["metrics_server"].stop()
+    await outbound.stop()
+    await conversation_memory.stop()
+    extraction_service.shutdown()
+    response_cache.close()
+    session_store.close()
+
+def build_application(with_updater=True):
+    """Create the bot application with all handlers registered."""
+    record_startup("imported", STARTED_AT)
     # Create application and pass bot token
-    application = Application.builder().token(os.getenv('TELEGRAM_BOT_TOKEN')).build()
+    builder = Application.builder().token(os.getenv('TELEGRAM_BOT_TOKEN')).post_init(post_init).post_shutdown(post_shutdown)
+    # Different users are served in parallel; each user's updates still run one at a time, in order
+    builder = builder.concurrent_updates(update_processor)
+    if not with_updater:
+        # Webhook workers are fed updates by the front process
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
@@ -641,9 +913,16 @@ def main():
     application.add_handler(CommandHandler("menu", menu_command))
     application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
+def main():
+    """Start the bot."""
+    if BOT_MODE == 'webhook':
+        run_webhook(partial(build_application, with_updater=False), os.getenv('TELEGRAM_BOT_TOKEN'), ALLOWED_UPDATES)
+        return
 
     # Start the bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    build_application().run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,139 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from prompt_builder import truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Messages kept word for word; older ones are folded into the running summary
+CONVERSATION_MAX_TURNS = int(os.getenv('CONVERSATION_MAX_TURNS', '6'))
+
+# Evicted messages are summarised in batches of this many, in the background
+CONVERSATION_SUMMARY_BATCH = int(os.getenv('CONVERSATION_SUMMARY_BATCH', '4'))
+
+# Token budgets for the running summary and for each message quoted in a prompt
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv('CONVERSATION_SUMMARY_TOKENS', '300'))
+CONVERSATION_TURN_TOKENS = int(os.getenv('CONVERSATION_TURN_TOKENS', '400'))
+
+# Model used to update summaries
+CONVERSATION_SUMMARY_MODEL = os.getenv('CONVERSATION_SUMMARY_MODEL', 'gemini-2.5-flash-lite')
+
+# Evicted messages kept waiting when summarising keeps failing; older ones are dropped
+MAX_UNSUMMARISED = CONVERSATION_SUMMARY_BATCH * 4
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and a financial assistant.
+Keep names, figures, documents, decisions and open questions; drop greetings and small talk.
+Write it in the language of the conversation, in at most {words} words, as plain text.
+
+Current summary:
+{summary}
+
+Messages to add:
+{messages}
+
+Updated summary:"""
+
+class Conversation:
+    """Recent messages of one user, plus a summary of everything before them."""
+
+    __slots__ = ("turns", "evicted", "summary")
+
+    def __init__(self, turns=(), evicted=(), summary="", max_turns=CONVERSATION_MAX_TURNS):
+        self.turns = deque((tuple(turn) for turn in turns), maxlen=max_turns)
+        # Messages pushed out of ``turns`` that are not in the summary yet
+        self.evicted = [tuple(turn) for turn in evicted]
+        self.summary = summary
+
+    def add(self, role: str, text: str):
+        if len(self.turns) == self.turns.maxlen:
+            self.evicted.append(self.turns[0])
+            del self.evicted[:-MAX_UNSUMMARISED]
+        self.turns.append((role, text))
+
+    def history(self, turn_tokens: int = CONVERSATION_TURN_TOKENS) -> list:
+        """Return the (role, text) messages not yet covered by the summary, oldest first.
+
+        Long messages (usually model answers) are cut to ``turn_tokens`` tokens.
+        """
+        return [(role, truncate_to_tokens(text, turn_tokens)) for role, text in [*self.evicted, *self.turns]]
+
+    def to_dict(self) -> dict:
+        return {"turns": list(self.turns), "evicted": self.evicted, "summary": self.summary}
+
+    @classmethod
+    def from_value(cls, value, max_turns=CONVERSATION_MAX_TURNS):
+        """Load a stored conversation, including the plain message lists stored by older versions."""
+        if not value:
+            return cls(max_turns=max_turns)
+        if isinstance(value, list):
+            messages = [(message["role"], message["parts"][0]) for message in value]
+            return cls(messages[-max_turns:], messages[:-max_turns], max_turns=max_turns)
+        return cls(value["turns"], value["evicted"], value["summary"], max_turns)
+
+class ConversationMemory:
+    """Per-user conversations kept in the session store with a rolling summary.
+
+    Messages that fall out of the recent window are folded into the summary by the LLM
+    in batches, in background tasks, so replies never wait for it and prompts stay the
+    same size however long the conversation runs. Until a batch is summarised its
+    messages are still returned by ``history``.
+    """
+
+    def __init__(self, store, llm, max_turns=CONVERSATION_MAX_TURNS, batch=CONVERSATION_SUMMARY_BATCH,
+                 model=CONVERSATION_SUMMARY_MODEL):
+        self.store = store
+        self.llm = llm
+        self.max_turns = max_turns
+        self.batch = batch
+        self.model = model
+        self.summaries = 0
+        self._refreshing = {}
+
+    def get(self, user_id) -> Conversation:
+        return Conversation.from_value(self.store.get("conversation", user_id), self.max_turns)
+
+    def add(self, user_id, role: str, text: str):
+        """Record a message and start summarising once a batch of messages has been evicted."""
+        conversation = self.get(user_id)
+        conversation.add(role, text)
+        self.store.set("conversation", user_id, conversation.to_dict())
+        if len(conversation.evicted) >= self.batch and user_id not in self._refreshing:
+            self._refreshing[user_id] = asyncio.create_task(self._refresh(user_id))
+
+    def pending(self) -> int:
+        """Return how many summaries are being updated."""
+        return len(self._refreshing)
+
+    async def _refresh(self, user_id):
+        try:
+            conversation = self.get(user_id)
+            folded = conversation.evicted[:]
+            messages = '\n'.join(f"{role}: {truncate_to_tokens(text, CONVERSATION_TURN_TOKENS)}" for role, text in folded)
+            prompt = SUMMARY_PROMPT.format(
+                words=CONVERSATION_SUMMARY_TOKENS // 2,
+                summary=conversation.summary or "(none yet)",
+                messages=messages,
+            )
+            summary = await self.llm.generate(prompt, model=self.model, config="plain")
+            # The conversation may have grown (or been cleared) while the summary was written
+            value = self.store.get("conversation", user_id)
+            if not value or not summary:
+                return
+            conversation = Conversation.from_value(value, self.max_turns)
+            conversation.evicted = [turn for turn in conversation.evicted if turn not in folded]
+            conversation.summary = truncate_to_tokens(summary.strip(), CONVERSATION_SUMMARY_TOKENS)
+            self.store.set("conversation", user_id, conversation.to_dict())
+            self.summaries += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Could not update conversation summary for user {user_id}: {e}")
+        finally:
+            if self._refreshing.get(user_id) is asyncio.current_task():
+                del self._refreshing[user_id]
+
+    async def stop(self):
+        for task in list(self._refreshing.values()):
+            task.cancel()
+        self._refreshing.clear()
@@ -0,0 +1,139 @@
+import os
+import time
+import logging
+from abc import ABC, abstractmethod
+from llm_gateway import DEFAULT_MODEL
+from prompt_builder import PromptBuilder
+
+logger = logging.getLogger(__name__)
+
+# Use Gemini context caching for uploaded documents
+DOCUMENT_CACHE_ENABLED = os.getenv('DOCUMENT_CACHE_ENABLED', 'true').lower() == 'true'
+
+# Documents shorter than this are cheaper to send inline than to cache
+# (Gemini also rejects caches below a minimum token count)
+DOCUMENT_CACHE_MIN_CHARS = int(os.getenv('DOCUMENT_CACHE_MIN_CHARS', '8000'))
+
+# Lifetime of a document's context cache in seconds
+DOCUMENT_CACHE_TTL = int(os.getenv('DOCUMENT_CACHE_TTL', '600'))
+
+class DocumentSession(ABC):
+    """A document registered with the model once and then asked many questions."""
+
+    def __init__(self, llm, system_instruction):
+        self.llm = llm
+        self.system_instruction = system_instruction
+
+    @property
+    def expired(self):
+        return False
+
+    @abstractmethod
+    async def ask(self, question_prompt: str, question: str, route=None) -> str:
+        """Answer one question about the document and return the response text.
+
+        ``route`` (from the Router) picks the model and whether search grounding is used.
+        """
+
+    @abstractmethod
+    def stream(self, question_prompt: str, question: str, route=None):
+        """Answer one question, yielding the response text in chunks as it is generated."""
+
+    async def close(self):
+        """Release any resources held for the document."""
+
+class InlineDocumentSession(DocumentSession):
+    """Sends the instructions and the passages relevant to each question with every call.
+
+    Used for small documents, and whenever context caching is unavailable.
+    """
+
+    def __init__(self, llm, system_instruction, index):
+        super().__init__(llm, system_instruction)
+        self.index = index
+
+    def _prompt(self, question_prompt, question):
+        builder = PromptBuilder()
+        builder.add("instructions", self.system_instruction)
+        builder.add("document", f"Document content: {self.index.context_for(question)}")
+        builder.add("question", question_prompt)
+        return builder.build()
+
+    async def ask(self, question_prompt: str, question: str, route=None) -> str:
+        if route is None:
+            return await self.llm.generate(self._prompt(question_prompt, question))
+        return await self.llm.generate(self._prompt(question_prompt, question), model=route.model, config=route.config)
+
+    def stream(self, question_prompt: str, question: str, route=None):
+        if route is None:
+            return self.llm.stream(self._prompt(question_prompt, question))
+        return self.llm.stream(self._prompt(question_prompt, question), model=route.model, config=route.config)
+
+class CachedDocumentSession(DocumentSession):
+    """Keeps the document and instructions in Gemini's context cache; later calls send only the question.
+
+    The cache is created without search grounding. Tools cannot be added per request when
+    a cache is used, so questions routed to grounding (or to another model) are sent
+    inline instead.
+    """
+
+    def __init__(self, llm, system_instruction, cache_name, model, expires_at, index):
+        super().__init__(llm, system_instruction)
+        self.cache_name = cache_name
+        self.model = model
+        self.expires_at = expires_at
+        self.inline = InlineDocumentSession(llm, system_instruction, index)
+
+    @classmethod
+    async def create(cls, llm, system_instruction, content, index, model=DEFAULT_MODEL, ttl=DOCUMENT_CACHE_TTL):
+        """Register the document with the context cache."""
+        from google.genai import types
+        cache = await llm.create_cache(
+            model=model,
+            contents=[f"Document content:\n{content}"],
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                ttl=f"{ttl}s",
+            ),
+        )
+        # Stop using the cache a little early so a question never races its expiry
+        return cls(llm, system_instruction, cache.name, model, time.time() + ttl - 30, index)
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    def _config(self):
+        from google.genai import types
+        return types.GenerateContentConfig(
+            cached_content=self.cache_name,
+            temperature=self.llm.config.temperature,
+        )
+
+    def _uses_cache(self, route):
+        return route is None or (not route.grounded and route.model == self.model)
+
+    async def ask(self, question_prompt: str, question: str, route=None) -> str:
+        if not self._uses_cache(route):
+            return await self.inline.ask(question_prompt, question, route)
+        return await self.llm.generate(question_prompt, model=self.model, config=self._config())
+
+    def stream(self, question_prompt: str, question: str, route=None):
+        if not self._uses_cache(route):
+            return self.inline.stream(question_prompt, question, route)
+        return self.llm.stream(question_prompt, model=self.model, config=self._config())
+
+    async def close(self):
+        try:
+            await self.llm.delete_cache(self.cache_name)
+        except Exception as e:
+            logger.warning(f"Could not delete document cache {self.cache_name}: {e}")
+
+async def open_document_session(llm, system_instruction, content, index) -> DocumentSession:
+    """Register a document for questioning, caching it with Gemini when that pays off."""
+    if DOCUMENT_CACHE_ENABLED and len(content) >= DOCUMENT_CACHE_MIN_CHARS:
+        try:
+            return await CachedDocumentSession.create(llm, system_instruction, content, index)
+        except Exception as e:
+            logger.warning(f"Context caching unavailable, sending document inline: {e}")
+    return InlineDocumentSession(llm, system_instruction, index)
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import logging
+from contextlib import asynccontextmanager
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Uploads up to this size are downloaded into memory; larger ones are spilled to a
+# temporary file that the parsers memory-map
+DOWNLOAD_SPILL_MB = float(os.getenv('DOWNLOAD_SPILL_MB', '10'))
+
+@asynccontextmanager
+async def download_document(document, spill_bytes=int(DOWNLOAD_SPILL_MB * 1024 * 1024)):
+    """Download a Telegram document and yield its bytes, or the path of a spill file for large uploads.
+
+    The spill file is always removed on exit, whether or not processing succeeded.
+    """
+    path = None
+    try:
+        with stage("download"):
+            file = await document.get_file()
+            if (document.file_size or 0) <= spill_bytes:
+                source = bytes(await file.download_as_bytearray())
+            else:
+                fd, path = tempfile.mkstemp(prefix="upload-")
+                os.close(fd)
+                await file.download_to_drive(path)
+                source = path
+        yield source
+    finally:
+        if path is not None:
+            try:
+                os.unlink(path)
+            except OSError as e:
+                logger.warning(f"Could not remove spill file {path}: {e}")
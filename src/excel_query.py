@@ -0,0 +1,204 @@
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# pandas is imported where DataFrames are handled: frames only exist once a spreadsheet
+# has been loaded, so the bot does not pay for the import at startup
+
+# Upper bound on the number of rows listed for filters and top-N questions
+MAX_LISTED_ROWS = 10
+
+# Upper bound on numeric columns reported when the question names none
+MAX_DEFAULT_COLUMNS = 4
+
+# Column names that mark transaction amounts, preferred when the question names no column
+AMOUNT_HINTS = ('amount', 'value', 'price', 'cost', 'debit', 'credit', 'paid', 'payment', 'sales', 'revenue', 'expense')
+
+# Column names that mark running totals, which filters and sums over rows make no sense for
+RUNNING_TOTAL_HINTS = ('balance', 'cumulative', 'running')
+
+# Question keywords (English and Burmese) for each supported aggregate
+SUM_WORDS = ('total', 'sum', 'overall', 'စုစုပေါင်း')
+MAX_WORDS = ('highest', 'largest', 'biggest', 'maximum', 'max', 'အမြင့်ဆုံး', 'အများဆုံး')
+MIN_WORDS = ('lowest', 'smallest', 'minimum', 'min', 'least', 'အနိမ့်ဆုံး', 'အနည်းဆုံး')
+MEAN_WORDS = ('average', 'mean', 'ပျမ်းမျှ')
+COUNT_WORDS = ('how many', 'count', 'number of', 'ဘယ်နှစ်')
+
+ABOVE_PATTERN = re.compile(
+    r'(over|above|more than|greater than|exceeding|at least|>=?)\s*\$?\s*([\d,]+(?:\.\d+)?)\s*([km])?\b'
+)
+BELOW_PATTERN = re.compile(
+    r'(under|below|less than|smaller than|at most|<=?)\s*\$?\s*([\d,]+(?:\.\d+)?)\s*([km])?\b'
+)
+# Comparisons in ABOVE_PATTERN / BELOW_PATTERN that include the threshold itself
+INCLUSIVE_COMPARISONS = ('at least', 'at most', '>=', '<=')
+
+TOP_PATTERN = re.compile(r'\b(?:top|largest|biggest|highest)\s+(\d+)\b')
+GROUP_PATTERN = re.compile(r'\b(?:by|per|each|for every)\s+([\w ]+?)(?:\?|$|,|\band\b)')
+
+def _asks(question, words):
+    """Return True if the question contains any of the keywords."""
+    for word in words:
+        if word.isascii():
+            if re.search(r'\b' + re.escape(word) + r'\b', question):
+                return True
+        elif word in question:
+            return True
+    return False
+
+def _parse_amount(number, suffix):
+    value = float(number.replace(',', ''))
+    if suffix == 'k':
+        value *= 1_000
+    elif suffix == 'm':
+        value *= 1_000_000
+    return value
+
+def _mentioned_columns(columns, question):
+    """Return the columns whose names appear in the question."""
+    mentioned = []
+    for column in columns:
+        name = str(column).lower().strip()
+        if name and re.search(r'(?<!\w)' + re.escape(name) + r's?(?!\w)', question):
+            mentioned.append(column)
+    return mentioned
+
+def _default_targets(numeric_columns):
+    """Pick the columns to report on when the question names none: amounts, not running balances."""
+    def named(column, hints):
+        return any(hint in str(column).lower() for hint in hints)
+
+    candidates = [column for column in numeric_columns if not named(column, RUNNING_TOTAL_HINTS)] or numeric_columns
+    amounts = [column for column in candidates if named(column, AMOUNT_HINTS)]
+    return (amounts or candidates)[:MAX_DEFAULT_COLUMNS]
+
+def _format_number(value):
+    import pandas as pd
+    if pd.isna(value):
+        return "n/a"
+    if float(value).is_integer():
+        return f"{int(value):,}"
+    return f"{value:,.2f}"
+
+def _format_row(row):
+    """Render a row as compact key=value pairs."""
+    import pandas as pd
+    return "; ".join(f"{column}={value}" for column, value in row.items() if not pd.isna(value))
+
+def _group_column(df, question, numeric_columns):
+    """Pick the column a "by X" / "per X" / category question groups on."""
+    candidates = [column for column in df.columns if column not in numeric_columns]
+    match = GROUP_PATTERN.search(question)
+    if match:
+        for column in _mentioned_columns(candidates, match.group(1)):
+            return column
+    if 'categor' in question or 'type' in question:
+        for column in candidates:
+            if str(column).lower().startswith(('categ', 'type')):
+                return column
+    return None
+
+def _sheet_facts(name, df, question):
+    """Compute the facts one sheet can contribute to the answer."""
+    import pandas as pd
+    numeric_columns = [column for column in df.columns if pd.api.types.is_numeric_dtype(df[column])
+                       and not pd.api.types.is_bool_dtype(df[column])]
+    if df.empty or not numeric_columns:
+        return []
+
+    targets = _mentioned_columns(numeric_columns, question)
+    if not targets:
+        targets = _default_targets(numeric_columns)
+
+    facts = []
+    prefix = f"[{name}]"
+
+    above = ABOVE_PATTERN.search(question)
+    below = BELOW_PATTERN.search(question)
+    if above or below:
+        for column in targets:
+            mask = pd.Series(True, index=df.index)
+            conditions = []
+            if above:
+                comparison, number, suffix = above.groups()
+                threshold = _parse_amount(number, suffix)
+                if comparison in INCLUSIVE_COMPARISONS:
+                    mask &= df[column] >= threshold
+                    conditions.append(f">= {_format_number(threshold)}")
+                else:
+                    mask &= df[column] > threshold
+                    conditions.append(f"> {_format_number(threshold)}")
+            if below:
+                comparison, number, suffix = below.groups()
+                threshold = _parse_amount(number, suffix)
+                if comparison in INCLUSIVE_COMPARISONS:
+                    mask &= df[column] <= threshold
+                    conditions.append(f"<= {_format_number(threshold)}")
+                else:
+                    mask &= df[column] < threshold
+                    conditions.append(f"< {_format_number(threshold)}")
+            matched = df[mask]
+            facts.append(f"{prefix} rows where {column} {' and '.join(conditions)}: {len(matched)}, "
+                         f"sum {_format_number(matched[column].sum())}")
+            for _, row in matched.nlargest(MAX_LISTED_ROWS, column).iterrows():
+                facts.append(f"  - {_format_row(row)}")
+            if len(matched) > MAX_LISTED_ROWS:
+                facts.append(f"  ... {len(matched) - MAX_LISTED_ROWS} more rows")
+
+    top = TOP_PATTERN.search(question)
+    if top:
+        count = min(int(top.group(1)), MAX_LISTED_ROWS)
+        for column in targets:
+            facts.append(f"{prefix} top {count} rows by {column}:")
+            for _, row in df.nlargest(count, column).iterrows():
+                facts.append(f"  - {_format_row(row)}")
+
+    group_column = _group_column(df, question, numeric_columns)
+    if group_column is not None:
+        for column in targets:
+            grouped = df.groupby(group_column, observed=True)[column].sum().sort_values(ascending=False)
+            facts.append(f"{prefix} {column} total by {group_column} ({len(grouped)} groups):")
+            for key, value in grouped.head(MAX_LISTED_ROWS * 2).items():
+                facts.append(f"  - {key}: {_format_number(value)}")
+
+    for column in targets:
+        series = df[column]
+        if _asks(question, SUM_WORDS):
+            facts.append(f"{prefix} total {column}: {_format_number(series.sum())} over {series.count()} rows")
+        if _asks(question, MEAN_WORDS):
+            facts.append(f"{prefix} average {column}: {_format_number(series.mean())}")
+        if _asks(question, MAX_WORDS) and series.notna().any():
+            facts.append(f"{prefix} highest {column}: {_format_number(series.max())} ({_format_row(df.loc[series.idxmax()])})")
+        if _asks(question, MIN_WORDS) and series.notna().any():
+            facts.append(f"{prefix} lowest {column}: {_format_number(series.min())} ({_format_row(df.loc[series.idxmin()])})")
+
+    if facts or _asks(question, COUNT_WORDS):
+        facts.insert(0, f"{prefix} {len(df)} rows")
+    return facts
+
+def asks_for_facts(question: str) -> bool:
+    """Return True if ``compute_facts`` could contribute to the answer, without loading any data."""
+    question = question.lower()
+    if any(pattern.search(question) for pattern in (ABOVE_PATTERN, BELOW_PATTERN, TOP_PATTERN, GROUP_PATTERN)):
+        return True
+    if 'categor' in question or 'type' in question:
+        return True
+    return any(_asks(question, words) for words in (SUM_WORDS, MAX_WORDS, MIN_WORDS, MEAN_WORDS, COUNT_WORDS))
+
+def compute_facts(frames: dict, question: str) -> str:
+    """Answer the numeric parts of a question exactly from the full Excel data.
+
+    Returns compact fact lines for the model to use, or None when the question does
+    not ask for anything that can be computed locally.
+    """
+    if not frames:
+        return None
+    question = question.lower()
+    facts = []
+    for name, df in frames.items():
+        try:
+            facts.extend(_sheet_facts(name, df, question))
+        except Exception as e:
+            logger.warning(f"Could not compute facts for sheet {name}: {e}")
+    return "\n".join(facts) if facts else None
@@ -0,0 +1,692 @@
+import io
+import os
+import math
+import mmap
+import signal
+import multiprocessing
+import asyncio
+import logging
+import numbers
+import datetime
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# pandas, pdfplumber and openpyxl are imported inside the functions that parse documents:
+# they take most of a second to load, and only the worker processes need them
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes used for document parsing
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', '2'))
+
+# Seconds a single document may spend in a worker before it is abandoned
+EXTRACTION_TIMEOUT = float(os.getenv('EXTRACTION_TIMEOUT', '120'))
+
+# Address-space ceiling for each worker in megabytes (0 disables the limit)
+EXTRACTION_MEMORY_LIMIT_MB = int(os.getenv('EXTRACTION_MEMORY_LIMIT_MB', '2048'))
+
+# Characters of PDF page text extracted per document before the remaining pages are skipped
+PDF_CHAR_BUDGET = int(os.getenv('PDF_CHAR_BUDGET', '200000'))
+
+# PDFs with at least this many pages are split into page ranges extracted in parallel
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '40'))
+
+# Smallest page range handed to one worker; the first job reads this many pages
+PDF_PAGES_PER_JOB = int(os.getenv('PDF_PAGES_PER_JOB', '10'))
+
+# Pages extracted per round, relative to the estimate of how many the text budget still needs
+PDF_ROUND_MARGIN = 1.1
+
+# Rows per sheet loaded into DataFrames for exact numeric queries, when a question needs them
+EXCEL_QUERY_MAX_ROWS = int(os.getenv('EXCEL_QUERY_MAX_ROWS', '100000'))
+
+# Extra time the event loop waits past the in-worker deadline before killing the pool
+TIMEOUT_GRACE = 5
+
+class ExtractionTimeout(BaseException):
+    """Raised inside a worker when a job runs past its deadline.
+
+    Derived from BaseException so the parsers' own ``except Exception`` blocks do not swallow it.
+    """
+
+class _MappedFile(io.RawIOBase):
+    """Read-only file object over a memory map (mmap itself lacks part of the file API)."""
+
+    def __init__(self, mapped):
+        super().__init__()
+        self._mapped = mapped
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._mapped.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._mapped.seek(offset, whence)
+        return self._mapped.tell()
+
+    def tell(self):
+        return self._mapped.tell()
+
+@contextmanager
+def open_source(source):
+    """Open a document given as bytes or as a file path and yield a seekable binary stream.
+
+    Files on disk are memory-mapped, so they are paged in on demand instead of being read
+    into memory up front.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+        return
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            yield f
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield io.BufferedReader(_MappedFile(mapped))
+
+def iter_pdf_pages(pdf):
+    """Yield (page_number, text) for each page that has text, one page at a time.
+
+    Each page's parsed layout is released as soon as its text is read, so memory stays
+    flat no matter how many pages the document has.
+    """
+    for i, page in enumerate(pdf.pages):
+        page_text = page.extract_text()
+        page.flush_cache()
+        if page_text:
+            yield i + 1, page_text
+
+def render_pdf(total_pages, pages, char_budget: int = PDF_CHAR_BUDGET) -> str:
+    """Lay out (page_number, text) pairs in page order under ``--- Page N ---`` markers.
+
+    Pages are consumed lazily and reading stops once ``char_budget`` characters of page
+    text have been collected (0 means no limit).
+    """
+    text_content = []
+    text_content.append(f"PDF Document ({total_pages} pages)")
+    text_content.append("=" * 30)
+    text_content.append("")
+    
+    extracted_chars = 0
+    for page_number, page_text in pages:
+        text_content.append(f"--- Page {page_number} ---")
+        text_content.append(page_text)
+        text_content.append("")
+        
+        extracted_chars += len(page_text)
+        if char_budget and extracted_chars >= char_budget and page_number < total_pages:
+            text_content.append(f"--- Pages {page_number + 1}-{total_pages} not extracted (text limit reached) ---")
+            break
+            
+    return "\n".join(text_content)
+
+def extract_pdf(source, char_budget: int = PDF_CHAR_BUDGET) -> str:
+    """Process PDF file and extract text content with better structure.
+
+    ``source`` is the file's bytes or a path. Extraction stops once ``char_budget``
+    characters of page text have been collected (0 means no limit); the remaining pages
+    are never parsed.
+    """
+    import pdfplumber
+    try:
+        with open_source(source) as stream, pdfplumber.open(stream) as pdf:
+            return render_pdf(len(pdf.pages), iter_pdf_pages(pdf), char_budget)
+    except Exception as e:
+        logger.error(f"Error processing PDF: {e}")
+        return None
+
+def extract_pdf_pages(source, first: int, last: int = None, char_budget: int = 0, whole_below: int = 0):
+    """Return ``(total_pages, texts)`` for pages ``first`` to ``last`` (1-based, inclusive), or None.
+
+    ``last=None`` reads to the end, as does any document with fewer than ``whole_below``
+    pages. Pages without text give "". Reading stops after the page on which
+    ``char_budget`` characters have been collected (0 means no limit).
+    """
+    import pdfplumber
+    try:
+        with open_source(source) as stream, pdfplumber.open(stream) as pdf:
+            total_pages = len(pdf.pages)
+            if last is None or total_pages < whole_below:
+                last = total_pages
+            texts = []
+            extracted = 0
+            for page in pdf.pages[first - 1:last]:
+                texts.append(page.extract_text() or "")
+                page.flush_cache()
+                extracted += len(texts[-1])
+                if char_budget and extracted >= char_budget:
+                    break
+            return total_pages, texts
+    except Exception as e:
+        logger.error(f"Error processing PDF pages {first}-{last}: {e}")
+        return None
+
+def pdf_page_ranges(first, last, parts, min_pages=PDF_PAGES_PER_JOB):
+    """Split pages first..last into at most ``parts`` (first, last) ranges of at least ``min_pages``."""
+    size = max(min_pages, math.ceil((last - first + 1) / parts))
+    return [(start, min(start + size - 1, last)) for start in range(first, last + 1, size)]
+
+class SheetSummary:
+    """Head/tail rows and running column statistics for one worksheet.
+
+    Rows are fed in one at a time, so a sheet of any length is summarised in constant
+    memory: only the rows that end up in the rendered sample are kept.
+    """
+
+    HEAD_ROWS = 20
+    TAIL_ROWS = 5
+    # Sheets up to this many rows are shown in full
+    FULL_ROWS = 30
+
+    def __init__(self, name, header):
+        self.name = name
+        self.columns = []
+        self.row_count = 0
+        self._head = []
+        self._tail = deque(maxlen=self.TAIL_ROWS)
+        self._kinds = []
+        self._non_null = []
+        self._dtypes = None
+        for value in header:
+            self._add_column(value)
+
+    def _add_column(self, name):
+        index = len(self.columns)
+        # Match pandas' naming for blank and repeated headers
+        if name is None or (isinstance(name, str) and not name.strip()):
+            name = f"Unnamed: {index}"
+        base, suffix = name, 1
+        while name in self.columns:
+            name = f"{base}.{suffix}"
+            suffix += 1
+        self.columns.append(name)
+        self._kinds.append(set())
+        self._non_null.append(0)
+
+    def add_row(self, values):
+        """Record one data row."""
+        while len(values) > len(self.columns):
+            self._add_column(None)
+        for i, value in enumerate(values):
+            if _is_null(value):
+                continue
+            self._non_null[i] += 1
+            self._kinds[i].add(_value_kind(value))
+        self.row_count += 1
+        if len(self._head) < self.FULL_ROWS:
+            self._head.append(values)
+        self._tail.append(values)
+
+    def set_dtypes(self, dtypes):
+        """Use known column types (e.g. from pandas) instead of the running inference."""
+        self._dtypes = list(dtypes)
+
+    @property
+    def dtypes(self):
+        """Column types, named as pandas would report them."""
+        if self._dtypes is not None:
+            return self._dtypes
+        dtypes = []
+        for kinds, non_null in zip(self._kinds, self._non_null):
+            has_null = non_null < self.row_count
+            if not kinds:
+                dtypes.append('float64' if self.row_count else 'object')
+            elif kinds == {'int'}:
+                dtypes.append('float64' if has_null else 'int64')
+            elif kinds <= {'int', 'float'}:
+                dtypes.append('float64')
+            elif kinds == {'bool'}:
+                dtypes.append('object' if has_null else 'bool')
+            elif kinds == {'datetime'}:
+                dtypes.append('datetime64[ns]')
+            else:
+                dtypes.append('object')
+        return dtypes
+
+    @property
+    def truncated(self):
+        return self.row_count > self.FULL_ROWS
+
+    def sample_rows(self):
+        """Return the rows to render, formatted as strings."""
+        rows = self._head[:self.HEAD_ROWS] + list(self._tail) if self.truncated else self._head
+        dtypes = self.dtypes
+        return [
+            [_format_value(row[i] if i < len(row) else None, dtype) for i, dtype in enumerate(dtypes)]
+            for row in rows
+        ]
+
+def _is_null(value):
+    # NaN and NaT are the only values not equal to themselves
+    return value is None or value != value
+
+def _is_bool(value):
+    # numpy.bool_ is not a bool subclass; matched by name so numpy need not be imported here
+    return isinstance(value, bool) or type(value).__name__ == 'bool_'
+
+def _value_kind(value):
+    if _is_bool(value):
+        return 'bool'
+    if isinstance(value, numbers.Integral):
+        return 'int'
+    if isinstance(value, numbers.Real):
+        return 'int' if float(value).is_integer() else 'float'
+    if isinstance(value, datetime.datetime):
+        return 'datetime'
+    return 'object'
+
+def _format_value(value, dtype):
+    if _is_null(value):
+        return ""
+    if isinstance(value, numbers.Real) and not _is_bool(value):
+        if dtype == 'float64':
+            return str(float(value))
+        if float(value).is_integer():
+            return str(int(value))
+    return str(value)
+
+def _table_cell(value):
+    """Render a value for the tab-separated table, keeping it on one line."""
+    return str(value).replace('\t', ' ').replace('\n', ' ')
+
+def _is_legacy_xls(stream):
+    """Return True for the old binary .xls format, which openpyxl cannot stream."""
+    stream.seek(0)
+    magic = stream.read(8)
+    stream.seek(0)
+    return magic == b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+def _scan_xlsx(stream):
+    """Yield a SheetSummary per worksheet, streaming rows from a read-only workbook."""
+    import openpyxl
+    # Opened through a stream: openpyxl rejects paths without an Excel extension,
+    # and uploads do not keep their names
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            # Some writers store wrong sheet dimensions, which truncates read-only iteration
+            worksheet.reset_dimensions()
+            summary = None
+            for values in worksheet.iter_rows(values_only=True):
+                values = list(values)
+                while values and _is_null(values[-1]):
+                    values.pop()
+                if not values:
+                    # Blank rows are skipped, as pandas does
+                    continue
+                if summary is None:
+                    summary = SheetSummary(worksheet.title, values)
+                else:
+                    summary.add_row(values)
+            yield summary or SheetSummary(worksheet.title, [])
+    finally:
+        workbook.close()
+
+def _summarise_frame(name, df):
+    """Build a SheetSummary from an already parsed DataFrame, reading only the rows it renders."""
+    summary = SheetSummary(name, list(df.columns))
+    head = df.iloc[:SheetSummary.FULL_ROWS]
+    tail = df.iloc[max(SheetSummary.FULL_ROWS, len(df) - SheetSummary.TAIL_ROWS):]
+    for part in (head, tail):
+        for values in part.itertuples(index=False, name=None):
+            summary.add_row(list(values))
+    summary.row_count = len(df)
+    summary.set_dtypes(str(dtype) for dtype in df.dtypes)
+    return summary
+
+def _scan_xls(stream):
+    """Yield a SheetSummary per sheet of a legacy .xls workbook, parsing the file once."""
+    import pandas as pd
+    with pd.ExcelFile(stream) as excel_file:
+        for sheet_name in excel_file.sheet_names:
+            yield _summarise_frame(sheet_name, excel_file.parse(sheet_name))
+
+def extract_excel(source) -> str:
+    """Process Excel file and extract relevant information with proper structure including multiple sheets.
+
+    ``source`` is the file's bytes or a path.
+    """
+    try:
+        with open_source(source) as stream:
+            return _render_excel(_scan_xls(stream) if _is_legacy_xls(stream) else _scan_xlsx(stream))
+    except Exception as e:
+        logger.error(f"Error processing Excel: {e}")
+        return None
+
+def _render_excel(sheets) -> str:
+    """Render sheet summaries as the structured text sent to the model."""
+    excel_data = []
+    sheet_count = 0
+    # Process each sheet
+    for sheet in sheets:
+        sheet_count += 1
+        excel_data.append(f"Sheet: {sheet.name}")
+        excel_data.append("-" * (len(sheet.name) + 7))
+        
+        # Add sheet information
+        excel_data.append(f"  Rows: {sheet.row_count}")
+        excel_data.append(f"  Columns: {len(sheet.columns)}")
+        excel_data.append("")
+        
+        # Add column information
+        excel_data.append("  Columns:")
+        for i, col in enumerate(sheet.columns):
+            excel_data.append(f"    {i+1}. {col}")
+        excel_data.append("")
+        
+        # For small datasets, include all data
+        # For larger datasets, show first 20 rows and last 5 rows to give better context
+        if sheet.row_count > 0:
+            rows = sheet.sample_rows()
+            if not sheet.truncated:
+                # For smaller datasets, show all data
+                excel_data.append("  All Data:")
+            else:
+                # For larger datasets, show first 20 rows and last 5 rows
+                excel_data.append(f"  Data (First 20 rows and last 5 rows of {sheet.row_count} total rows):")
+            excel_data.append("  ```")
+            
+            # Tab-separated rows: the densest layout the model still reads as a table
+            excel_data.append("\t".join(_table_cell(col) for col in sheet.columns))
+            
+            for i, row in enumerate(rows):
+                if sheet.truncated and i == SheetSummary.HEAD_ROWS:
+                    # Separator
+                    excel_data.append("...")
+                    excel_data.append("(middle rows omitted for brevity)")
+                    excel_data.append("...")
+                excel_data.append("\t".join(_table_cell(value) for value in row))
+            
+            excel_data.append("  ```")
+        else:
+            excel_data.append("  No data in this sheet")
+        
+        excel_data.append("")
+        excel_data.append("  Column Data Types:")
+        for col, dtype in zip(sheet.columns, sheet.dtypes):
+            excel_data.append(f"    {col}: {dtype}")
+        
+        excel_data.append("")
+        excel_data.append("=" * 50)
+        excel_data.append("")
+    
+    summary = [f"Excel File Summary:", f"Total Sheets: {sheet_count}", ""]
+    return "\n".join(summary + excel_data)
+
+def _to_query_column(column):
+    """Convert a parsed column to the most compact type usable for numeric queries."""
+    import pandas as pd
+    if column.dtype != object:
+        return column
+    present = column.dropna()
+    if present.empty:
+        return column
+    # Amounts are often stored as text such as "$1,250.00"
+    numeric = pd.to_numeric(
+        present.astype(str).str.replace(r'[,$€£¥\s]', '', regex=True),
+        errors='coerce',
+    )
+    if numeric.notna().mean() >= 0.9:
+        return pd.to_numeric(column.astype(str).str.replace(r'[,$€£¥\s]', '', regex=True), errors='coerce')
+    if present.nunique() <= len(column) // 2:
+        return column.astype('category')
+    return column
+
+def load_excel_frames(source, max_rows: int = EXCEL_QUERY_MAX_ROWS) -> dict:
+    """Load every sheet into a DataFrame for exact queries, keyed by sheet name.
+
+    ``source`` is the file's bytes or a path.
+    """
+    import pandas as pd
+    try:
+        with open_source(source) as stream:
+            frames = pd.read_excel(stream, sheet_name=None, nrows=max_rows or None)
+        return {
+            str(sheet_name): df.apply(_to_query_column)
+            for sheet_name, df in frames.items()
+        }
+    except Exception as e:
+        logger.error(f"Error loading Excel data: {e}")
+        return None
+
+def _init_worker(memory_limit_mb):
+    """Prepare a freshly started worker process."""
+    # Ctrl+C is handled by the bot process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_limit_mb:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            logger.warning(f"Could not set extraction memory limit: {e}")
+
+def _on_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+def _run_job(func, source, timeout, *args):
+    """Run a parser inside a worker, interrupting it once the deadline passes."""
+    use_alarm = timeout and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(source, *args)
+    except ExtractionTimeout:
+        logger.error(f"Extraction timed out after {timeout}s: {func.__name__}")
+        return None
+    except MemoryError:
+        logger.error(f"Extraction ran out of memory: {func.__name__}")
+        return None
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _call_soon(loop, callback):
+    """Schedule ``callback`` on ``loop`` from another thread, unless the loop is gone."""
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        pass
+
+class ExtractionService:
+    """Runs the CPU-bound document parsers in a pool of worker processes.
+
+    If a worker crashes, runs out of memory or hangs, the pool is rebuilt and the bot
+    keeps serving other users. A broken pool fails every job it was running, so each of
+    those jobs is retried once in a worker of its own, where a job that crashes again
+    takes nothing else down. A job that timed out is not retried.
+    """
+
+    def __init__(self, max_workers=EXTRACTION_WORKERS, timeout=EXTRACTION_TIMEOUT,
+                 memory_limit_mb=EXTRACTION_MEMORY_LIMIT_MB):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        # Workers start with a fresh interpreter; forking would copy the bot's event loop,
+        # helper threads and open connections into them
+        self._context = multiprocessing.get_context("spawn")
+        self._pool = None
+        self._retries = asyncio.Semaphore(max(1, max_workers))
+        # Jobs handed to the shared pool, at most one per worker (see _wait)
+        self._slots = None
+        self._slots_loop = None
+
+    def _new_pool(self, workers):
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self.memory_limit_mb,),
+        )
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = self._new_pool(self.max_workers)
+        return self._pool
+
+    def _discard_pool(self, pool, kill=False):
+        """Drop a broken or stuck pool so the next job starts a fresh one.
+
+        Jobs still queued or running in it are not cancelled: the pool fails them with
+        BrokenProcessPool, and ``run`` retries them.
+        """
+        if self._pool is pool:
+            self._pool = None
+        if kill:
+            # ProcessPoolExecutor has no public way to stop a running job
+            for process in list((pool._processes or {}).values()):
+                process.kill()
+        pool.shutdown(wait=False)
+
+    def _get_slots(self):
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(max(1, self.max_workers))
+            self._slots_loop = loop
+        return self._slots
+
+    async def _wait(self, pool, func, source, *args, slots=None):
+        """Submit a job to ``pool`` and wait for its result.
+
+        ``slots`` is a semaphore sized to the pool's workers that the caller has already
+        acquired; it is released once the job is done. Holding it means a worker is free,
+        so the job starts at once and time spent waiting for a worker does not count
+        towards the deadline. ProcessPoolExecutor cannot tell queued jobs from running
+        ones: it reports a few queued jobs as running too.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            future = pool.submit(_run_job, func, source, self.timeout, *args)
+        except BaseException:
+            if slots is not None:
+                slots.release()
+            raise
+        if slots is not None:
+            # Freed when the worker is done, even if the caller stopped waiting earlier
+            future.add_done_callback(lambda _: _call_soon(loop, slots.release))
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout + TIMEOUT_GRACE)
+
+    async def run(self, func, source, *args):
+        """Run ``func(source, *args)`` in a worker and return its result, or None on failure.
+
+        ``source`` is the document's bytes or the path of a file the worker can open.
+        """
+        slots = self._get_slots()
+        await slots.acquire()
+        # Taken after the wait for a slot, in case the pool was replaced meanwhile
+        pool = self._get_pool()
+        try:
+            return await self._wait(pool, func, source, *args, slots=slots)
+        except BrokenProcessPool as e:
+            self._discard_pool(pool)
+            # Usually another job broke the pool
+            logger.warning(f"Extraction pool broke during {func.__name__}, retrying it alone: {e}")
+            return await self._run_alone(func, source, *args)
+        except asyncio.TimeoutError:
+            logger.error(f"Extraction worker unresponsive after {self.timeout}s, restarting pool")
+            self._discard_pool(pool, kill=True)
+        return None
+
+    async def _run_alone(self, func, source, *args):
+        """Run a job in a single-use worker."""
+        async with self._retries:
+            pool = self._new_pool(1)
+            try:
+                return await self._wait(pool, func, source, *args)
+            except BrokenProcessPool as e:
+                logger.error(f"Extraction worker crashed: {e}")
+            except asyncio.TimeoutError:
+                logger.error(f"Extraction worker unresponsive after {self.timeout}s")
+                self._discard_pool(pool, kill=True)
+            finally:
+                pool.shutdown(wait=False)
+            return None
+
+    async def run_pdf(self, source, char_budget: int = PDF_CHAR_BUDGET, page_cache=None):
+        """Extract a PDF like ``extract_pdf``, spreading the pages of large documents over all workers.
+
+        The first job reads the opening pages and reports the page count; documents under
+        PDF_PARALLEL_MIN_PAGES pages are read whole in it. The rest is extracted in rounds
+        of one page range per worker, sized from the text per page seen so far to cover
+        what is left of ``char_budget``, so pages past the budget are rarely parsed. When
+        less than a round is left, one job reads on and stops at the budget. ``page_cache``
+        (with ``get(page_number)`` and ``put(page_number, text)``) lets pages extracted
+        earlier be skipped.
+        """
+        if self.max_workers < 2 and page_cache is None:
+            return await self.run(extract_pdf, source, char_budget)
+
+        head = await self.run(extract_pdf_pages, source, 1, PDF_PAGES_PER_JOB, char_budget, PDF_PARALLEL_MIN_PAGES)
+        if head is None:
+            return None
+        total_pages, texts = head
+        if page_cache is not None:
+            for page_number, text in enumerate(texts, 1):
+                page_cache.put(page_number, text)
+
+        while len(texts) < total_pages:
+            extracted = sum(len(text) for text in texts)
+            if char_budget and extracted >= char_budget:
+                break
+            first, last = len(texts) + 1, total_pages
+            budget = char_budget - extracted if char_budget else 0
+            per_page = extracted / len(texts)
+            if budget and per_page:
+                # Enough pages to fill the rest of the budget at this density, with a margin
+                last = min(total_pages, first + math.ceil(budget / per_page * PDF_ROUND_MARGIN))
+            # Without a budget every page is needed; smaller ranges balance the workers
+            ranges = pdf_page_ranges(first, last, self.max_workers if budget else self.max_workers * 4)
+            if len(ranges) == 1:
+                ranges, round_budget = [(first, total_pages)], budget
+            else:
+                round_budget = 0
+            results = await asyncio.gather(*(
+                self._extract_pages(source, start, end, round_budget, page_cache) for start, end in ranges
+            ))
+            if None in results:
+                logger.error(f"Could not extract all page ranges of a {total_pages}-page PDF")
+                return None
+            for range_texts in results:
+                texts.extend(range_texts)
+
+        pages = ((page_number, text) for page_number, text in enumerate(texts, 1) if text)
+        return render_pdf(total_pages, pages, char_budget)
+
+    async def _extract_pages(self, source, first, last, char_budget, page_cache):
+        """Return the texts of pages ``first`` to ``last`` for ``run_pdf``, from ``page_cache`` when it has them."""
+        if page_cache is not None:
+            texts = []
+            for page_number in range(first, last + 1):
+                text = page_cache.get(page_number)
+                if text is None:
+                    break
+                texts.append(text)
+                if char_budget and sum(len(text) for text in texts) >= char_budget:
+                    return texts
+            else:
+                return texts
+        result = await self.run(extract_pdf_pages, source, first, last, char_budget)
+        if result is None:
+            return None
+        texts = result[1]
+        if page_cache is not None:
+            for offset, text in enumerate(texts):
+                page_cache.put(first + offset, text)
+        return texts
+
+    def shutdown(self):
+        """Stop all worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
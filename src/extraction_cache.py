@@ -0,0 +1,283 @@
+import os
+import time
+import pickle
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Bump when the extracted text format changes so stale entries are ignored
+CACHE_VERSION = 2
+
+# Directory holding cached extractions
+EXTRACTION_CACHE_DIR = os.getenv(
+    'EXTRACTION_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'extractions')
+)
+
+# Total size of cached text kept on disk, in megabytes
+EXTRACTION_CACHE_MAX_MB = int(os.getenv('EXTRACTION_CACHE_MAX_MB', '512'))
+
+# Eviction frees space down to this fraction of the limit, so the directory is not
+# rescanned on every write once the cache is full
+EVICT_TO = 0.9
+
+# Seconds after which a write rescans the directory for files other processes added
+SCAN_INTERVAL = 30
+
+# Also cache the text of each page of large PDFs, so a failed or repeated extraction
+# only parses the pages it has not seen yet
+PDF_PAGE_CACHE = os.getenv('PDF_PAGE_CACHE', 'false').lower() == 'true'
+
+def hash_file(file_path: str) -> str:
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_source(source) -> str:
+    """Return the SHA-256 hex digest of a document given as bytes or as a file path."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    return hash_file(source)
+
+class ExtractionCache:
+    """Persistent cache of extracted document text keyed by content hash.
+
+    Telegram's ``file_unique_id`` is recorded as an alias for the hash, so a repeat upload
+    can be served before the file is downloaded. Excel workbooks are kept next to their
+    text, with the DataFrames parsed from them once a question needs them. Files are evicted least recently used first once the cache grows past
+    ``max_bytes``, and aliases go with the text they point to. Methods may be called from
+    worker threads: the bookkeeping is guarded by a lock, file contents are written
+    under temporary names and renamed into place.
+
+    Several processes (webhook workers) may share the directory. Each one's running total
+    only counts its own writes, so it rescans the directory for the real size and access
+    order before evicting, and on a write at least every SCAN_INTERVAL seconds; between
+    scans the shared total can overshoot by what the other processes wrote. Aliases written by other processes are not removed with the
+    text they point to; they read as misses and are cleaned up on the next start.
+    """
+
+    def __init__(self, directory=EXTRACTION_CACHE_DIR, max_bytes=EXTRACTION_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = os.path.join(directory, f"v{CACHE_VERSION}")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._content_dir = os.path.join(self.directory, 'content')
+        self._ids_dir = os.path.join(self.directory, 'ids')
+        os.makedirs(self._content_dir, exist_ok=True)
+        os.makedirs(self._ids_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._size = 0
+        # Content hash -> file_unique_ids recorded for it
+        self._aliases = {}
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        """Rebuild the LRU order and aliases from the files already on disk."""
+        self._scan()
+        for file_unique_id in os.listdir(self._ids_dir):
+            key = self.key_for(file_unique_id)
+            if key and f"{key}.txt" in self._entries:
+                self._aliases.setdefault(key, set()).add(file_unique_id)
+            else:
+                # Left behind by a crash or by an older version that never removed aliases
+                self._remove(self._id_path(file_unique_id))
+
+    def _scan(self):
+        """Rebuild the LRU order from the content directory (oldest access first)."""
+        entries = []
+        with os.scandir(self._content_dir) as scan:
+            for entry in scan:
+                if not entry.name.endswith(('.txt', '.pkl', '.src')):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._size = sum(self._entries.values())
+        self._scanned_at = time.monotonic()
+
+    def _content_path(self, name):
+        return os.path.join(self._content_dir, name)
+
+    def _id_path(self, file_unique_id):
+        return os.path.join(self._ids_dir, file_unique_id)
+
+    def _read(self, name, mode, count_hit=True, count_miss=True):
+        path = self._content_path(name)
+        try:
+            with open(path, mode, encoding=None if 'b' in mode else 'utf-8') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(name)
+                if count_miss:
+                    self.misses += 1
+            return None
+        with self._lock:
+            self._touch(name)
+            if count_hit:
+                self.hits += 1
+        return data
+
+    def _touch(self, name):
+        # Record the access so eviction order survives restarts
+        try:
+            os.utime(self._content_path(name))
+        except FileNotFoundError:
+            pass
+        if name in self._entries:
+            self._entries.move_to_end(name)
+
+    def get(self, key: str, count_miss: bool = True):
+        """Return cached text for a content hash, or None.
+
+        Pass ``count_miss=False`` when a miss will be looked up again, and counted, by
+        content hash after the download.
+        """
+        return self._read(f"{key}.txt", 'r', count_miss=count_miss)
+
+    def get_frames(self, key: str):
+        """Return cached Excel DataFrames for a content hash, or None."""
+        data = self._read(f"{key}.pkl", 'rb')
+        return pickle.loads(data) if data is not None else None
+
+    def source_path(self, key: str):
+        """Return the path of the original file stored for a content hash, or None."""
+        name = f"{key}.src"
+        path = self._content_path(name)
+        with self._lock:
+            if not os.path.exists(path):
+                self._forget(name)
+                return None
+            self._touch(name)
+        return path
+
+    def pages(self, key: str):
+        """Return a per-page text cache for a PDF's content hash (see ExtractionService.run_pdf)."""
+        return _PageCache(self, key)
+
+    def key_for(self, file_unique_id: str):
+        """Return the content hash recorded for a Telegram file_unique_id, or None."""
+        try:
+            with open(self._id_path(file_unique_id), 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def lookup(self, file_unique_id: str):
+        """Return cached text for a Telegram file_unique_id without downloading the file.
+
+        A miss is not counted: the caller downloads the file and looks it up by content hash.
+        """
+        key = self.key_for(file_unique_id)
+        return self.get(key, count_miss=False) if key else None
+
+    def link(self, file_unique_id: str, key: str):
+        """Record that a Telegram file_unique_id has the given content hash."""
+        self._write(self._id_path(file_unique_id), key)
+        with self._lock:
+            self._aliases.setdefault(key, set()).add(file_unique_id)
+
+    def put(self, key: str, content: str, file_unique_id: str = None):
+        """Store extracted text under its content hash."""
+        self._store(f"{key}.txt", content)
+        if file_unique_id:
+            self.link(file_unique_id, key)
+
+    def put_frames(self, key: str, frames: dict):
+        """Store Excel DataFrames under their content hash."""
+        self._store(f"{key}.pkl", pickle.dumps(frames, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def put_source(self, key: str, source):
+        """Keep the original file (bytes or a path to copy) under its content hash."""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._store(f"{key}.src", source)
+        else:
+            self._store(f"{key}.src", None, copy_from=source)
+
+    def _store(self, name, data, copy_from=None):
+        path = self._content_path(name)
+        self._write(path, data, copy_from)
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                # Evicted by another thread in the meantime
+                return
+            self._forget(name)
+            self._entries[name] = size
+            self._size += size
+            self._evict()
+
+    def _write(self, path, data, copy_from=None):
+        # Write to a temporary name first so readers never see a partial file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if copy_from is not None:
+            shutil.copyfile(copy_from, temp_path)
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+        else:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+        os.replace(temp_path, path)
+
+    def _forget(self, name):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self):
+        if self._size <= self.max_bytes and time.monotonic() - self._scanned_at < SCAN_INTERVAL:
+            return
+        # Other processes sharing the directory may have added, read or removed files
+        self._scan()
+        while self._size > self.max_bytes * EVICT_TO and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self._remove(self._content_path(name))
+            if name.endswith('.txt') and name.count('.') == 1:
+                for file_unique_id in self._aliases.pop(name[:-4], ()):
+                    self._remove(self._id_path(file_unique_id))
+            logger.info(f"Evicted cached extraction {name[:12]} ({size} bytes)")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "aliases": sum(len(ids) for ids in self._aliases.values()),
+                "bytes": self._size,
+            }
+
+class _PageCache:
+    """Text of individual PDF pages, stored alongside full extractions and evicted with them."""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+
+    def get(self, page_number: int):
+        return self.cache._read(f"{self.key}.p{page_number}.txt", 'r', count_hit=False, count_miss=False)
+
+    def put(self, page_number: int, text: str):
+        self.cache._store(f"{self.key}.p{page_number}.txt", text)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Largest request body accepted (Telegram updates are a few KB)
+MAX_BODY_BYTES = 1024 * 1024
+
+# Seconds an idle keep-alive connection is held open
+KEEPALIVE_TIMEOUT = 75
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class HTTPServer:
+    """Minimal asyncio HTTP/1.1 server for the webhook and monitoring endpoints.
+
+    Handlers are registered per (method, path) and called as
+    ``await handler(headers, body)``; they return ``(status, content_type, body_bytes)``.
+    Connections are kept alive so Telegram can reuse them.
+    """
+
+    def __init__(self, host="0.0.0.0", port=8080):
+        self.host = host
+        self.port = port
+        self._routes = {}
+        self._server = None
+
+    def route(self, method: str, path: str, handler):
+        """Register a handler for a method and path."""
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                if not request_line:
+                    break
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self._respond(writer, 400, "text/plain", b"bad request", keep_alive=False)
+                    break
+                method, target, version = parts
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", "0") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, "text/plain", b"too large", keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and version == "HTTP/1.1")
+                status, content_type, payload = await self._dispatch(method, target, headers, body)
+                await self._respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Error serving HTTP connection: {e}")
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, target, headers, body):
+        path = target.split("?", 1)[0]
+        handler = self._routes.get((method.upper(), path))
+        if handler is None:
+            allowed = any(route_path == path for _, route_path in self._routes)
+            return (405, "text/plain", b"method not allowed") if allowed else (404, "text/plain", b"not found")
+        try:
+            return await handler(headers, body)
+        except Exception as e:
+            logger.error(f"Error handling {method} {path}: {e}")
+            return 500, "text/plain", b"internal error"
+
+    @staticmethod
+    async def _respond(writer, status, content_type, payload, keep_alive):
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
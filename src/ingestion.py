@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+import logging
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of batch files downloaded and extracted at once across all users
+INGEST_MAX_PARALLEL = int(os.getenv('INGEST_MAX_PARALLEL', '4'))
+
+# Seconds to wait after a group's files are done for more files of the same album
+MEDIA_GROUP_SETTLE = float(os.getenv('MEDIA_GROUP_SETTLE', '1.0'))
+
+# Minimum seconds between edits of a group's progress message
+PROGRESS_EDIT_INTERVAL = 1.0
+
+class _File:
+    __slots__ = ("file_name", "file_type", "task")
+
+    def __init__(self, file_name, file_type, task):
+        self.file_name = file_name
+        self.file_type = file_type
+        self.task = task
+
+class _Group:
+    __slots__ = ("user_id", "files", "done", "message", "last_edit", "finisher")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.files = []
+        self.done = 0
+        self.message = None
+        self.last_edit = 0.0
+        self.finisher = None
+
+class BatchIngestion:
+    """Downloads and extracts the files of a batch upload concurrently.
+
+    Files sent together as an album (one media group) share a single progress message.
+    Each file starts processing as soon as it arrives, bounded by ``max_parallel``.
+    Once the whole group is done, the results are handed to ``commit`` in upload order
+    in one synchronous step, so concurrent uploads never interleave in the batch.
+
+    Progress and summary messages go out through ``sender`` (an OutboundSender).
+
+    ``process(document, file_type)`` returns ``(content, file_hash)``;
+    ``commit(user_id, files)`` receives ``(file_name, file_type, content, file_hash)``
+    tuples and returns the new batch size, or None if the batch no longer exists.
+    """
+
+    def __init__(self, process, commit, sender, max_parallel=INGEST_MAX_PARALLEL, settle=MEDIA_GROUP_SETTLE):
+        self.process = process
+        self.commit = commit
+        self.sender = sender
+        self.settle = settle
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self._groups = {}
+
+    async def add(self, user_id, message, document, file_name, file_type):
+        """Start processing an uploaded batch file and report progress on its group's message."""
+        key = (user_id, message.media_group_id or f"single:{message.message_id}")
+        group = self._groups.get(key)
+        is_new = group is None
+        if is_new:
+            group = self._groups[key] = _Group(user_id)
+
+        task = asyncio.create_task(self._process_file(group, document, file_type))
+        group.files.append(_File(file_name, file_type, task))
+
+        if is_new:
+            group.finisher = asyncio.create_task(self._finish(key, group))
+            group.message = await self.sender.reply_text(message, self._progress_text(group))
+            group.last_edit = time.monotonic()
+
+    def pending(self, user_id=None) -> int:
+        """Return how many of the user's files (or everyone's) are still being processed."""
+        return sum(
+            len(group.files) - group.done
+            for (owner, _), group in self._groups.items() if user_id is None or owner == user_id
+        )
+
+    async def wait(self, user_id):
+        """Wait until every file the user has uploaded so far has been added to the batch."""
+        finishers = [group.finisher for (owner, _), group in self._groups.items()
+                     if owner == user_id and group.finisher is not None]
+        if finishers:
+            await asyncio.gather(*finishers, return_exceptions=True)
+
+    async def _process_file(self, group, document, file_type):
+        try:
+            async with self._semaphore:
+                return await self.process(document, file_type)
+        except Exception as e:
+            logger.error(f"Error ingesting batch file: {e}")
+            return None, None
+        finally:
+            group.done += 1
+            await self._show_progress(group)
+
+    @staticmethod
+    def _progress_text(group):
+        return f"📥 Processing batch files: {group.done}/{len(group.files)} done..."
+
+    async def _show_progress(self, group):
+        now = time.monotonic()
+        if group.message is None or now - group.last_edit < PROGRESS_EDIT_INTERVAL:
+            return
+        group.last_edit = now
+        try:
+            await self.sender.edit_text(group.message, self._progress_text(group), retry=False)
+        except TelegramError as e:
+            logger.warning(f"Could not update batch progress: {e}")
+
+    async def _finish(self, key, group):
+        try:
+            # Albums arrive as separate updates; wait until no more files join the group
+            while True:
+                count = len(group.files)
+                await asyncio.gather(*(item.task for item in group.files))
+                await asyncio.sleep(self.settle)
+                if len(group.files) == count:
+                    break
+
+            added, failed = [], []
+            for item in group.files:
+                content, file_hash = item.task.result()
+                if content:
+                    added.append((item.file_name, item.file_type, content, file_hash))
+                else:
+                    failed.append(item.file_name)
+
+            total = self.commit(group.user_id, added) if added else None
+            await self._report(group, added, failed, total)
+        except Exception as e:
+            logger.error(f"Error finishing batch upload: {e}")
+        finally:
+            self._groups.pop(key, None)
+
+    async def _report(self, group, added, failed, total):
+        if added and total is None:
+            text = "❌ The batch was cleared while these files were processing. Use /batch to start again."
+        else:
+            lines = []
+            if added:
+                lines.append(f"✅ Added {len(added)} file(s) to batch: " + ", ".join(name for name, *_ in added))
+                lines.append(f"{total} files processed so far. Use /batch_analyze when you're done.")
+            if failed:
+                lines.append(f"❌ Could not process: {', '.join(failed)}")
+            text = "\n".join(lines)
+        if group.message is None:
+            return
+        try:
+            await self.sender.edit_text(group.message, text)
+        except TelegramError as e:
+            logger.warning(f"Could not edit batch progress, sending summary instead: {e}")
+            await self.sender.reply_text(group.message, text)
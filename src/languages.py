@@ -9,7 +9,8 @@ MESSAGES = {
         "general_error": "*❌ Sorry, something went wrong.* Please try again later.",
         "greeting": "*👋 Hi!* I'm your Financial Document Assistant. Upload a PDF or Excel file, then ask me questions about it!",
         "send_document": "Please upload a PDF or Excel file, then ask me questions about it!",
-        "language_changed": "*🇺🇸 Language changed to English!*"
+        "language_changed": "*🇺🇸 Language changed to English!*",
+        "busy": "*⏳ I'm still working on your earlier messages.* Please wait for my reply before sending more."
     },
     "my": {
         "welcome": "*👋 မင်္ဂလာပါ Financial Document Assistant Bot မှ ကြိုဆိုပါတယ်!*\n\nကျွန်တော်သည် PDF နှင့် Excel ဖိုင်များကို စိစစ်ပေးနိုင်သော ငွေကြေးဆိုင်ရာ ကူညီသူ အထူးလုပ်ဖော်ပါ။\n\n*အသုံးပြုနည်း:*\n၁။ PDF သို့မဟုတ် Excel ဖိုင်ကို ပို့ပြီး သင့်ဖိုင်အကြောင်း မေးပါ\n၂။ *သို့မဟုတ်* ဖိုင်များစုစည်း၍ စိစစ်ရန် `/batch` ကို အသုံးပြုပါ\n\n*Commands:*\n`/start` - Bot ကို စတင်အသုံးပြုရန်\n`/help` - အကူအညီကြည့်ရန်\n`/menu` - Command menu ကို ပြသရန်\n`/batch` - ဖိုင်များစုစည်း၍ စိစစ်ရန်\n`/english` - Switch to English\n`/burmese` - မြန်မာဘာသာဖြင့် ဆက်လက်ရန်",
@@ -21,6 +22,7 @@ MESSAGES = {
         "general_error": "*❌ တစ်ခုခုမှားယွင်းနေပါသည်။* နောက်မှ ထပ်စမ်းကြည့်ပါ။",
         "greeting": "*👋 မင်္ဂလာပါ!* ကျွန်တော်က Financial Document Assistant ပါ။ PDF သို့မဟုတ် Excel ဖိုင်ပို့ပြီး သင့်ဖိုင်အကြောင်း မေးပါ!",
         "send_document": "ကျေးဇူးပြု၍ PDF သို့မဟုတ် Excel ဖိုင်ပို့ပြီး သင့်ဖိုင်အကြောင်း မေးပါ!",
-        "language_changed": "*🇲🇲 မြန်မာဘာသာသို့ ပြောင်းလဲပြီးပါပြီ!*"
+        "language_changed": "*🇲🇲 မြန်မာဘာသာသို့ ပြောင်းလဲပြီးပါပြီ!*",
+        "busy": "*⏳ ယခင်ပို့ထားသော မက်ဆေ့ချ်များကို ဆောင်ရွက်နေဆဲဖြစ်ပါသည်။* နောက်ထပ်မပို့မီ အဖြေကို ခဏစောင့်ပေးပါ။"
     }
 }
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from contextlib import aclosing
+from metrics import metrics, record_usage
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Default model used by every call site
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+# Maximum number of Gemini calls in flight at once across all users
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+
+# Per-call deadline in seconds
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+
+def request_fingerprint(mode, model, prompt, config) -> str:
+    """Identify a Gemini request by everything that shapes its answer."""
+    if config is None or isinstance(config, str):
+        config_text = config or ""
+    else:
+        config_text = config.model_dump_json(exclude_none=True)
+    prompt_text = prompt if isinstance(prompt, str) else repr(prompt)
+    parts = [mode, model, config_text, prompt_text]
+    return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+class LLMGateway:
+    """Async access to Gemini with a global concurrency cap and per-call deadlines.
+
+    Identical requests made while one is already running share its result instead of
+    calling Gemini again.
+
+    The client is built by ``connect()``, which returns ``(client, configs)``: ``configs``
+    maps names such as "grounded" and "plain" to generation configs, and "default" is
+    used when a call names none. Calls may pass a config object or one of these names.
+    Importing google.genai takes most of a second, so ``connect`` runs in a thread once
+    ``start()`` is called; calls made before then wait for it.
+    """
+
+    def __init__(self, connect, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT):
+        self.client = None
+        self.configs = {}
+        self.timeout = timeout
+        self.in_flight = 0
+        self._connect = connect
+        self._connecting = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._flights = SingleFlight()
+
+    @property
+    def config(self):
+        return self.configs.get("default")
+
+    def start(self):
+        """Start building the client in the background, once, and return the task."""
+        task = self._connecting
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            # A failed attempt is retried on the next call
+            task = self._connecting = asyncio.ensure_future(self._build())
+        return task
+
+    async def _build(self):
+        start = time.perf_counter()
+        self.client, self.configs = await asyncio.to_thread(self._connect)
+        logger.info(f"Gemini client ready after {time.perf_counter() - start:.2f}s")
+
+    async def ready(self):
+        """Wait until the client is built."""
+        # Shielded so a caller giving up does not cancel the build for everyone else
+        await asyncio.shield(self.start())
+
+    def _resolve(self, config):
+        if config is None:
+            return self.configs["default"]
+        if isinstance(config, str):
+            return self.configs[config]
+        return config
+
+    @property
+    def coalesced(self) -> int:
+        """Requests answered by joining an identical request already in flight."""
+        return self._flights.shared
+
+    async def generate(self, prompt, model=DEFAULT_MODEL, config=None, timeout=None) -> str:
+        """Generate a response without blocking the event loop and return its text.
+
+        Raises asyncio.TimeoutError if the call does not finish within the deadline.
+        Cancelling the calling task cancels the underlying request and frees its slot,
+        unless other callers are waiting for the same request.
+        """
+        key = request_fingerprint("generate", model, prompt, config)
+        return await self._flights.do(key, lambda: self._generate(prompt, model, config, timeout))
+
+    async def _generate(self, prompt, model, config, timeout):
+        await self.ready()
+        config = self._resolve(config)
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                with metrics.timer("llm_call_seconds", model=model, mode="generate"):
+                    response = await asyncio.wait_for(
+                        self.client.aio.models.generate_content(
+                            model=model,
+                            contents=prompt,
+                            config=config,
+                        ),
+                        timeout=timeout or self.timeout,
+                    )
+            finally:
+                self.in_flight -= 1
+        record_usage(model, response.usage_metadata)
+        return response.text
+
+    def stream(self, prompt, model=DEFAULT_MODEL, config=None, timeout=None):
+        """Yield the response text in chunks as the model produces it.
+
+        Raises asyncio.TimeoutError if the next chunk does not arrive within the deadline.
+        The concurrency slot is held until the stream is exhausted or every reader of
+        the same request has closed it.
+        """
+        key = request_fingerprint("stream", model, prompt, config)
+        return self._flights.stream(key, lambda: self._stream(prompt, model, config, timeout))
+
+    async def _stream(self, prompt, model, config, timeout):
+        await self.ready()
+        config = self._resolve(config)
+        async with self._semaphore:
+            self.in_flight += 1
+            start = time.perf_counter()
+            usage = None
+            first_chunk = True
+            try:
+                chunks = self.client.aio.models.generate_content_stream(
+                    model=model,
+                    contents=prompt,
+                    config=config,
+                )
+                async with aclosing(chunks):
+                    iterator = chunks.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), timeout=timeout or self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        if first_chunk:
+                            first_chunk = False
+                            metrics.observe("llm_first_chunk_seconds", time.perf_counter() - start, model=model)
+                        # Chunks carry running token totals; the last one is complete
+                        usage = chunk.usage_metadata or usage
+                        if chunk.text:
+                            yield chunk.text
+            finally:
+                self.in_flight -= 1
+                metrics.observe("llm_call_seconds", time.perf_counter() - start, model=model, mode="stream")
+                record_usage(model, usage)
+
+    async def create_cache(self, model, contents, config):
+        """Register content with Gemini's context cache and return the cache resource."""
+        await self.ready()
+        async with self._semaphore:
+            return await asyncio.wait_for(
+                self.client.aio.caches.create(model=model, contents=contents, config=config),
+                timeout=self.timeout,
+            )
+
+    async def delete_cache(self, name):
+        """Delete a context cache before it expires."""
+        await self.ready()
+        await asyncio.wait_for(self.client.aio.caches.delete(name=name), timeout=self.timeout)
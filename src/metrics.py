@@ -0,0 +1,235 @@
+import os
+import time
+import bisect
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+from http_server import HTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Local port serving Prometheus metrics at /metrics (0 disables the endpoint).
+# Webhook workers use this port plus their worker index.
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Log one line per handled update with the time spent in each stage
+METRICS_TRACE = os.getenv('METRICS_TRACE', 'false').lower() == 'true'
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+class Metrics:
+    """In-process counters, histograms and gauges rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._help = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._callbacks = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add to a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge."""
+        self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a value (usually seconds) in a histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram(self.buckets)
+        histogram.observe(value)
+
+    def register_callback(self, name: str, callback, help_text: str = "", kind: str = "gauge"):
+        """Report the value returned by ``callback()`` at scrape time (queue depths, cache counters)."""
+        self._callbacks[name] = (callback, kind)
+        if help_text:
+            self.describe(name, help_text)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _header(self, lines, name, kind):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        seen = set()
+        for (name, labels), value in sorted(self._counters.items()):
+            if name not in seen:
+                seen.add(name)
+                self._header(lines, name, "counter")
+            lines.append(f"{name}{_label_text(labels)} {value}")
+        for (name, labels), value in sorted(self._gauges.items()):
+            if name not in seen:
+                seen.add(name)
+                self._header(lines, name, "gauge")
+            lines.append(f"{name}{_label_text(labels)} {value}")
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            if name not in seen:
+                seen.add(name)
+                self._header(lines, name, "histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{_label_text(labels)} {histogram.total}")
+            lines.append(f"{name}_count{_label_text(labels)} {histogram.count}")
+        for name, (callback, kind) in sorted(self._callbacks.items()):
+            try:
+                value = callback()
+            except Exception as e:
+                logger.warning(f"Could not collect metric {name}: {e}")
+                continue
+            self._header(lines, name, kind)
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, port=METRICS_PORT, host=METRICS_HOST):
+        """Start the /metrics endpoint and return the server, or None if it is disabled or unavailable."""
+        if not port:
+            return None
+
+        async def handle(headers, body):
+            return 200, "text/plain; version=0.0.4", self.render().encode('utf-8')
+
+        server = HTTPServer(host, port)
+        server.route("GET", "/metrics", handle)
+        try:
+            await server.start()
+        except OSError as e:
+            logger.error(f"Could not start metrics endpoint on {host}:{port}: {e}")
+            return None
+        return server
+
+# Shared registry for the whole process
+metrics = Metrics()
+
+metrics.describe("bot_request_seconds", "Time to handle one update, by handler")
+metrics.describe("bot_requests_total", "Updates handled, by handler and outcome")
+metrics.describe("bot_stage_seconds", "Time spent in each stage of a handler")
+metrics.describe("llm_call_seconds", "Duration of Gemini calls")
+metrics.describe("llm_first_chunk_seconds", "Time until the first streamed chunk arrives")
+metrics.describe("bot_startup_seconds", "Seconds from process start until each startup phase")
+metrics.describe("llm_routes_total", "Routing decisions, by request, route and model")
+metrics.describe("llm_prompt_tokens_total", "Prompt tokens reported by Gemini")
+metrics.describe("llm_response_tokens_total", "Response tokens reported by Gemini")
+
+class Trace:
+    """Stages and token counts of one handled update."""
+
+    __slots__ = ("handler", "user_id", "stages", "prompt_tokens", "response_tokens")
+
+    def __init__(self, handler, user_id):
+        self.handler = handler
+        self.user_id = user_id
+        self.stages = []
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+
+    def summary(self, total):
+        stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.stages)
+        text = f"trace {self.handler} user={self.user_id} total={total:.2f}s [{stages}]"
+        if self.prompt_tokens or self.response_tokens:
+            text += f" tokens={self.prompt_tokens}/{self.response_tokens}"
+        return text
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def traced(handler_name: str):
+    """Decorate a Telegram handler to time it and collect its stages into a trace."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(update, context):
+            user = getattr(update, "effective_user", None)
+            trace = Trace(handler_name, user.id if user else None)
+            token = _current_trace.set(trace)
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await func(update, context)
+                outcome = "ok"
+                return result
+            finally:
+                total = time.perf_counter() - start
+                _current_trace.reset(token)
+                metrics.observe("bot_request_seconds", total, handler=handler_name)
+                metrics.inc("bot_requests_total", handler=handler_name, outcome=outcome)
+                if METRICS_TRACE:
+                    logger.info(trace.summary(total))
+        return wrapper
+    return decorator
+
+@contextmanager
+def stage(name: str):
+    """Time one stage of the current handler (download, extract, llm, reply, ...)."""
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe("bot_stage_seconds", seconds,
+                        handler=trace.handler if trace else "background", stage=name)
+        if trace is not None:
+            trace.stages.append((name, seconds))
+
+def record_usage(model: str, usage):
+    """Count the prompt and response tokens of a Gemini response."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    response_tokens = getattr(usage, "candidates_token_count", None) or 0
+    metrics.inc("llm_prompt_tokens_total", prompt_tokens, model=model)
+    metrics.inc("llm_response_tokens_total", response_tokens, model=model)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.prompt_tokens += prompt_tokens
+        trace.response_tokens += response_tokens
+
+def record_startup(phase: str, started: float):
+    """Record how long after ``started`` (a perf_counter value) the process reached ``phase``."""
+    seconds = time.perf_counter() - started
+    metrics.set("bot_startup_seconds", seconds, phase=phase)
+    logger.info(f"Startup: {phase} after {seconds:.2f}s")
@@ -0,0 +1,229 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram's maximum message length
+MAX_MESSAGE_CHARS = 4096
+
+# Messages per second to one chat, and how many may go out back to back
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+
+# Messages per second across all chats (Telegram allows about 30)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'))
+
+# Times a message is re-queued after a "retry after" response before the error is raised
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+
+# Lower values are sent first: replies, then edits of progress and streamed messages
+PRIORITY_REPLY = 0
+PRIORITY_EDIT = 1
+
+def split_message(text: str, limit: int = MAX_MESSAGE_CHARS) -> list:
+    """Split text into Telegram-sized parts, preferring paragraph, then line, then word boundaries."""
+    parts = []
+    while len(text) > limit:
+        window = text[:limit]
+        for separator in ("\n\n", "\n", " "):
+            cut = window.rfind(separator)
+            # Ignore boundaries so early that the part would be mostly empty
+            if cut > limit // 4:
+                parts.append(window[:cut])
+                text = text[cut + len(separator):]
+                break
+        else:
+            parts.append(window)
+            text = text[limit:]
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+class _Bucket:
+    """Token bucket: ``rate`` sends per second with bursts of up to ``burst``."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now) -> float:
+        """Return the seconds until a send is allowed."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+class _Job:
+    __slots__ = ("send", "future", "retries")
+
+    def __init__(self, send, retries):
+        self.send = send
+        self.future = asyncio.get_running_loop().create_future()
+        self.retries = retries
+
+class _Chat:
+    """Messages waiting for one chat, sent one at a time in (priority, submission) order."""
+
+    __slots__ = ("chat_id", "bucket", "pending", "active")
+
+    def __init__(self, chat_id, bucket):
+        self.chat_id = chat_id
+        self.bucket = bucket
+        # Heap of (priority, sequence, job)
+        self.pending = []
+        # True while the chat is queued for dispatch, waiting for a slot, or sending
+        self.active = False
+
+class OutboundSender:
+    """Sends Telegram messages through one prioritised queue with per-chat and global rate limits.
+
+    Bursts are smoothed by waiting for a free slot instead of failing. Each chat has at
+    most one send in flight, and its messages go out by priority, then in the order they
+    were submitted. A "retry after" response pauses only the affected chat, and the
+    message is retried before anything queued after it.
+    """
+
+    def __init__(self, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST,
+                 global_rate=OUTBOUND_GLOBAL_RATE, max_retries=OUTBOUND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = _Bucket(global_rate, max(1, int(global_rate)))
+        self._chats = {}
+        # Chats ready to send, ordered by their next message
+        self._queue = None
+        self._sequence = itertools.count()
+        self._dispatcher = None
+        self.retried = 0
+
+    async def reply_text(self, message, text: str, priority: int = PRIORITY_REPLY, **kwargs):
+        """Reply to ``message``, splitting long text into several messages. Returns the first one sent."""
+        parts = split_message(text)
+        # Queue every part at once so they keep their order and share the chat's slots
+        futures = [
+            self._submit(message.chat_id, lambda part=part: message.reply_text(part, **kwargs), priority)
+            for part in parts
+        ]
+        sent = await asyncio.gather(*futures)
+        return sent[0]
+
+    async def edit_text(self, message, text: str, priority: int = PRIORITY_EDIT, retry: bool = True, **kwargs):
+        """Edit a sent message. With ``retry=False`` a "retry after" response is raised at once,
+        for intermediate edits that a later edit will supersede anyway."""
+        return await self._submit(message.chat_id, lambda: message.edit_text(text, **kwargs),
+                                  priority, self.max_retries if retry else 0)
+
+    def queued(self) -> int:
+        return sum(len(chat.pending) for chat in self._chats.values())
+
+    def _submit(self, chat_id, send, priority, retries=None):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._queue = asyncio.PriorityQueue()
+            self._chats = {}
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        job = _Job(send, self.max_retries if retries is None else retries)
+        chat = self._chat(chat_id)
+        heapq.heappush(chat.pending, (priority, next(self._sequence), job))
+        if not chat.active:
+            chat.active = True
+            self._schedule(chat)
+        return job.future
+
+    def _chat(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(chat_id, _Bucket(self.chat_rate, self.chat_burst))
+        return chat
+
+    def _schedule(self, chat):
+        """Queue an active chat for dispatch, ordered by its next message."""
+        if not chat.pending:
+            # Emptied by stop() while the chat waited for a slot
+            return
+        priority, sequence, _ = chat.pending[0]
+        self._queue.put_nowait((priority, sequence, chat))
+
+    def _release(self, chat):
+        """Mark a chat idle after a send, queueing it again if it has more messages."""
+        chat.active = bool(chat.pending)
+        if chat.active:
+            self._schedule(chat)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, chat = await self._queue.get()
+            # Callers that gave up leave finished futures behind
+            while chat.pending and chat.pending[0][2].future.done():
+                heapq.heappop(chat.pending)
+            if not chat.pending:
+                chat.active = False
+                continue
+            now = time.monotonic()
+            wait = chat.bucket.delay(now)
+            if wait > 0:
+                # Other chats go ahead; this one is queued again once it has a slot
+                loop.call_later(wait, self._schedule, chat)
+                continue
+            wait = self._global.delay(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._global.take()
+            chat.bucket.take()
+            asyncio.create_task(self._send(chat, heapq.heappop(chat.pending)))
+            self._forget_idle_chats(now)
+
+    async def _send(self, chat, entry):
+        job = entry[2]
+        try:
+            result = await job.send()
+        except RetryAfter as e:
+            chat.bucket.blocked_until = time.monotonic() + e.retry_after
+            if job.retries > 0:
+                job.retries -= 1
+                self.retried += 1
+                logger.warning(f"Telegram asked to retry chat {chat.chat_id} after {e.retry_after}s")
+                # Back at the head of the chat's queue, ahead of everything submitted later
+                heapq.heappush(chat.pending, entry)
+            elif not job.future.done():
+                job.future.set_exception(e)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._release(chat)
+
+    def _forget_idle_chats(self, now):
+        if len(self._chats) > 1000:
+            self._chats = {
+                chat_id: chat for chat_id, chat in self._chats.items()
+                if chat.active or now - chat.bucket.updated < chat.bucket.burst / chat.bucket.rate
+                or chat.bucket.blocked_until > now
+            }
+
+    async def stop(self):
+        """Stop sending; callers still waiting for a queued message get CancelledError."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for chat in self._chats.values():
+            for _, _, job in chat.pending:
+                job.future.cancel()
+            chat.pending.clear()
+            chat.active = False
@@ -0,0 +1,99 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Token budget per prompt section. Instructions are fixed and never trimmed.
+PROMPT_HISTORY_TOKENS = int(os.getenv('PROMPT_HISTORY_TOKENS', '1500'))
+PROMPT_DOCUMENT_TOKENS = int(os.getenv('PROMPT_DOCUMENT_TOKENS', '6000'))
+PROMPT_QUESTION_TOKENS = int(os.getenv('PROMPT_QUESTION_TOKENS', '2000'))
+
+# Approximate tokens per character by script. Gemini's tokenizer packs about four
+# characters of English or numbers into a token, but Burmese needs about one token per
+# character, so a character budget would let Burmese prompts run several times over.
+_ASCII_TOKENS = 0.25
+_MYANMAR_TOKENS = 1.0
+_CJK_TOKENS = 1.0
+_OTHER_TOKENS = 0.5
+
+def _char_tokens(char):
+    code = ord(char)
+    if code < 128:
+        return _ASCII_TOKENS
+    if 0x1000 <= code <= 0x109F or 0xA9E0 <= code <= 0xA9FF or 0xAA60 <= code <= 0xAA7F:
+        return _MYANMAR_TOKENS
+    if 0x3000 <= code <= 0x9FFF or 0xAC00 <= code <= 0xD7AF:
+        return _CJK_TOKENS
+    return _OTHER_TOKENS
+
+def estimate_tokens(text: str) -> int:
+    """Estimate how many tokens Gemini will count for the text, without an API call."""
+    if text.isascii():
+        return int(len(text) * _ASCII_TOKENS) + 1
+    return int(sum(_char_tokens(char) for char in text)) + 1
+
+def _cut_line(line, budget, keep):
+    while line and estimate_tokens(line) > budget:
+        size = len(line) * 3 // 4
+        line = line[-size:] if keep == "end" and size else line[:size]
+    return line
+
+def truncate_to_tokens(text: str, budget: int, keep: str = "start") -> str:
+    """Cut text to roughly ``budget`` tokens on a line boundary, keeping its start or its end."""
+    if estimate_tokens(text) <= budget:
+        return text
+    lines = text.split('\n')
+    if keep == "end":
+        lines.reverse()
+    kept, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            if not kept:
+                # A single oversized line is cut mid-line
+                kept.append(_cut_line(line, budget, keep))
+            break
+        kept.append(line)
+        used += cost
+    if keep == "end":
+        kept.reverse()
+    return '\n'.join(kept)
+
+class PromptBuilder:
+    """Assembles a prompt from sections that each stay within their own token budget."""
+
+    def __init__(self):
+        self._sections = []
+
+    def add(self, name: str, text: str, budget: int = None, keep: str = "start"):
+        """Add a section; text beyond ``budget`` tokens is cut (from the end unless ``keep="end"``)."""
+        if text:
+            if budget is not None:
+                text = truncate_to_tokens(text, budget, keep)
+            self._sections.append((name, text))
+        return self
+
+    def add_history(self, name: str, heading: str, messages: list, budget: int = PROMPT_HISTORY_TOKENS):
+        """Add the most recent ``(role, text)`` messages that fit the budget, oldest first."""
+        if not messages:
+            return self
+        lines, used = [], 0
+        for role, text in reversed(messages):
+            line = f"{role}: {text}"
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        return self.add(name, heading + '\n' + '\n'.join(reversed(lines)))
+
+    def token_counts(self) -> dict:
+        """Return the estimated tokens of each section."""
+        return {name: estimate_tokens(text) for name, text in self._sections}
+
+    def build(self) -> str:
+        prompt = '\n\n'.join(text for _, text in self._sections)
+        # Counting tokens walks the whole prompt, so only do it when the log is shown
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Prompt tokens by section: {self.token_counts()}")
+        return prompt
@@ -0,0 +1,122 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Seconds an answer stays fresh, per route kind (see router.Route). Answers that use current
+# data go stale quickly (0 disables caching them); answers from an uploaded document do not.
+RESPONSE_CACHE_TTLS = {
+    "fresh": int(os.getenv('RESPONSE_CACHE_TTL_FRESH', '120')),
+    "general": int(os.getenv('RESPONSE_CACHE_TTL_CHAT', '600')),
+    "document": int(os.getenv('RESPONSE_CACHE_TTL_DOCUMENT', '3600')),
+}
+
+# Maximum number of answers kept in memory
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '2000'))
+
+# Optional SQLite file that keeps answers across restarts (empty keeps them in memory only)
+RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', '')
+
+def normalize_query(text: str) -> str:
+    """Normalise a query so trivially different phrasings share a cache entry."""
+    text = re.sub(r'\s+', ' ', text.strip().lower())
+    return text.rstrip('?!.。။ ')
+
+class ResponseCache:
+    """LRU cache of model answers with a time-to-live per route kind."""
+
+    def __init__(self, ttls=None, max_entries=RESPONSE_CACHE_MAX_ENTRIES, path=RESPONSE_CACHE_PATH):
+        self.ttls = dict(RESPONSE_CACHE_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._db = None
+        if path:
+            self._open(path)
+
+    def _open(self, path):
+        """Open the on-disk store and load answers that have not expired yet."""
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+        )
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT key, value, expires_at FROM responses ORDER BY expires_at DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for key, value, expires_at in reversed(rows):
+            self._entries[key] = (value, expires_at)
+
+    @staticmethod
+    def make_key(category: str, text: str, language: str, context: str = None) -> str:
+        """Build a cache key from the normalised request and whatever else shapes the answer.
+
+        ``context`` identifies the document or conversation the answer depends on.
+        """
+        parts = [category, language, normalize_query(text), context or ""]
+        return f"{category}:" + hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Return a fresh cached answer, or None."""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, value: str, kind: str):
+        """Store an answer under the TTL of the route ``kind`` it was answered with."""
+        if not value:
+            return
+        ttl = self.ttls.get(kind, 0)
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._delete_stored(old_key)
+        if self._db is not None:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not persist cached response: {e}")
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        self._delete_stored(key)
+
+    def _delete_stored(self, key):
+        if self._db is not None:
+            try:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not delete cached response: {e}")
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and current size."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def close(self):
+        """Close the on-disk store."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,167 @@
+import os
+import re
+import math
+from collections import Counter
+from prompt_builder import estimate_tokens, PROMPT_DOCUMENT_TOKENS
+
+# Target size of each indexed passage in characters
+RETRIEVAL_CHUNK_CHARS = int(os.getenv('RETRIEVAL_CHUNK_CHARS', '2000'))
+
+# Number of passages sent with each question
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '6'))
+
+# Lines that start a new section in the extracted text (PDF pages, Excel sheets, batch files)
+SECTION_START = re.compile(r'^(--- Page \d+ ---|Sheet: |File \d+: )')
+
+# Parts of a section start line that a question can refer to: page number, sheet or file name
+SECTION_NAME = re.compile(r'^(?:--- Page (\d+) ---|Sheet: (.+)|File \d+: (.+?)(?: \(\w+\))?)$')
+
+# "page 77", "pages 3 and 4", "p. 12", and the Burmese for page
+PAGE_REFERENCE = re.compile(r'\b(?:pages?|pg\.?|p\.)\s*(\d+)(?:\s*(?:-|–|to|and|&)\s*(\d+))?|စာမျက်နှာ\s*(\d+)', re.IGNORECASE)
+
+# Latin-script words and numbers
+WORD_PATTERN = re.compile(r'[^\W_]+')
+
+# Burmese has no spaces between words, so it is indexed as overlapping character pairs
+MYANMAR_PATTERN = re.compile('[\u1000-\u109f]+')
+
+# BM25 tuning constants
+K1 = 1.5
+B = 0.75
+
+def tokenize(text: str) -> list:
+    """Split text into lowercase search terms."""
+    text = text.lower()
+    terms = WORD_PATTERN.findall(MYANMAR_PATTERN.sub(' ', text))
+    for run in MYANMAR_PATTERN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+def split_into_chunks(content: str, max_chars: int = RETRIEVAL_CHUNK_CHARS) -> list:
+    """Split extracted document text into passages along page/sheet/file boundaries."""
+    return [chunk for _, chunk in _split_sections(content, max_chars)]
+
+def _split_sections(content, max_chars):
+    """Return (section start line, passage) pairs; the first section has no start line."""
+    sections = []
+    current = []
+    for line in content.split('\n'):
+        if SECTION_START.match(line) and current:
+            sections.append(current)
+            current = []
+        current.append(line)
+    if current:
+        sections.append(current)
+
+    # Long sections are split further on line boundaries
+    chunks = []
+    for section in sections:
+        start = section[0] if SECTION_START.match(section[0]) else None
+        chunk, size = [], 0
+        for line in section:
+            if chunk and size + len(line) > max_chars:
+                chunks.append((start, '\n'.join(chunk)))
+                chunk, size = [], 0
+            chunk.append(line)
+            size += len(line) + 1
+        if chunk:
+            chunks.append((start, '\n'.join(chunk)))
+    return [(start, chunk) for start, chunk in chunks if chunk.strip()]
+
+def referenced_pages(query: str) -> set:
+    """Return the page numbers a question names, such as "page 77" or "pages 3-5"."""
+    pages = set()
+    for match in PAGE_REFERENCE.finditer(query):
+        first = int(match.group(1) or match.group(3))
+        last = int(match.group(2) or first)
+        if first <= last <= first + 20:
+            pages.update(range(first, last + 1))
+        else:
+            pages.update((first, last))
+    return pages
+
+class DocumentIndex:
+    """In-memory BM25 index over the passages of one document."""
+
+    def __init__(self, content: str, chunk_chars: int = RETRIEVAL_CHUNK_CHARS):
+        sections = _split_sections(content, chunk_chars)
+        self.chunks = [chunk for _, chunk in sections]
+        # Page number or lowercased sheet/file name -> passages of that section
+        self._sections = {}
+        for i, (start, _) in enumerate(sections):
+            match = SECTION_NAME.match(start or '')
+            if match:
+                page, name = match.group(1), match.group(2) or match.group(3)
+                self._sections.setdefault(int(page) if page else name.strip().lower(), []).append(i)
+        self._tokens = [estimate_tokens(chunk) for chunk in self.chunks]
+        self._term_counts = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        self._lengths = [sum(counts.values()) for counts in self._term_counts]
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0
+        document_frequency = Counter()
+        for counts in self._term_counts:
+            document_frequency.update(counts.keys())
+        total = len(self.chunks)
+        self._idf = {
+            term: math.log(1 + (total - freq + 0.5) / (freq + 0.5))
+            for term, freq in document_frequency.items()
+        }
+
+    def score(self, query: str) -> list:
+        """Return the BM25 score of every passage for the query."""
+        terms = [term for term in set(tokenize(query)) if term in self._idf]
+        scores = []
+        for counts, length in zip(self._term_counts, self._lengths):
+            score = 0.0
+            norm = K1 * (1 - B + B * length / self._average_length) if self._average_length else K1
+            for term in terms:
+                freq = counts.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (K1 + 1) / (freq + norm)
+            scores.append(score)
+        return scores
+
+    def referenced(self, query: str) -> list:
+        """Return the passages of the pages, sheets and files the query names, in document order."""
+        lowered = query.lower()
+        referenced = set()
+        for page in referenced_pages(query):
+            referenced.update(self._sections.get(page, ()))
+        for name, chunks in self._sections.items():
+            if isinstance(name, str) and re.search(rf'(?<!\w){re.escape(name)}(?!\w)', lowered):
+                referenced.update(chunks)
+        # The first passage is always sent anyway
+        referenced.discard(0)
+        return sorted(referenced)
+
+    def context_for(self, query: str, top_k: int = RETRIEVAL_TOP_K, max_tokens: int = PROMPT_DOCUMENT_TOKENS) -> str:
+        """Return the passages most relevant to the query that fit ``max_tokens``, in document order.
+
+        The first passage (the document summary) is always included. Passages of a page,
+        sheet or file the query names come next, then the best BM25 matches. If nothing
+        matches the query, the start of the document is returned instead.
+        """
+        if not self.chunks:
+            return ""
+        pinned = self.referenced(query)
+        scores = self.score(query)
+        ranked = sorted(
+            (i for i in range(1, len(self.chunks)) if scores[i] > 0 and i not in pinned),
+            key=lambda i: scores[i],
+            reverse=True,
+        )[:max(0, top_k - len(pinned))]
+        ranked = pinned + ranked
+        matched = bool(ranked)
+        if not matched:
+            ranked = range(1, len(self.chunks))
+
+        selected, size = [0], self._tokens[0]
+        for i in ranked:
+            if size + self._tokens[i] > max_tokens:
+                if matched:
+                    continue
+                break
+            selected.append(i)
+            size += self._tokens[i]
+        return '\n\n'.join(self.chunks[i] for i in sorted(selected))
@@ -0,0 +1,98 @@
+import os
+import re
+import logging
+from metrics import metrics
+from llm_gateway import DEFAULT_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Cheaper, faster model for greetings and thanks
+ROUTER_LIGHT_MODEL = os.getenv('ROUTER_LIGHT_MODEL', 'gemini-2.5-flash-lite')
+
+# Set to false to send every request with search grounding on the default model, as before routing
+ROUTER_ENABLED = os.getenv('ROUTER_ENABLED', 'true').lower() == 'true'
+
+# Data that never comes from an uploaded document, in English and Burmese
+EXTERNAL_DATA = (
+    r"\b(news|exchange rates?|forex|(stock|share|market|gold|oil|fuel) prices?|stock market|"
+    r"price of|inflation|bitcoin|crypto|weather)\b"
+    r"|သတင်း|ငွေလဲနှုန်း|ရွှေဈေး|စတော့|ငွေကြေးဖောင်းပွ"
+)
+
+# Words about the present. In a document question they refer to the document ("the current
+# balance", "the latest entry", "revenue in 2024"), so they only trigger search elsewhere.
+CURRENT_DATA = (
+    r"\b(today|tonight|yesterday|tomorrow|right now|current(ly)?|latest|recent(ly)?|live|"
+    r"this (week|month|year)|interest rates?|20[2-9]\d)\b"
+    r"|ယနေ့|ဒီနေ့|လက်ရှိ|နောက်ဆုံးရ|အတိုးနှုန်း"
+)
+
+# Document questions are grounded only when they name external data
+EXTERNAL_DATA_PATTERN = re.compile(EXTERNAL_DATA, re.IGNORECASE)
+
+# Other requests are grounded when they ask for anything that changes over time
+FRESH_PATTERN = re.compile(f"{EXTERNAL_DATA}|{CURRENT_DATA}", re.IGNORECASE)
+
+# Short greetings and thanks that any model can answer
+SMALL_TALK_PATTERN = re.compile(
+    r"^\W*(hi|hello|hey|thanks?( you)?|thank you|ok(ay)?|good (morning|afternoon|evening|night)|bye|"
+    r"မင်္ဂလာပါ|ကျေးဇူး\w*|ဟုတ်ကဲ့|ဟိုင်း)\W*$",
+    re.IGNORECASE,
+)
+
+class Route:
+    """Where a request is sent: ``kind`` is "document", "general" or "fresh"."""
+
+    __slots__ = ("kind", "model", "config", "reason")
+
+    def __init__(self, kind, model, config, reason):
+        self.kind = kind
+        self.model = model
+        self.config = config
+        self.reason = reason
+
+    @property
+    def grounded(self) -> bool:
+        return self.kind == "fresh"
+
+class Router:
+    """Chooses the model and whether to attach search grounding for each request, locally.
+
+    Grounding adds seconds to a call, so it is only attached when a request asks for data
+    that changes over time or is an explicit /search. Document questions are answered from
+    the document alone unless they name data from outside it, such as an exchange rate.
+    Configs may be objects or names the LLMGateway resolves.
+    """
+
+    def __init__(self, grounded_config="grounded", plain_config="plain", model=DEFAULT_MODEL,
+                 light_model=ROUTER_LIGHT_MODEL, enabled=ROUTER_ENABLED):
+        self.grounded_config = grounded_config
+        self.plain_config = plain_config
+        self.model = model
+        self.light_model = light_model
+        self.enabled = enabled
+
+    def route(self, request: str, text: str) -> Route:
+        """Route a "search", "chat" or "document" request with the user's text."""
+        route = self._classify(request, text)
+        metrics.inc("llm_routes_total", request=request, kind=route.kind, model=route.model)
+        logger.info(f"Route {request} -> {route.kind} (model={route.model}, grounded={route.grounded}, "
+                    f"reason={route.reason}): {text[:80]!r}")
+        return route
+
+    def _classify(self, request, text):
+        if not self.enabled:
+            return Route("fresh", self.model, self.grounded_config, "routing disabled")
+        if request == "search":
+            return Route("fresh", self.model, self.grounded_config, "search command")
+        if request == "document":
+            match = EXTERNAL_DATA_PATTERN.search(text)
+            if match:
+                return Route("fresh", self.model, self.grounded_config, f"asks for external data ({match.group(0)!r})")
+            return Route("document", self.model, self.plain_config, "answerable from the document")
+        match = FRESH_PATTERN.search(text)
+        if match:
+            return Route("fresh", self.model, self.grounded_config, f"asks for current data ({match.group(0)!r})")
+        if SMALL_TALK_PATTERN.match(text):
+            return Route("general", self.light_model, self.plain_config, "small talk")
+        return Route("general", self.model, self.plain_config, "general question")
@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of updates handled at the same time across all users
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '16'))
+
+# Updates a single user may have waiting behind the one being handled
+USER_QUEUE_SIZE = int(os.getenv('USER_QUEUE_SIZE', '5'))
+
+# Updates accepted from Telegram but not yet finished before new ones are held back
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '1000'))
+
+# Seconds between "still busy" notices to a user whose messages are being dropped
+BUSY_NOTICE_INTERVAL = float(os.getenv('BUSY_NOTICE_INTERVAL', '30'))
+
+def is_plain_text(update) -> bool:
+    """Return True for a text message that is not a command."""
+    message = getattr(update, "message", None)
+    return bool(message and message.text and not message.text.startswith('/'))
+
+class _Pending:
+    __slots__ = ("update", "turn", "dropped")
+
+    def __init__(self, update):
+        self.update = update
+        self.turn = asyncio.Event()
+        self.dropped = False
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Handles different users' updates in parallel while keeping each user's updates in order.
+
+    Every user has a FIFO queue; only its head runs, so handlers never race on the same
+    user's state. At most ``concurrency`` updates run at once overall. When a user's queue
+    is full, a newer text message supersedes the oldest waiting one; commands and documents
+    are never dropped. ``on_shed(update)`` is awaited for a dropped message so the user can
+    be told, at most once per ``notice_interval`` seconds per user.
+    """
+
+    def __init__(self, concurrency=UPDATE_CONCURRENCY, queue_size=USER_QUEUE_SIZE, max_pending=UPDATE_MAX_PENDING,
+                 on_shed=None, notice_interval=BUSY_NOTICE_INTERVAL):
+        # The base class semaphore only limits admitted updates; waiting in a user's queue
+        # must not take one of the slots that actually run handlers
+        super().__init__(max(max_pending, concurrency))
+        self.queue_size = queue_size
+        self.on_shed = on_shed
+        self.notice_interval = notice_interval
+        self._running = asyncio.Semaphore(concurrency)
+        self._queues = {}
+        self._noticed = {}
+        self.shed = 0
+
+    @staticmethod
+    def _user_key(update):
+        if isinstance(update, Update) and update.effective_user:
+            return update.effective_user.id
+        return None
+
+    def _make_room(self, queue, update) -> bool:
+        """Drop a superseded text message from a full queue; return False if ``update`` should be shed."""
+        if len(queue) <= self.queue_size:
+            return True
+        for entry in list(queue)[1:]:
+            if is_plain_text(entry.update):
+                queue.remove(entry)
+                entry.dropped = True
+                entry.turn.set()
+                self.shed += 1
+                return True
+        if is_plain_text(update):
+            self.shed += 1
+            return False
+        return True
+
+    async def _notify_shed(self, key, update):
+        """Tell the user a message was dropped, unless they were told recently."""
+        if self.on_shed is None:
+            return
+        now = time.monotonic()
+        if now - self._noticed.get(key, float('-inf')) < self.notice_interval:
+            return
+        self._noticed[key] = now
+        # Forget users who have not been told anything for a while
+        if len(self._noticed) > 1000:
+            self._noticed = {user: at for user, at in self._noticed.items() if now - at < self.notice_interval}
+        try:
+            await self.on_shed(update)
+        except Exception as e:
+            logger.warning(f"Could not tell user {key} their message was dropped: {e}")
+
+    async def do_process_update(self, update, coroutine):
+        key = self._user_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        queue = self._queues.setdefault(key, deque())
+        if not self._make_room(queue, update):
+            logger.warning(f"User {key} has {len(queue)} updates queued, dropping a text message")
+            coroutine.close()
+            await self._notify_shed(key, update)
+            return
+
+        entry = _Pending(update)
+        queue.append(entry)
+        started = False
+        try:
+            if queue[0] is not entry:
+                await entry.turn.wait()
+            if entry.dropped:
+                logger.warning(f"User {key} sent newer messages, skipping a queued one")
+                await self._notify_shed(key, update)
+                return
+            async with self._running:
+                started = True
+                await coroutine
+        finally:
+            if not started:
+                coroutine.close()
+            was_head = bool(queue) and queue[0] is entry
+            if entry in queue:
+                queue.remove(entry)
+            if queue:
+                if was_head:
+                    queue[0].turn.set()
+            elif self._queues.get(key) is queue:
+                del self._queues[key]
+
+    def stats(self) -> dict:
+        """Return queue depth and shed counters for monitoring."""
+        return {
+            "users_queued": len(self._queues),
+            "updates_queued": sum(len(queue) for queue in self._queues.values()),
+            "shed": self.shed,
+        }
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
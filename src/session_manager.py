@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Seconds a document / batch context stays usable after it was created
+SESSION_TTLS = {
+    "document": 300,  # 5 minutes
+    "batch": 600,  # 10 minutes for batch processing
+}
+
+# Total memory all users' documents and batches may hold before the least recently used are evicted
+SESSION_MEMORY_BUDGET_MB = int(os.getenv('SESSION_MEMORY_BUDGET_MB', '512'))
+
+# Seconds between sweeps for expired contexts
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '60'))
+
+def estimate_size(value) -> int:
+    """Roughly estimate the bytes held by a JSON-like value (strings dominate)."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    return 8
+
+class SessionManager:
+    """Tracks how much memory each user's document and batch hold and keeps the total bounded.
+
+    Expired contexts are deleted by a background sweeper instead of lingering until the user
+    returns. When the total exceeds the budget, whole users are evicted, least recently used first.
+    """
+
+    def __init__(self, store, memory_budget=SESSION_MEMORY_BUDGET_MB * 1024 * 1024, ttls=None):
+        self.store = store
+        self.memory_budget = memory_budget
+        self.ttls = dict(SESSION_TTLS, **(ttls or {}))
+        self.expired = 0
+        self.evicted = 0
+        # (namespace, user_id) -> {"bytes": ..., "created": ...}
+        self._sessions = {}
+        # user_id -> None, least recently used first
+        self._last_used = OrderedDict()
+        self._release_callbacks = []
+
+    def on_release(self, callback):
+        """Register ``callback(namespace, user_id)``, called whenever a context is released."""
+        self._release_callbacks.append(callback)
+
+    def is_fresh(self, namespace: str, context: dict) -> bool:
+        """Return True if a stored context has not expired yet."""
+        return time.time() - context["timestamp"] < self.ttls[namespace]
+
+    def track(self, namespace: str, user_id: int, size: int, created: float = None):
+        """Record the bytes held by a user's context and enforce the memory budget."""
+        self._sessions[(namespace, user_id)] = {"bytes": size, "created": created or time.time()}
+        self._last_used[user_id] = None
+        self.touch(user_id)
+        self.enforce_budget(keep=user_id)
+
+    def touch(self, user_id: int):
+        """Mark a user as recently active."""
+        if user_id in self._last_used:
+            self._last_used.move_to_end(user_id)
+
+    def release(self, namespace: str, user_id: int):
+        """Delete a user's context from the store along with everything built from it."""
+        self.store.delete(namespace, user_id)
+        self._sessions.pop((namespace, user_id), None)
+        if not any(key[1] == user_id for key in self._sessions):
+            self._last_used.pop(user_id, None)
+        for callback in self._release_callbacks:
+            callback(namespace, user_id)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(info["bytes"] for info in self._sessions.values())
+
+    def sweep(self) -> int:
+        """Release every expired context and return how many were removed."""
+        now = time.time()
+        expired = [
+            key for key, info in self._sessions.items()
+            if now - info["created"] >= self.ttls[key[0]]
+        ]
+        for namespace, user_id in expired:
+            self.release(namespace, user_id)
+        self.expired += len(expired)
+        return len(expired)
+
+    def enforce_budget(self, keep: int = None) -> int:
+        """Evict least recently used users until the total fits the budget; return how many were evicted."""
+        evicted = 0
+        for user_id in list(self._last_used):
+            if self.total_bytes <= self.memory_budget:
+                break
+            if user_id == keep:
+                continue
+            for namespace, owner in [key for key in self._sessions if key[1] == user_id]:
+                self.release(namespace, owner)
+            evicted += 1
+        if evicted:
+            self.evicted += evicted
+            logger.info(f"Evicted {evicted} idle user session(s) to stay within the memory budget")
+        return evicted
+
+    def load_existing(self, owns=None):
+        """Start tracking contexts already in a persistent store (e.g. after a restart).
+
+        With several processes sharing the store, ``owns(user_id)`` selects the users this
+        process serves, so it neither counts nor evicts the others' contexts.
+        """
+        for namespace in self.ttls:
+            for user_id in self.store.user_ids(namespace):
+                if owns is not None and not owns(user_id):
+                    continue
+                context = self.store.get(namespace, user_id)
+                if context:
+                    self._sessions[(namespace, user_id)] = {
+                        "bytes": estimate_size(context),
+                        "created": context["timestamp"],
+                    }
+                    self._last_used[user_id] = None
+
+    def usage(self) -> dict:
+        """Return current memory usage and eviction counters for monitoring."""
+        per_user = {}
+        for (_, user_id), info in self._sessions.items():
+            per_user[user_id] = per_user.get(user_id, 0) + info["bytes"]
+        return {
+            "bytes": sum(per_user.values()),
+            "budget_bytes": self.memory_budget,
+            "users": len(per_user),
+            "largest_user_bytes": max(per_user.values(), default=0),
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+    async def run(self, interval=SESSION_SWEEP_INTERVAL):
+        """Sweep expired contexts and enforce the budget until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = self.sweep()
+                self.enforce_budget()
+                if removed:
+                    logger.info(f"Expired {removed} session context(s); usage: {self.usage()}")
+            except Exception as e:
+                logger.error(f"Error sweeping sessions: {e}")
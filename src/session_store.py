@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# Which backend holds per-user state: "memory" or "sqlite"
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+
+# SQLite database file for the "sqlite" backend
+SESSION_DB_PATH = os.getenv(
+    'SESSION_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'sessions.db')
+)
+
+# Pending writes are flushed once this many have queued up or this many seconds have passed
+SESSION_FLUSH_BATCH = int(os.getenv('SESSION_FLUSH_BATCH', '50'))
+SESSION_FLUSH_INTERVAL = float(os.getenv('SESSION_FLUSH_INTERVAL', '1.0'))
+
+# Values at least this large are stored zlib-compressed
+COMPRESS_MIN_BYTES = 1024
+
+# Marks a pending delete in the write buffer
+_DELETED = object()
+
+class SessionStore(ABC):
+    """Per-user state (language, conversation, document, batch) keyed by namespace and user id."""
+
+    @abstractmethod
+    def get(self, namespace: str, user_id: int, default=None):
+        """Return the stored value, or ``default``."""
+
+    @abstractmethod
+    def set(self, namespace: str, user_id: int, value):
+        """Store a JSON-serialisable value."""
+
+    @abstractmethod
+    def delete(self, namespace: str, user_id: int):
+        """Remove a value if present."""
+
+    @abstractmethod
+    def user_ids(self, namespace: str) -> list:
+        """Return the ids of all users with a value in the namespace."""
+
+    def flush(self):
+        """Write out any buffered changes."""
+
+    def close(self):
+        """Flush and release the store."""
+        self.flush()
+
+class MemorySessionStore(SessionStore):
+    """Keeps everything in process memory; state is lost on restart."""
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, namespace, user_id, default=None):
+        return self._data.get(namespace, {}).get(user_id, default)
+
+    def set(self, namespace, user_id, value):
+        self._data.setdefault(namespace, {})[user_id] = value
+
+    def delete(self, namespace, user_id):
+        self._data.get(namespace, {}).pop(user_id, None)
+
+    def user_ids(self, namespace):
+        return list(self._data.get(namespace, {}))
+
+class SQLiteSessionStore(SessionStore):
+    """Stores state in SQLite so it survives restarts and can be shared by several bot processes.
+
+    The database runs in WAL mode, so readers in other processes never block the writer.
+    Writes are buffered and committed in batches; reads see buffered writes immediately.
+    Large values such as document text are compressed.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH, flush_batch=SESSION_FLUSH_BATCH, flush_interval=SESSION_FLUSH_INTERVAL):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.flush_batch = flush_batch
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._db = sqlite3.connect(path, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id INTEGER NOT NULL,"
+            " namespace TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " compressed INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, namespace))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_namespace ON sessions (namespace, user_id)")
+        self._db.commit()
+
+    @staticmethod
+    def _encode(value):
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        if len(data) >= COMPRESS_MIN_BYTES:
+            return zlib.compress(data), 1
+        return data, 0
+
+    @staticmethod
+    def _decode(data, compressed):
+        if compressed:
+            data = zlib.decompress(data)
+        return json.loads(data)
+
+    def get(self, namespace, user_id, default=None):
+        value = self._pending.get((namespace, user_id))
+        if value is not None:
+            return default if value is _DELETED else self._decode(*value)
+        row = self._db.execute(
+            "SELECT value, compressed FROM sessions WHERE user_id = ? AND namespace = ?",
+            (user_id, namespace),
+        ).fetchone()
+        return self._decode(*row) if row else default
+
+    def set(self, namespace, user_id, value):
+        # Encode now so later changes to the caller's object are not written by accident
+        self._pending[(namespace, user_id)] = self._encode(value)
+        self._maybe_flush()
+
+    def delete(self, namespace, user_id):
+        self._pending[(namespace, user_id)] = _DELETED
+        self._maybe_flush()
+
+    def user_ids(self, namespace):
+        self.flush()
+        rows = self._db.execute("SELECT user_id FROM sessions WHERE namespace = ?", (namespace,))
+        return [row[0] for row in rows]
+
+    def _maybe_flush(self):
+        if (len(self._pending) >= self.flush_batch
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        now = time.time()
+        deletes = [key for key, value in pending.items() if value is _DELETED]
+        writes = [
+            (user_id, namespace, value[0], value[1], now)
+            for (namespace, user_id), value in pending.items() if value is not _DELETED
+        ]
+        try:
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM sessions WHERE namespace = ? AND user_id = ?", deletes
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO sessions (user_id, namespace, value, compressed, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    writes,
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error flushing session store: {e}")
+            # Keep the changes for the next attempt unless newer ones replaced them
+            for key, value in pending.items():
+                self._pending.setdefault(key, value)
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+def create_session_store(backend=SESSION_STORE) -> SessionStore:
+    """Build the session store selected by configuration."""
+    if backend == 'sqlite':
+        return SQLiteSessionStore()
+    if backend != 'memory':
+        logger.warning(f"Unknown session store '{backend}', using memory")
+    return MemorySessionStore()
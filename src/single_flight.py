@@ -0,0 +1,114 @@
+import asyncio
+from contextlib import aclosing
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+class _Broadcast:
+    """Runs one async iterator and replays its items to every subscriber."""
+
+    def __init__(self, chunks):
+        self.items = []
+        self.error = None
+        self.finished = False
+        self.subscribers = 0
+        self._more = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(chunks))
+
+    def _notify(self):
+        self._more.set()
+        self._more = asyncio.Event()
+
+    async def _pump(self, chunks):
+        try:
+            async with aclosing(chunks):
+                async for item in chunks:
+                    self.items.append(item)
+                    self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+
+    async def subscribe(self):
+        index = 0
+        while True:
+            if index < len(self.items):
+                yield self.items[index]
+                index += 1
+            elif self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._more.wait()
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one upstream call.
+
+    Callers with the same key while a call is running share its result, or its
+    exception. A caller that is cancelled just stops waiting; the upstream call is
+    cancelled only once every caller has gone away. Finished calls are forgotten at
+    once, so this never serves stale results (that is the response cache's job).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self.shared = 0
+
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._streams)
+
+    async def do(self, key, func):
+        """Await ``func()``, or the already running call with the same key."""
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(func()))
+            call.task.add_done_callback(lambda _, key=key, call=call: self._forget(self._calls, key, call))
+        else:
+            self.shared += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Forget it now so a new caller starts a fresh call instead of joining a cancelled one
+                self._forget(self._calls, key, call)
+                call.task.cancel()
+
+    async def stream(self, key, func):
+        """Iterate ``func()`` (an async iterator), or join the running one with the same key.
+
+        Joining subscribers first receive the items already produced.
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = self._streams[key] = _Broadcast(func())
+            broadcast.task.add_done_callback(lambda _, key=key, call=broadcast: self._forget(self._streams, key, call))
+        else:
+            self.shared += 1
+        broadcast.subscribers += 1
+        try:
+            async with aclosing(broadcast.subscribe()) as items:
+                async for item in items:
+                    yield item
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.task.done():
+                self._forget(self._streams, key, broadcast)
+                broadcast.task.cancel()
+
+    @staticmethod
+    def _forget(calls, key, call):
+        if calls.get(key) is call:
+            del calls[key]
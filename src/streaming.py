@@ -0,0 +1,79 @@
+import os
+import time
+import logging
+from contextlib import aclosing
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from outbound import split_message, MAX_MESSAGE_CHARS, PRIORITY_REPLY
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between edits of a streamed reply (Telegram throttles frequent edits per chat)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+
+class StreamingReply:
+    """A reply that appears as soon as the first text arrives and is edited as more streams in."""
+
+    def __init__(self, message, sender, interval=STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.sender = sender
+        self.interval = interval
+        self._sent = None
+        self._shown = ""
+        self._last_edit = 0.0
+
+    @property
+    def started(self) -> bool:
+        return self._sent is not None
+
+    async def update(self, text: str):
+        """Show the text generated so far, sending the first part immediately and throttling edits."""
+        text = text[:MAX_MESSAGE_CHARS]
+        if not text.strip() or text == self._shown:
+            return
+        now = time.monotonic()
+        if self._sent is not None and now - self._last_edit < self.interval:
+            return
+        try:
+            if self._sent is None:
+                self._sent = await self.sender.reply_text(self.message, text)
+            else:
+                await self.sender.edit_text(self._sent, text, retry=False)
+        except RetryAfter as e:
+            # Skip intermediate edits until Telegram accepts them again
+            self._last_edit = now + e.retry_after
+            return
+        except TelegramError as e:
+            logger.warning(f"Could not update streamed reply: {e}")
+            return
+        self._shown = text
+        self._last_edit = now
+
+    async def finish(self, text: str):
+        """Show the complete text, editing the streamed message and sending any overflow separately."""
+        if not text:
+            return
+        if self._sent is None:
+            self._sent = await self.sender.reply_text(self.message, text)
+            return
+        first = split_message(text)[0]
+        if first != self._shown:
+            try:
+                # Rate limits are waited out by the sender; the final text must arrive
+                await self.sender.edit_text(self._sent, first, priority=PRIORITY_REPLY)
+            except BadRequest as e:
+                # "Message is not modified" and similar; the streamed text stays visible
+                logger.warning(f"Could not finish streamed reply: {e}")
+        self._shown = first
+        rest = text[len(first):].strip()
+        if rest:
+            await self.sender.reply_text(self.message, rest)
+
+async def collect(chunks, reply: StreamingReply = None) -> str:
+    """Consume a stream of text chunks, showing progress in ``reply``, and return the full text."""
+    text = ""
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            text += chunk
+            if reply is not None:
+                await reply.update(text)
+    return text
@@ -0,0 +1,182 @@
+import os
+import hmac
+import json
+import signal
+import secrets
+import asyncio
+import logging
+import multiprocessing
+from telegram import Bot, Update
+from http_server import HTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Address and port the embedded HTTP server listens on (usually behind a TLS-terminating proxy)
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+
+# Shared secret Telegram sends in X-Telegram-Bot-Api-Secret-Token; requests without it are rejected.
+# When unset a random secret is generated at startup and registered with Telegram.
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Number of bot worker processes updates are spread across
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', str(os.cpu_count() or 1)))
+
+# Maximum simultaneous HTTPS connections Telegram opens to the webhook
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Seconds between checks that every worker is still alive
+WORKER_CHECK_INTERVAL = 5
+
+def update_user_id(data: dict):
+    """Return the id of the user an update comes from, or None for updates without one."""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        sender = value.get("from") or value.get("user") or value.get("chat")
+        if isinstance(sender, dict) and "id" in sender:
+            return sender["id"]
+    return None
+
+def worker_for(key: int, workers: int) -> int:
+    """Return the index of the worker that handles updates for a user (or update) id."""
+    return key % workers
+
+def owned_by_this_worker(user_id: int) -> bool:
+    """Return True if this process handles the user's updates; always True outside webhook workers."""
+    index = os.getenv('BOT_WORKER_INDEX')
+    if index is None:
+        return True
+    return worker_for(user_id, int(os.environ['BOT_WORKER_COUNT'])) == int(index)
+
+def _worker_main(build_application, updates, index, workers):
+    """Entry point of a worker process: feed updates from the queue into a bot application."""
+    # Ctrl+C reaches the whole process group; the front process decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Lets the worker derive per-worker settings such as its metrics port and its users
+    os.environ['BOT_WORKER_INDEX'] = str(index)
+    os.environ['BOT_WORKER_COUNT'] = str(workers)
+    asyncio.run(_serve_updates(build_application(), updates, index))
+
+async def _serve_updates(application, updates, index):
+    loop = asyncio.get_running_loop()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    logger.info(f"Worker {index} (pid {os.getpid()}) ready")
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+class WebhookFront:
+    """Receives Telegram updates over HTTP and hands each one to a worker process.
+
+    Updates are routed by ``user_id % workers`` so all of a user's messages land on the
+    same worker and its in-process state (document index, DataFrames, model sessions)
+    stays local. Each worker runs its own event loop, so throughput scales with cores.
+    """
+
+    def __init__(self, build_application, url, workers=BOT_WORKERS, allowed_updates=None, secret=WEBHOOK_SECRET):
+        self.build_application = build_application
+        self.url = url
+        self.allowed_updates = allowed_updates
+        # Without a secret anyone who finds the URL could post updates as any user
+        self._secret = secret or secrets.token_urlsafe(32)
+        # Workers start with a fresh interpreter; forking would share the parent's
+        # HTTP clients and SQLite connections
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue() for _ in range(max(1, workers))]
+        self._processes = [None] * len(self._queues)
+        self._path = url.split("://", 1)[-1].partition("/")[2]
+        self._path = "/" + self._path if self._path else "/"
+
+    def _start_worker(self, index):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.build_application, self._queues[index], index, len(self._queues)),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def _handle_update(self, headers, body):
+        if not hmac.compare_digest(headers.get("x-telegram-bot-api-secret-token", ""), self._secret):
+            return 403, "text/plain", b"forbidden"
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400, "text/plain", b"invalid json"
+        user_id = update_user_id(data)
+        key = user_id if user_id is not None else data.get("update_id", 0)
+        self._queues[worker_for(key, len(self._queues))].put(data)
+        return 200, "text/plain", b"ok"
+
+    async def _watch_workers(self):
+        """Restart workers that died so their users are not left without service."""
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    self._start_worker(index)
+
+    async def run(self, token):
+        for index in range(len(self._queues)):
+            self._start_worker(index)
+
+        server = HTTPServer(WEBHOOK_LISTEN, WEBHOOK_PORT)
+        server.route("POST", self._path, self._handle_update)
+        await server.start()
+
+        async with Bot(token) as bot:
+            await bot.set_webhook(
+                url=self.url,
+                allowed_updates=self.allowed_updates,
+                secret_token=self._secret,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+        logger.info(f"Webhook set to {self.url} with {len(self._queues)} worker(s)")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        watcher = asyncio.create_task(self._watch_workers())
+        try:
+            await stop.wait()
+        finally:
+            watcher.cancel()
+            await server.stop()
+            await self._stop_workers()
+
+    async def _stop_workers(self, timeout=30):
+        """Let workers finish queued updates, then stop them."""
+        for queue in self._queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+
+def run_webhook(build_application, token, allowed_updates=None, workers=BOT_WORKERS):
+    """Serve the bot through a webhook with ``workers`` processes; blocks until stopped.
+
+    ``build_application`` must be picklable (a module-level function or a partial of one)
+    and return an Application without an Updater.
+    """
+    # Public HTTPS URL Telegram posts updates to (e.g. https://bot.example.com/telegram).
+    # Read here rather than at import so a value from .env is always seen.
+    url = os.getenv('WEBHOOK_URL', '')
+    if not url:
+        raise ValueError("WEBHOOK_URL must be set to run in webhook mode")
+    asyncio.run(WebhookFront(build_application, url, workers, allowed_updates).run(token))
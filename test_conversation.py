@@ -0,0 +1,116 @@
+"""
+Offline tests for rolling conversation summaries
+"""
+
+import asyncio
+import conversation
+from conversation import Conversation, ConversationMemory
+from prompt_builder import estimate_tokens
+from session_store import MemorySessionStore
+
+class FakeLLM:
+    """Records summary prompts; ``fail`` makes calls raise, ``release`` holds them until set."""
+
+    def __init__(self, summary="summary of earlier messages", fail=False):
+        self.summary = summary
+        self.fail = fail
+        self.prompts = []
+        self.release = None
+
+    async def generate(self, prompt, model=None, config=None):
+        self.prompts.append(prompt)
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return self.summary
+
+def make_memory(llm, max_turns=2, batch=2):
+    return ConversationMemory(MemorySessionStore(), llm, max_turns=max_turns, batch=batch)
+
+async def settle(memory):
+    while memory.pending():
+        await asyncio.sleep(0)
+
+def test_recent_turns_are_kept_and_older_ones_wait_for_the_summary():
+    chat = Conversation(max_turns=2)
+    for i in range(3):
+        chat.add("user", f"m{i}")
+    assert list(chat.turns) == [("user", "m1"), ("user", "m2")]
+    assert chat.evicted == [("user", "m0")]
+    assert [text for _, text in chat.history()] == ["m0", "m1", "m2"]
+
+def test_summary_starts_once_a_batch_is_evicted():
+    async def main():
+        llm = FakeLLM()
+        memory = make_memory(llm)
+        for i in range(3):
+            memory.add(1, "user", f"m{i}")
+        # One evicted message is less than a batch
+        assert memory.pending() == 0
+        memory.add(1, "user", "m3")
+        assert memory.pending() == 1
+        await settle(memory)
+        chat = memory.get(1)
+        assert chat.summary == "summary of earlier messages"
+        assert chat.evicted == []
+        assert [text for _, text in chat.history()] == ["m2", "m3"]
+        assert "user: m0\nuser: m1" in llm.prompts[0]
+
+    asyncio.run(main())
+
+def test_messages_added_while_summarising_are_kept():
+    async def main():
+        llm = FakeLLM()
+        llm.release = asyncio.Event()
+        memory = make_memory(llm)
+        for i in range(4):
+            memory.add(1, "user", f"m{i}")
+        await asyncio.sleep(0)
+        memory.add(1, "user", "m4")
+        llm.release.set()
+        await settle(memory)
+        chat = memory.get(1)
+        # m2 was evicted after the summary started, so it still waits for the next one
+        assert chat.evicted == [("user", "m2")]
+        assert [text for _, text in chat.history()] == ["m2", "m3", "m4"]
+
+    asyncio.run(main())
+
+def test_failed_summaries_keep_a_bounded_backlog():
+    async def main():
+        memory = make_memory(FakeLLM(fail=True))
+        for i in range(4):
+            memory.add(1, "user", f"m{i}")
+        await settle(memory)
+        assert memory.get(1).evicted == [("user", "m0"), ("user", "m1")]
+        for i in range(4, 40):
+            memory.add(1, "user", f"m{i}")
+            await settle(memory)
+        assert len(memory.get(1).evicted) == conversation.MAX_UNSUMMARISED
+
+    asyncio.run(main())
+
+def test_long_messages_and_summaries_are_cut_to_their_budgets():
+    long_text = "\n".join(f"line {i} " + "word " * 20 for i in range(200))
+    chat = Conversation([("model", long_text)])
+    (_, text), = chat.history(turn_tokens=50)
+    assert estimate_tokens(text) <= 50
+    assert text.startswith("line 0")
+
+    async def main():
+        memory = make_memory(FakeLLM(summary=long_text))
+        for i in range(4):
+            memory.add(1, "user", f"m{i}")
+        await settle(memory)
+        assert estimate_tokens(memory.get(1).summary) <= conversation.CONVERSATION_SUMMARY_TOKENS
+
+    asyncio.run(main())
+
+def test_old_message_lists_are_loaded():
+    stored = [{"role": role, "parts": [text]} for role, text in
+              [("user", "a"), ("model", "b"), ("user", "c")]]
+    chat = Conversation.from_value(stored, max_turns=2)
+    assert list(chat.turns) == [("model", "b"), ("user", "c")]
+    assert chat.evicted == [("user", "a")]
+    assert Conversation.from_value(chat.to_dict(), max_turns=2).to_dict() == chat.to_dict()
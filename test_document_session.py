@@ -0,0 +1,126 @@
+"""
+Offline tests for document sessions, with a fake gateway in place of Gemini
+"""
+
+import time
+import asyncio
+import types as T
+import document_session
+from document_session import CachedDocumentSession, InlineDocumentSession, open_document_session
+from retrieval import DocumentIndex
+from router import Route
+
+class FakeGateway:
+    """Records calls the way LLMGateway would receive them and answers locally."""
+
+    def __init__(self, cache_error=None):
+        self.config = T.SimpleNamespace(temperature=0.2)
+        self.cache_error = cache_error
+        self.calls = []
+        self.caches = []
+        self.deleted = []
+
+    async def generate(self, prompt, model="default-model", config=None):
+        self.calls.append(("generate", prompt, model, config))
+        return "answer"
+
+    async def stream(self, prompt, model="default-model", config=None):
+        self.calls.append(("stream", prompt, model, config))
+        for chunk in ("an", "swer"):
+            yield chunk
+
+    async def create_cache(self, model, contents, config):
+        if self.cache_error:
+            raise self.cache_error
+        self.caches.append((model, contents, config))
+        return T.SimpleNamespace(name=f"cachedContents/{len(self.caches)}")
+
+    async def delete_cache(self, name):
+        self.deleted.append(name)
+
+DOCUMENT = "\n".join(
+    ["PDF Document (3 pages)", "=" * 30, ""]
+    + [line for page in range(1, 4) for line in (f"--- Page {page} ---", f"Invoice {page} rent " + "x" * 4000, "")]
+)
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def open_session(llm, content=DOCUMENT):
+    return run(open_document_session(llm, "Answer from the document.", content, DocumentIndex(content)))
+
+def test_small_documents_are_sent_inline_with_the_relevant_passages():
+    llm = FakeGateway()
+    session = open_session(llm, "Invoice 7 total 120")
+    assert isinstance(session, InlineDocumentSession)
+    assert run(session.ask("Question: total?", "total")) == "answer"
+    _, prompt, _, _ = llm.calls[0]
+    assert "Answer from the document." in prompt and "Invoice 7 total 120" in prompt
+    assert not llm.caches
+
+def test_cached_session_sends_only_the_question():
+    llm = FakeGateway()
+    session = open_session(llm)
+    assert isinstance(session, CachedDocumentSession)
+    assert DOCUMENT in llm.caches[0][1][0]
+    assert run(session.ask("Question: rent?", "rent")) == "answer"
+    _, prompt, model, config = llm.calls[0]
+    assert prompt == "Question: rent?"
+    assert model == session.model
+    assert config.cached_content == "cachedContents/1"
+
+def test_cached_session_streams_from_the_cache():
+    llm = FakeGateway()
+    session = open_session(llm)
+
+    async def collect():
+        return "".join([chunk async for chunk in session.stream("Question: rent?", "rent")])
+
+    assert run(collect()) == "answer"
+    assert llm.calls[0][0] == "stream" and llm.calls[0][3].cached_content == "cachedContents/1"
+
+def test_grounded_and_other_model_routes_fall_back_inline():
+    llm = FakeGateway()
+    session = open_session(llm)
+    grounded = Route("fresh", session.model, "grounded", "test")
+    light = Route("general", "light-model", "plain", "test")
+    run(session.ask("Question: rent in USD today?", "rent exchange rate", grounded))
+    run(session.ask("Question: rent?", "rent", light))
+    for (_, prompt, model, config), route in zip(llm.calls, (grounded, light)):
+        assert "Invoice" in prompt
+        assert (model, config) == (route.model, route.config)
+
+def test_cache_failure_falls_back_to_inline():
+    session = open_session(FakeGateway(cache_error=RuntimeError("caching unavailable")))
+    assert isinstance(session, InlineDocumentSession)
+
+def test_caching_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(document_session, "DOCUMENT_CACHE_ENABLED", False)
+    llm = FakeGateway()
+    assert isinstance(open_session(llm), InlineDocumentSession)
+    assert not llm.caches
+
+def test_cached_session_expires_before_the_cache_does():
+    llm = FakeGateway()
+    index = DocumentIndex(DOCUMENT)
+    fresh = run(CachedDocumentSession.create(llm, "instructions", DOCUMENT, index, ttl=600))
+    assert not fresh.expired
+    assert fresh.expires_at <= time.time() + 600 - 30
+    # The safety margin is larger than this cache's whole lifetime
+    assert run(CachedDocumentSession.create(llm, "instructions", DOCUMENT, index, ttl=10)).expired
+
+def test_close_releases_the_cache():
+    llm = FakeGateway()
+    session = open_session(llm)
+    run(session.close())
+    assert llm.deleted == ["cachedContents/1"]
+
+def test_close_ignores_delete_failures():
+    llm = FakeGateway()
+    session = open_session(llm)
+
+    async def fail(name):
+        raise RuntimeError("already gone")
+
+    llm.delete_cache = fail
+    run(session.close())
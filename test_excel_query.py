@@ -0,0 +1,61 @@
+"""
+Offline tests for exact answers computed from Excel data
+"""
+
+import pandas as pd
+from excel_query import asks_for_facts, compute_facts
+
+def ledger():
+    return {"Ledger": pd.DataFrame({
+        "Date": pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"]),
+        "Category": pd.Categorical(["Income", "Food", "Income", "Bills", "Food"]),
+        "Amount": [3000.0, -45.5, 2950.0, -120.0, -30.0],
+        "Balance": [13000.0, 12954.5, 15904.5, 15784.5, 15754.5],
+    })}
+
+def fact_lines(question):
+    return (compute_facts(ledger(), question) or "").split("\n")
+
+def test_filter_thresholds():
+    facts = fact_lines("transactions over $2,900")
+    assert "[Ledger] rows where Amount > 2,900: 2, sum 5,950" in facts
+    # "at least" includes the threshold; "k" multiplies by a thousand
+    facts = fact_lines("amounts at least 2.95k")
+    assert "[Ledger] rows where Amount >= 2,950: 2, sum 5,950" in facts
+    facts = fact_lines("payments below 0")
+    assert "[Ledger] rows where Amount < 0: 3, sum -195.50" in facts
+    facts = fact_lines("amounts over 0 and under 2950")
+    assert "[Ledger] rows where Amount > 0 and < 2,950: 0, sum 0" in facts
+
+def test_filter_targets_amounts_not_running_balance():
+    facts = compute_facts(ledger(), "transactions over $2900")
+    assert "Amount >" in facts
+    assert "Balance" not in facts.replace("Balance=", "")
+
+def test_named_column_is_targeted():
+    facts = fact_lines("what is the highest balance?")
+    assert any(line.startswith("[Ledger] highest Balance: 15,904.50") for line in facts)
+    assert not any("highest Amount" in line for line in facts)
+
+def test_aggregations():
+    facts = fact_lines("total and average amount, and the lowest one")
+    assert "[Ledger] 5 rows" == facts[0]
+    assert "[Ledger] total Amount: 5,754.50 over 5 rows" in facts
+    assert "[Ledger] average Amount: 1,150.90" in facts
+    assert any(line.startswith("[Ledger] lowest Amount: -120") for line in facts)
+
+def test_top_rows_and_group_by():
+    facts = fact_lines("top 2 amounts")
+    assert facts[1:4] == ["[Ledger] top 2 rows by Amount:",
+                          "  - Date=2024-01-01 00:00:00; Category=Income; Amount=3000.0; Balance=13000.0",
+                          "  - Date=2024-01-03 00:00:00; Category=Income; Amount=2950.0; Balance=15904.5"]
+    facts = fact_lines("amount by category")
+    assert facts[1:5] == ["[Ledger] Amount total by Category (3 groups):", "  - Income: 5,950",
+                          "  - Food: -75.50", "  - Bills: -120"]
+
+def test_questions_without_numbers_compute_nothing():
+    assert not asks_for_facts("what is this file about?")
+    assert compute_facts(ledger(), "what is this file about?") is None
+    assert compute_facts(None, "total amount") is None
+    assert asks_for_facts("How many rows are there?")
+    assert fact_lines("how many rows are there?") == ["[Ledger] 5 rows"]
@@ -0,0 +1,76 @@
+"""
+Offline tests for the extraction worker pool
+"""
+
+import os
+import time
+import signal
+import asyncio
+import extraction
+from extraction import ExtractionService
+
+# Jobs run in spawned workers, so they must be importable module-level functions
+
+def echo(value):
+    return value
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+def hang(seconds):
+    # Ignores the in-worker deadline, like a parser stuck in native code
+    signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    time.sleep(seconds)
+    return seconds
+
+def allocate(megabytes):
+    return len(bytearray(megabytes * 1024 * 1024))
+
+def crash(_):
+    os._exit(1)
+
+def run_jobs(service, *jobs):
+    async def main():
+        try:
+            return await asyncio.gather(*(service.run(func, arg) for func, arg in jobs))
+        finally:
+            service.shutdown()
+    return asyncio.run(main())
+
+def test_job_result_is_returned():
+    assert run_jobs(ExtractionService(max_workers=1, memory_limit_mb=0), (echo, "text")) == ["text"]
+
+def test_job_past_its_deadline_returns_none_and_pool_survives():
+    service = ExtractionService(max_workers=1, timeout=0.5, memory_limit_mb=0)
+    assert run_jobs(service, (sleep_for, 5), (echo, "next")) == [None, "next"]
+
+def test_unresponsive_worker_is_killed(monkeypatch):
+    monkeypatch.setattr(extraction, "TIMEOUT_GRACE", 0.5)
+    service = ExtractionService(max_workers=1, timeout=0.5, memory_limit_mb=0)
+    start = time.monotonic()
+    assert run_jobs(service, (hang, 30)) == [None]
+    assert time.monotonic() - start < 10
+
+def test_time_waiting_for_a_worker_does_not_count(monkeypatch):
+    monkeypatch.setattr(extraction, "TIMEOUT_GRACE", 0.2)
+    service = ExtractionService(max_workers=1, timeout=1.0, memory_limit_mb=0)
+
+    async def main():
+        try:
+            # Start the worker first so its start-up time is not part of any job
+            await service.run(echo, None)
+            # Together the jobs take far longer than the deadline; each alone fits
+            return await asyncio.gather(*(service.run(sleep_for, 0.7) for _ in range(4)))
+        finally:
+            service.shutdown()
+
+    assert asyncio.run(main()) == [0.7] * 4
+
+def test_job_over_the_memory_limit_returns_none():
+    service = ExtractionService(max_workers=1, memory_limit_mb=512)
+    assert run_jobs(service, (allocate, 2048), (allocate, 10)) == [None, 10 * 1024 * 1024]
+
+def test_crashed_pool_retries_other_jobs_alone():
+    service = ExtractionService(max_workers=2, memory_limit_mb=0)
+    assert run_jobs(service, (sleep_for, 1), (crash, None)) == [1, None]
@@ -0,0 +1,135 @@
+"""
+Offline tests for splitting, ordering and retrying outbound Telegram messages
+"""
+
+import asyncio
+from telegram.error import RetryAfter
+from outbound import OutboundSender, PRIORITY_EDIT, split_message
+
+class FakeMessage:
+    """Records the text sent to one chat; ``fail`` maps a text to how many RetryAfter errors it raises first."""
+
+    def __init__(self, chat_id, log, fail=None, delay=0.0):
+        self.chat_id = chat_id
+        self.log = log
+        self.fail = dict(fail or {})
+        self.delay = delay
+
+    async def reply_text(self, text, **kwargs):
+        await asyncio.sleep(self.delay)
+        if self.fail.get(text):
+            self.fail[text] -= 1
+            raise RetryAfter(0.01)
+        self.log.append((self.chat_id, text))
+        return text
+
+    async def edit_text(self, text, **kwargs):
+        return await self.reply_text(text, **kwargs)
+
+def fast_sender(**kwargs):
+    return OutboundSender(chat_rate=50, chat_burst=5, global_rate=100, **kwargs)
+
+def test_split_message_prefers_boundaries():
+    assert split_message("short") == ["short"]
+    assert split_message("") == [""]
+    assert split_message("aaaa\n\nbbbb", limit=8) == ["aaaa", "bbbb"]
+    assert split_message("aaa bbb ccc", limit=8) == ["aaa bbb", "ccc"]
+    assert split_message("x" * 10, limit=4) == ["xxxx", "xxxx", "xx"]
+
+def test_long_reply_is_sent_in_order():
+    async def main():
+        sender = fast_sender()
+        log = []
+        text = "\n\n".join(f"part{i}" * 300 for i in range(3))
+        first = await sender.reply_text(FakeMessage(1, log), text)
+        assert first == log[0][1]
+        assert "\n\n".join(sent for _, sent in log) == text
+        await sender.stop()
+
+    asyncio.run(main())
+
+def test_retry_after_keeps_chat_order():
+    async def main():
+        sender = fast_sender()
+        log = []
+        message = FakeMessage(1, log, fail={"msg1": 2}, delay=0.001)
+        await asyncio.gather(*(sender.reply_text(message, f"msg{i}") for i in range(4)))
+        assert [text for _, text in log] == ["msg0", "msg1", "msg2", "msg3"]
+        assert sender.retried == 2
+        assert sender.queued() == 0
+        await sender.stop()
+
+    asyncio.run(main())
+
+def test_retry_after_is_raised_once_retries_run_out():
+    async def main():
+        sender = fast_sender(max_retries=1)
+        log = []
+        message = FakeMessage(1, log, fail={"msg0": 5})
+        results = await asyncio.gather(sender.reply_text(message, "msg0"), sender.reply_text(message, "msg1"),
+                                       return_exceptions=True)
+        assert isinstance(results[0], RetryAfter)
+        assert results[1] == "msg1"
+        await sender.stop()
+
+    asyncio.run(main())
+
+def test_unretried_edit_fails_at_once():
+    async def main():
+        sender = fast_sender()
+        message = FakeMessage(1, [], fail={"draft": 1})
+        try:
+            await sender.edit_text(message, "draft", retry=False)
+        except RetryAfter:
+            pass
+        else:
+            raise AssertionError("expected RetryAfter")
+        assert sender.retried == 0
+        await sender.stop()
+
+    asyncio.run(main())
+
+def test_replies_go_before_queued_edits():
+    async def main():
+        sender = fast_sender()
+        log = []
+        message = FakeMessage(1, log, delay=0.01)
+        # All three are queued before the dispatcher runs, so they go out by priority, then in submission order
+        sends = [sender.reply_text(message, "first"), sender.edit_text(message, "edit", priority=PRIORITY_EDIT),
+                 sender.reply_text(message, "reply")]
+        await asyncio.gather(*sends)
+        assert [text for _, text in log] == ["first", "reply", "edit"]
+        await sender.stop()
+
+    asyncio.run(main())
+
+def test_rate_limited_chat_does_not_hold_up_others():
+    async def main():
+        sender = OutboundSender(chat_rate=5, chat_burst=1, global_rate=100)
+        log = []
+        slow, other = FakeMessage(1, log), FakeMessage(2, log)
+        await asyncio.gather(sender.reply_text(slow, "a0"), sender.reply_text(slow, "a1"),
+                             sender.reply_text(other, "b0"))
+        # Chat 1 waits 0.2s for its second slot while chat 2 goes ahead
+        assert log.index((2, "b0")) < log.index((1, "a1"))
+        await sender.stop()
+
+    asyncio.run(main())
+
+def test_stop_fails_queued_messages():
+    async def main():
+        sender = OutboundSender(chat_rate=1, chat_burst=1, global_rate=100)
+        message = FakeMessage(1, [])
+        first = asyncio.ensure_future(sender.reply_text(message, "sent"))
+        waiting = asyncio.ensure_future(sender.reply_text(message, "queued"))
+        assert await first == "sent"
+        await sender.stop()
+        try:
+            await asyncio.wait_for(waiting, 1)
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("expected CancelledError")
+        assert sender.queued() == 0
+
+    asyncio.run(main())
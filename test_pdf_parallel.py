@@ -0,0 +1,77 @@
+"""
+Offline tests for extracting large PDFs in parallel page ranges
+"""
+
+import asyncio
+import pytest
+import extraction
+from extraction import ExtractionService, extract_pdf
+from benchmark_extraction import make_statement_pdf
+
+@pytest.fixture(scope="module")
+def statement(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pdf") / "statement.pdf")
+    make_statement_pdf(path, 100)
+    return path
+
+def run_pdf(path, char_budget, page_cache=None):
+    """Return run_pdf's text and the (first page, pages extracted) of each worker job."""
+    service = ExtractionService(max_workers=2, memory_limit_mb=0)
+    jobs = []
+    run = service.run
+
+    async def recording_run(func, source, *args):
+        result = await run(func, source, *args)
+        jobs.append((args[0], len(result[1])))
+        return result
+
+    service.run = recording_run
+
+    async def main():
+        try:
+            return await service.run_pdf(path, char_budget, page_cache)
+        finally:
+            service.shutdown()
+
+    return asyncio.run(main()), jobs
+
+@pytest.mark.parametrize("char_budget", [0, 30000])
+def test_output_matches_sequential_extraction(statement, char_budget):
+    text, _ = run_pdf(statement, char_budget)
+    assert text == extract_pdf(statement, char_budget)
+
+def test_rounds_are_sized_from_the_budget(statement):
+    text, jobs = run_pdf(statement, 60000)
+    assert text == extract_pdf(statement, 60000)
+    # Each page holds about 1,950 characters, so the budget is used up on page 31.
+    # The head job reads 10 pages, then one round splits the next pages between the
+    # workers, reading a little past the budget but not the rest of the document.
+    assert jobs[0] == (1, extraction.PDF_PAGES_PER_JOB)
+    assert len(jobs) == 3
+    assert 31 <= sum(pages for _, pages in jobs) < 40
+
+def test_small_documents_take_one_job(tmp_path):
+    path = str(tmp_path / "short.pdf")
+    make_statement_pdf(path, 5)
+    text, jobs = run_pdf(path, 0)
+    assert text == extract_pdf(path, 0)
+    assert jobs == [(1, 5)]
+
+class PageCache:
+    def __init__(self):
+        self.pages = {}
+
+    def get(self, page_number):
+        return self.pages.get(page_number)
+
+    def put(self, page_number, text):
+        self.pages[page_number] = text
+
+def test_cached_pages_are_not_extracted_again(statement):
+    cache = PageCache()
+    first, _ = run_pdf(statement, 0, cache)
+    assert sorted(cache.pages) == list(range(1, 101))
+    second, jobs = run_pdf(statement, 0, cache)
+    assert second == first == extract_pdf(statement, 0)
+    # Only the head job, which also reports the page count, reaches a worker
+    assert jobs == [(1, extraction.PDF_PAGES_PER_JOB)]
@@ -0,0 +1,73 @@
+"""
+Offline tests for the model answer cache
+"""
+
+import response_cache
+from response_cache import ResponseCache, normalize_query
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+def fake_clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock.time)
+    return clock
+
+def test_keys_ignore_case_spacing_and_trailing_punctuation():
+    assert normalize_query("  What is   the GDP? ") == "what is the gdp"
+    assert normalize_query("ဘာလဲ။") == "ဘာလဲ"
+    make_key = ResponseCache.make_key
+    assert make_key("chat", "Hello  there!", "en") == make_key("chat", "hello there", "en")
+    assert make_key("chat", "hello", "en").startswith("chat:")
+
+def test_keys_are_scoped_by_language_category_and_document():
+    make_key = ResponseCache.make_key
+    key = make_key("document", "total amount", "en", "hash-a")
+    assert key != make_key("document", "total amount", "my", "hash-a")
+    assert key != make_key("document", "total amount", "en", "hash-b")
+    assert key != make_key("chat", "total amount", "en", "hash-a")
+
+def test_answers_expire_after_their_route_ttl(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    cache = ResponseCache(ttls={"fresh": 60, "general": 600, "document": 3600})
+    cache.put("fresh-key", "rate is 2100", "fresh")
+    cache.put("doc-key", "total is 5", "document")
+    clock.now += 61
+    assert cache.get("fresh-key") is None
+    assert cache.get("doc-key") == "total is 5"
+    clock.now += 3600
+    assert cache.get("doc-key") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 0}
+
+def test_zero_ttl_and_empty_answers_are_not_cached():
+    cache = ResponseCache(ttls={"fresh": 0})
+    cache.put("key", "answer", "fresh")
+    cache.put("other", "", "general")
+    cache.put("unknown", "answer", "no such kind")
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_answers_are_dropped_first():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "1", "general")
+    cache.put("b", "2", "general")
+    assert cache.get("a") == "1"
+    cache.put("c", "3", "general")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+
+def test_answers_survive_a_restart_when_persisted(tmp_path, monkeypatch):
+    clock = fake_clock(monkeypatch)
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(path=path)
+    cache.put("kept", "answer", "document")
+    cache.put("stale", "answer", "fresh")
+    cache.close()
+    clock.now += response_cache.RESPONSE_CACHE_TTLS["fresh"] + 1
+    cache = ResponseCache(path=path)
+    assert cache.get("kept") == "answer"
+    assert cache.get("stale") is None
+    cache.close()
@@ -0,0 +1,72 @@
+"""
+Offline tests for the document passage index
+"""
+
+from retrieval import DocumentIndex, referenced_pages, split_into_chunks, tokenize
+
+def make_pdf_text(pages):
+    """Extracted-PDF-style text: a summary line, then one section per page."""
+    parts = ["PDF Document - 3 pages"]
+    for number, text in enumerate(pages, 1):
+        parts.append(f"--- Page {number} ---\n{text}")
+    return "\n".join(parts)
+
+def test_chunks_follow_section_boundaries():
+    text = make_pdf_text(["rent paid", "salary received", "fuel bought"])
+    assert split_into_chunks(text) == [
+        "PDF Document - 3 pages",
+        "--- Page 1 ---\nrent paid",
+        "--- Page 2 ---\nsalary received",
+        "--- Page 3 ---\nfuel bought",
+    ]
+
+def test_long_sections_split_on_line_boundaries():
+    lines = [f"line {i:02d} " + "x" * 20 for i in range(10)]
+    chunks = split_into_chunks("\n".join(lines), max_chars=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert "\n".join(chunks) == "\n".join(lines)
+    assert len(chunks) > 1
+
+def test_tokenize_splits_words_and_burmese_pairs():
+    assert tokenize("Total Rent, 2024!") == ["total", "rent", "2024"]
+    assert tokenize("ငွေ") == ["ငွ", "ွေ"]
+
+def test_bm25_ranks_the_passage_with_the_rare_term_first():
+    index = DocumentIndex(make_pdf_text([
+        "payment payment payment to landlord",
+        "insurance premium payment",
+        "payment for groceries",
+    ]))
+    scores = index.score("insurance payment")
+    assert max(range(len(scores)), key=scores.__getitem__) == 2
+    # A term in every passage counts for less than one in a single passage
+    assert scores[2] > scores[1] and scores[2] > scores[3]
+    assert index.score("unrelated words") == [0.0] * 4
+
+def test_context_keeps_the_summary_and_the_top_k_matches_in_document_order():
+    index = DocumentIndex(make_pdf_text(["rent rent rent", "salary", "rent", "fuel"]))
+    context = index.context_for("rent", top_k=1)
+    assert context == "PDF Document - 3 pages\n\n--- Page 1 ---\nrent rent rent"
+    context = index.context_for("rent", top_k=2)
+    assert context.split("\n\n") == ["PDF Document - 3 pages", "--- Page 1 ---\nrent rent rent", "--- Page 3 ---\nrent"]
+
+def test_context_without_matches_falls_back_to_the_start():
+    text = make_pdf_text(["alpha", "beta"])
+    index = DocumentIndex(text)
+    assert index.context_for("nothing here") == "\n\n".join(split_into_chunks(text))
+
+def test_context_respects_the_token_budget():
+    index = DocumentIndex(make_pdf_text(["rent " * 200, "rent " * 200, "rent " * 200]))
+    context = index.context_for("rent", top_k=3, max_tokens=300)
+    assert context.count("--- Page") == 1
+
+def test_named_pages_and_sheets_are_pinned():
+    assert referenced_pages("what is on page 3 and pages 5-6?") == {3, 5, 6}
+    index = DocumentIndex(make_pdf_text(["rent", "salary", "fuel"]))
+    # Page 3 does not mention rent but is named, so it comes before the BM25 match
+    context = index.context_for("rent on page 3", top_k=1)
+    assert "--- Page 3 ---" in context and "--- Page 1 ---" not in context
+
+    workbook = "Excel File Summary:\nSheet: Income\nsalary\nSheet: Expenses\nrent"
+    index = DocumentIndex(workbook)
+    assert "Sheet: Expenses" in index.context_for("what is in the expenses sheet?", top_k=1)
@@ -0,0 +1,49 @@
+"""
+Offline tests for request routing (no Telegram or Gemini access needed)
+"""
+
+from router import Router
+
+def route(request, text):
+    return Router("grounded", "plain", model="default", light_model="light", enabled=True).route(request, text)
+
+def test_document_questions_about_the_document_skip_search():
+    for question in [
+        "What was the total revenue in 2024?",
+        "What is the current balance?",
+        "Show the most recent transaction",
+        "closing balance for March 2023",
+        "list interest rate charges",
+        "What's the latest entry?",
+        "လက်ရှိ လက်ကျန်ငွေ ဘယ်လောက်လဲ",
+    ]:
+        result = route("document", question)
+        assert result.kind == "document", question
+        assert result.config == "plain"
+
+def test_document_questions_naming_external_data_are_grounded():
+    for question in [
+        "Convert the total to today's exchange rate",
+        "Compare these holdings with the gold price",
+        "Is there any news about this supplier?",
+        "ဒီစာရင်းကို ငွေလဲနှုန်းနဲ့ တွက်ပေးပါ",
+    ]:
+        result = route("document", question)
+        assert result.grounded, question
+        assert result.config == "grounded"
+
+def test_chat_about_the_present_is_grounded():
+    for message in ["What is the current USD exchange rate?", "What are the latest interest rates?",
+                    "Who won in 2024?", "ယနေ့ ရွှေဈေး ဘယ်လောက်လဲ"]:
+        assert route("chat", message).grounded, message
+
+def test_general_chat_and_small_talk():
+    result = route("chat", "What is double-entry bookkeeping?")
+    assert (result.kind, result.model, result.grounded) == ("general", "default", False)
+    result = route("chat", "thank you!")
+    assert (result.kind, result.model, result.grounded) == ("general", "light", False)
+
+def test_search_command_and_disabled_routing_are_always_grounded():
+    assert route("search", "double-entry bookkeeping").grounded
+    disabled = Router("grounded", "plain", enabled=False)
+    assert disabled.route("document", "What is the current balance?").grounded
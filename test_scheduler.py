@@ -0,0 +1,107 @@
+"""
+Offline tests for per-user update ordering and load shedding
+"""
+
+import asyncio
+from datetime import datetime
+from telegram import Chat, Message, Update, User
+from scheduler import PerUserUpdateProcessor
+
+def make_update(update_id, user_id, text):
+    message = Message(update_id, datetime.now(), Chat(user_id, 'private'),
+                      from_user=User(user_id, 'user', False), text=text)
+    return Update(update_id, message=message)
+
+async def handle(log, name, release=None, delay=0.0):
+    log.append(("start", name))
+    if release is not None:
+        await release.wait()
+    await asyncio.sleep(delay)
+    log.append(("end", name))
+
+def test_updates_of_one_user_run_in_order():
+    async def main():
+        processor = PerUserUpdateProcessor(concurrency=4)
+        log = []
+        await asyncio.gather(*(
+            processor.do_process_update(make_update(i, 1, f"msg{i}"), handle(log, i, delay=0.01 * (3 - i)))
+            for i in range(3)
+        ))
+        # Each update starts only after the previous one finished, even though later ones are faster
+        assert log == [("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+        assert processor.stats()["users_queued"] == 0
+
+    asyncio.run(main())
+
+def test_different_users_run_in_parallel():
+    async def main():
+        processor = PerUserUpdateProcessor(concurrency=4)
+        log = []
+        release = asyncio.Event()
+        first = asyncio.create_task(processor.do_process_update(make_update(1, 1, "a"), handle(log, "a", release)))
+        second = asyncio.create_task(processor.do_process_update(make_update(2, 2, "b"), handle(log, "b", release)))
+        await asyncio.sleep(0.01)
+        assert log == [("start", "a"), ("start", "b")]
+        release.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(main())
+
+def test_concurrency_limit_applies_across_users():
+    async def main():
+        processor = PerUserUpdateProcessor(concurrency=1)
+        log = []
+        release = asyncio.Event()
+        tasks = [
+            asyncio.create_task(processor.do_process_update(make_update(i, i, str(i)), handle(log, i, release)))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0.01)
+        assert log == [("start", 0)]
+        release.set()
+        await asyncio.gather(*tasks)
+        assert [event for event, _ in log] == ["start", "end", "start", "end"]
+
+    asyncio.run(main())
+
+def test_full_queue_sheds_superseded_text_and_notifies_once():
+    async def main():
+        noticed = []
+
+        async def on_shed(update):
+            noticed.append(update.message.text)
+
+        processor = PerUserUpdateProcessor(concurrency=4, queue_size=1, on_shed=on_shed, notice_interval=60)
+        log = []
+        release = asyncio.Event()
+        tasks = [
+            asyncio.create_task(processor.do_process_update(make_update(i, 1, f"msg{i}"), handle(log, i, release)))
+            for i in range(4)
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*tasks)
+        # msg0 was running; msg1 and msg2 were superseded in turn by newer text
+        assert [name for event, name in log if event == "end"] == [0, 3]
+        assert processor.shed == 2
+        # Both drops fell inside one notice interval
+        assert len(noticed) == 1
+
+    asyncio.run(main())
+
+def test_commands_are_never_shed():
+    async def main():
+        processor = PerUserUpdateProcessor(concurrency=4, queue_size=1)
+        log = []
+        release = asyncio.Event()
+        tasks = [
+            asyncio.create_task(processor.do_process_update(make_update(i, 1, f"/cmd{i}"), handle(log, i, release)))
+            for i in range(4)
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*tasks)
+        assert [name for event, name in log if event == "end"] == [0, 1, 2, 3]
+        assert processor.shed == 0
+
+    asyncio.run(main())
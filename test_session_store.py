@@ -0,0 +1,74 @@
+"""
+Offline tests for the persistent session store
+"""
+
+import sqlite3
+from session_store import COMPRESS_MIN_BYTES, MemorySessionStore, SQLiteSessionStore
+
+def stored_rows(path):
+    with sqlite3.connect(path) as db:
+        return {(namespace, user_id): compressed for namespace, user_id, compressed
+                in db.execute("SELECT namespace, user_id, compressed FROM sessions")}
+
+def test_memory_store_round_trip():
+    store = MemorySessionStore()
+    store.set("language", 1, "my")
+    assert store.get("language", 1) == "my"
+    assert store.get("language", 2, "en") == "en"
+    assert store.user_ids("language") == [1]
+    store.delete("language", 1)
+    assert store.get("language", 1) is None
+
+def test_only_large_values_are_compressed(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path, flush_batch=1)
+    small = "x" * (COMPRESS_MIN_BYTES // 2)
+    large = {"content": "statement line\n" * COMPRESS_MIN_BYTES}
+    store.set("language", 1, small)
+    store.set("document", 1, large)
+    assert stored_rows(path) == {("language", 1): 0, ("document", 1): 1}
+    store.close()
+    store = SQLiteSessionStore(path)
+    assert store.get("language", 1) == small
+    assert store.get("document", 1) == large
+    store.close()
+
+def test_writes_are_buffered_until_the_batch_fills(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path, flush_batch=3, flush_interval=3600)
+    store.set("language", 1, "en")
+    store.set("language", 2, "my")
+    # Buffered writes are visible to this process but not yet on disk
+    assert store.get("language", 2) == "my"
+    assert stored_rows(path) == {}
+    store.set("language", 3, "en")
+    assert len(stored_rows(path)) == 3
+    store.close()
+
+def test_buffered_values_are_copies(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), flush_batch=100, flush_interval=3600)
+    value = {"turns": ["hello"]}
+    store.set("conversation", 1, value)
+    value["turns"].append("changed later")
+    assert store.get("conversation", 1) == {"turns": ["hello"]}
+    store.close()
+
+def test_deletes_flush_and_override_earlier_writes(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path, flush_batch=100, flush_interval=3600)
+    store.set("document", 1, {"content": "a"})
+    store.flush()
+    store.delete("document", 1)
+    assert store.get("document", 1) is None
+    assert ("document", 1) in stored_rows(path)
+    # user_ids flushes first so it never lists deleted users
+    assert store.user_ids("document") == []
+    assert stored_rows(path) == {}
+    store.close()
+
+def test_interval_flushes_on_the_next_write(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path, flush_batch=100, flush_interval=0)
+    store.set("language", 1, "en")
+    assert stored_rows(path) == {("language", 1): 0}
+    store.close()
@@ -0,0 +1,134 @@
+"""
+Offline tests for coalescing identical in-flight calls
+"""
+
+import asyncio
+import pytest
+from single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("key", fetch) for _ in range(3)))
+        assert results == ["result"] * 3
+        assert len(calls) == 1 and flights.shared == 2
+        # Finished calls are forgotten, so the next caller starts a new one
+        assert flights.in_flight() == 0
+        await flights.do("key", fetch)
+        assert len(calls) == 2
+
+    asyncio.run(main())
+
+def test_different_keys_are_not_coalesced():
+    async def main():
+        flights = SingleFlight()
+
+        async def echo(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        assert await asyncio.gather(flights.do("a", lambda: echo("a")), flights.do("b", lambda: echo("b"))) == ["a", "b"]
+        assert flights.shared == 0
+
+    asyncio.run(main())
+
+def test_errors_reach_every_caller():
+    async def main():
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(flights.do("key", fail), flights.do("key", fail), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(main())
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def main():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "result"
+
+        first = asyncio.create_task(flights.do("key", fetch))
+        second = asyncio.create_task(flights.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == "result"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+
+def test_upstream_call_is_cancelled_when_every_caller_leaves():
+    async def main():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(flights.do("key", fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert flights.in_flight() == 0
+
+    asyncio.run(main())
+
+def test_stream_subscribers_receive_every_chunk():
+    async def main():
+        flights = SingleFlight()
+        started = []
+
+        async def chunks():
+            started.append(1)
+            for chunk in ("a", "b", "c"):
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def read(delay):
+            await asyncio.sleep(delay)
+            return [chunk async for chunk in flights.stream("key", chunks)]
+
+        # The late subscriber joins after "a" was produced and still gets it replayed
+        assert await asyncio.gather(read(0), read(0.015)) == [["a", "b", "c"]] * 2
+        assert len(started) == 1 and flights.shared == 1
+
+    asyncio.run(main())
+
+def test_stream_errors_reach_every_subscriber():
+    async def main():
+        flights = SingleFlight()
+
+        async def chunks():
+            yield "a"
+            await asyncio.sleep(0.01)
+            raise ValueError("stream broke")
+
+        async def read():
+            return [chunk async for chunk in flights.stream("key", chunks)]
+
+        results = await asyncio.gather(read(), read(), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Offline tests for webhook secret checks and update routing
+"""
+
+import json
+import asyncio
+from queue import Empty
+from webhook import WebhookFront, owned_by_this_worker, update_user_id, worker_for
+
+SECRET = "test-secret"
+
+def make_front(workers=3):
+    return WebhookFront(None, "https://bot.example.com/telegram", workers=workers, secret=SECRET)
+
+def post(front, data, secret=SECRET):
+    headers = {"x-telegram-bot-api-secret-token": secret} if secret is not None else {}
+    body = data if isinstance(data, bytes) else json.dumps(data).encode()
+    return asyncio.run(front._handle_update(headers, body))
+
+def queued(front):
+    """Return the updates waiting in each worker's queue."""
+    result = []
+    for queue in front._queues:
+        items = []
+        while True:
+            try:
+                items.append(queue.get(timeout=0.2))
+            except Empty:
+                break
+        result.append(items)
+    return result
+
+def message_update(update_id, user_id):
+    return {"update_id": update_id, "message": {"message_id": 1, "from": {"id": user_id}, "text": "hi"}}
+
+def test_requests_without_the_secret_are_rejected():
+    front = make_front()
+    assert post(front, message_update(1, 5), secret=None)[0] == 403
+    assert post(front, message_update(1, 5), secret="wrong")[0] == 403
+    assert queued(front) == [[], [], []]
+
+def test_a_secret_is_generated_when_none_is_configured():
+    front = WebhookFront(None, "https://bot.example.com/telegram", workers=1)
+    assert len(front._secret) >= 32
+    assert post(front, message_update(1, 5), secret="")[0] == 403
+
+def test_updates_are_routed_by_user_id():
+    front = make_front()
+    for update_id, user_id in enumerate((4, 5, 7, 10), 1):
+        assert post(front, message_update(update_id, user_id))[0] == 200
+    routed = queued(front)
+    assert [[update["message"]["from"]["id"] for update in items] for items in routed] == [[], [4, 7, 10], [5]]
+
+def test_updates_without_a_user_are_routed_by_update_id():
+    front = make_front()
+    assert post(front, {"update_id": 8, "poll": {"id": "p"}})[0] == 200
+    assert [len(items) for items in queued(front)] == [0, 0, 1]
+
+def test_invalid_json_is_rejected():
+    front = make_front()
+    assert post(front, b"{not json")[0] == 400
+
+def test_webhook_path_comes_from_the_url():
+    assert make_front()._path == "/telegram"
+    assert WebhookFront(None, "https://bot.example.com", workers=1, secret=SECRET)._path == "/"
+
+def test_update_user_id_reads_the_sender_of_any_update_type():
+    assert update_user_id(message_update(1, 42)) == 42
+    assert update_user_id({"update_id": 1, "callback_query": {"id": "c", "from": {"id": 9}}}) == 9
+    assert update_user_id({"update_id": 1, "my_chat_member": {"chat": {"id": -100}}}) == -100
+    assert update_user_id({"update_id": 1}) is None
+
+def test_workers_own_the_users_routed_to_them(monkeypatch):
+    monkeypatch.delenv("BOT_WORKER_INDEX", raising=False)
+    assert owned_by_this_worker(7)
+    monkeypatch.setenv("BOT_WORKER_INDEX", "1")
+    monkeypatch.setenv("BOT_WORKER_COUNT", "3")
+    assert [user_id for user_id in range(9) if owned_by_this_worker(user_id)] == [1, 4, 7]
+    assert all(worker_for(user_id, 3) == 1 for user_id in (1, 4, 7))